@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from write_behind import DeliveryRecord
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class AsyncDeliveryDB:
+    """Асинхронный доступ к DeliveryDB для async-обработчиков FastAPI.
+
+    Запросы выполняются в отдельном ограниченном пуле потоков, поэтому
+    медленный запрос не останавливает цикл событий, а число одновременных
+    обращений к SQLite не растёт вместе с нагрузкой.
+    """
+
+    def __init__(self, db, max_workers: int = 4):
+        self.db = db
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="delivery-db")
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def save_delivery(self, **kwargs) -> int:
+        return await self.run(self.db.save_delivery, **kwargs)
+
+    async def save_deliveries(self, records: List[DeliveryRecord]) -> int:
+        return await self.run(self.db.save_deliveries, records)
+
+    async def get_all_deliveries(self) -> List[Dict]:
+        return await self.run(self.db.get_all_deliveries)
+
+    async def get_deliveries_page(self, filters, limit: int = 100,
+                                  cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        return await self.run(self.db.get_deliveries_page, filters, limit, cursor)
+
+    async def iter_deliveries(self, filters, encode: Callable[[List[tuple]], T],
+                              chunk_size: int = 1000) -> AsyncIterator[T]:
+        """Выгрузка пачками: чтение и кодирование каждой пачки идут в пуле БД."""
+        chunks = self.db.iter_deliveries(filters, chunk_size)
+
+        def next_chunk() -> Optional[T]:
+            rows = next(chunks, None)
+            return None if rows is None else encode(rows)
+
+        try:
+            while True:
+                data = await self.run(next_chunk)
+                if data is None:
+                    return
+                yield data
+        finally:
+            # Закрывает выделенное соединение выгрузки, в том числе при обрыве клиента.
+            chunks.close()
+
+    async def get_changes(self, since: int, limit: int = 1000):
+        return await self.run(self.db.get_changes, since, limit)
+
+    async def get_deliveries_count(self) -> int:
+        return await self.run(self.db.get_deliveries_count)
+
+    async def get_statistics(self) -> Optional[Dict]:
+        return await self.run(self.db.get_statistics)
+
+    async def clear_deliveries(self) -> bool:
+        return await self.run(self.db.clear_deliveries)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,121 @@
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+import tariff_engine
+from pricing import BOX_DIMENSIONS, CITY_INDEX, calculate_volume_weight, quote_rng
+
+_BOX_NAMES = list(BOX_DIMENSIONS)
+_BOX_VOL_WEIGHT = np.array([calculate_volume_weight(*BOX_DIMENSIONS[b]["dims"]) for b in _BOX_NAMES])
+_BOX_MAX_WEIGHT = np.array([BOX_DIMENSIONS[b]["max_weight"] for b in _BOX_NAMES], dtype=float)
+_BOX_INDEX = {b: i for i, b in enumerate(_BOX_NAMES)}
+
+_ZONE_DIFFS = np.array(CITY_INDEX.zone_diffs, dtype=np.int64).reshape(CITY_INDEX.size, CITY_INDEX.size)
+
+
+def _lookup(values: Sequence[str], resolve) -> np.ndarray:
+    """Сопоставить строки с ID через уникальные значения; -1 — не найдено."""
+    unique, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+    mapped = np.array([resolve(u) for u in unique], dtype=object)
+    return np.where(np.equal(mapped, None), -1, mapped).astype(np.int64)[inverse]
+
+
+def _jitter(table: tariff_engine.TariffTable, city_from: np.ndarray, city_to: np.ndarray, weight: np.ndarray,
+            box: np.ndarray, valid: np.ndarray) -> Optional[np.ndarray]:
+    """Множители разброса [строка, тариф] как у /api/calculate: тот же ключ quote_rng.
+
+    Генератор создаётся один раз на уникальный маршрут, корзину веса и
+    коробку. None — PRICE_JITTER=random, разброс случайный.
+    """
+    if quote_rng() is None:
+        return None
+    bucket = np.ceil(weight * 2) / 2  # pricing.weight_bucket
+    keys = np.stack([city_from, city_to, bucket, box], axis=1)[valid]
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    factors = np.empty((len(unique), len(table.records)))
+    for i, (from_id, to_id, weight_key, box_id) in enumerate(unique.tolist()):
+        rng = quote_rng("calculate", int(from_id), int(to_id), weight_key, _BOX_NAMES[int(box_id)])
+        factors[i] = [rng.uniform(table.jitter_low, table.jitter_high) for _ in table.records]
+    jitter = np.ones((len(weight), len(table.records)))
+    jitter[valid] = factors[inverse.reshape(-1)]
+    return jitter
+
+
+def _days(zone_diff: np.ndarray, formula: tariff_engine.DaysFormula) -> np.ndarray:
+    return np.maximum(formula.floor, zone_diff // formula.div + formula.add)
+
+
+def quote_batch(from_cities: Sequence[str], to_cities: Sequence[str], weights: Sequence[float],
+                box_sizes: Sequence[str], rng: Optional[np.random.Generator] = None) -> Dict:
+    """Цены всех тарифов get_offers для массива отправлений сразу.
+
+    Возвращает колонки: zone_diff, cargo_type и для каждого тарифа массивы
+    price/days_min/days_max. Строки с ошибками перечислены в errors,
+    их цены и сроки равны 0. Цены совпадают с /api/calculate за тот же день;
+    rng задаёт случайный разброс вместо этого (бенчмарки).
+    """
+    n = len(weights)
+    if not (len(from_cities) == len(to_cities) == len(box_sizes) == n):
+        raise ValueError("Колонки отправлений разной длины")
+    table = tariff_engine.current()
+
+    weight = np.asarray(weights, dtype=float)
+    city_from = _lookup(from_cities, CITY_INDEX.resolve)
+    city_to = _lookup(to_cities, CITY_INDEX.resolve)
+    box = _lookup(box_sizes, _BOX_INDEX.get)
+
+    box_safe = np.where(box >= 0, box, 0)
+    errors = np.full(n, None, dtype=object)
+    errors[(weight > _BOX_MAX_WEIGHT[box_safe])] = "Вес превышает лимит коробки"
+    errors[~np.isfinite(weight) | (weight <= 0) | (weight > 500)] = "Вес должен быть больше 0 и не больше 500 кг"
+    errors[box < 0] = "Неизвестный размер коробки"
+    errors[city_from == city_to] = "Города совпадают"
+    errors[(city_from < 0) | (city_to < 0)] = "Город не найден в списке"
+    valid = np.equal(errors, None)
+
+    zone_diff = np.where(valid, _ZONE_DIFFS[city_from, city_to], 0)
+    # NaN и inf в строках с ошибками дали бы NaN в ценах и предупреждения при приведении к int.
+    weight = np.where(valid, weight, 0.0)
+    charge_weight = np.maximum(weight, _BOX_VOL_WEIGHT[box_safe])
+    extra = np.array([table.box_extra.get(b, 0) for b in _BOX_NAMES], dtype=float)[box_safe]
+
+    jitter = None if rng is not None else _jitter(table, city_from, city_to, weight, box, valid)
+    rng = rng or np.random.default_rng()
+
+    tariffs = []
+    for i, t in enumerate(table.records):
+        price = t.base + (charge_weight - 1) * (t.per_kg + zone_diff * t.per_kg_zone) + extra
+        factor = jitter[:, i] if jitter is not None else rng.uniform(table.jitter_low, table.jitter_high, n)
+        price = np.trunc(price * factor)
+        price = np.maximum(table.min_price, np.round(price / table.round_to) * table.round_to).astype(np.int64)
+        tariffs.append({
+            "company": t.company,
+            "tariff_name": t.tariff_name,
+            "price": np.where(valid, price, 0),
+            "days_min": np.where(valid, _days(zone_diff, t.days_min), 0),
+            "days_max": np.where(valid, _days(zone_diff, t.days_max), 0),
+        })
+
+    cargo_type = np.where(weight <= 0.5, "Документы", np.where(weight <= 30, "Посылка", "Груз"))
+    return {
+        "count": n,
+        "valid": valid,
+        "errors": [{"index": int(i), "detail": errors[i]} for i in np.flatnonzero(~valid)],
+        "zone_diff": zone_diff,
+        "cargo_type": cargo_type,
+        "tariffs": tariffs,
+    }
+
+
+def to_columns(result: Dict) -> Dict:
+    """Результат quote_batch в виде JSON-совместимых списков."""
+    return {
+        "count": result["count"],
+        "errors": result["errors"],
+        "zone_diff": result["zone_diff"].tolist(),
+        "cargo_type": result["cargo_type"].tolist(),
+        "tariffs": [
+            {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in t.items()}
+            for t in result["tariffs"]
+        ],
+    }
@@ -0,0 +1,49 @@
+"""Пакетный расчёт: quote_batch на массивах против цикла по get_offers.
+
+Оба варианта считают разброс как /api/calculate (quote_rng по маршруту,
+корзине веса и коробке), цены совпадают.
+
+Запуск: python -m benchmarks.batch_quote [отправлений]
+"""
+import random
+import sys
+import time
+
+from batch_quote import quote_batch
+from pricing import BOX_DIMENSIONS, CITIES, CITY_INDEX, get_offers, get_zone_diff, quote_rng, weight_bucket
+
+
+def shipments(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    cities = list(CITIES)
+    rows = []
+    while len(rows) < n:
+        c1, c2 = rnd.sample(cities, 2)
+        box = rnd.choice(list(BOX_DIMENSIONS))
+        weight = round(rnd.uniform(0.1, BOX_DIMENSIONS[box]["max_weight"]), 1)
+        rows.append((c1, c2, weight, box))
+    return rows
+
+
+def main(n: int = 20000):
+    rows = shipments(n)
+    columns = [list(col) for col in zip(*rows)]
+
+    t0 = time.perf_counter()
+    for c1, c2, weight, box in rows:
+        rng = quote_rng("calculate", CITY_INDEX.resolve(c1), CITY_INDEX.resolve(c2), weight_bucket(weight), box)
+        get_offers(weight, box, get_zone_diff(c1, c2), rng)
+    loop_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    quote_batch(*columns)
+    batch_s = time.perf_counter() - t0
+
+    print(f"\n{n} отправлений x 5 тарифов")
+    print(f"  цикл get_offers   {loop_s:8.3f}с  {n / loop_s:>12.0f} отпр./с")
+    print(f"  quote_batch       {batch_s:8.3f}с  {n / batch_s:>12.0f} отпр./с  (x{loop_s / batch_s:.0f})")
+    return {"loop_s": loop_s, "batch_s": batch_s}
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,100 @@
+"""Пакетный расчёт файла (bulk_quote.py) против построчного best_quote.
+
+Генерируется CSV на N строк (по умолчанию 100 000, ~1% строк с ошибками).
+
+  построчно        — файл читается целиком, best_quote для каждой строки,
+                     результат собирается в памяти;
+  поток, N проц.   — bulk_quote.run с пулом из N процессов, результат в файл;
+  поток + БД       — то же с сохранением лучших предложений (транзакция на пачку).
+
+Для каждого варианта — строк в секунду и, отдельным прогоном (tracemalloc
+замедляет только основной процесс), пик памяти Python в основном процессе:
+у потокового расчёта он не зависит от размера файла.
+
+Запуск: python -m benchmarks.bulk_quote [строк]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import temp_db_path
+import bulk_quote
+from pricing import BOX_DIMENSIONS, CITY_INDEX
+from text_quote import QuoteError, best_quote, make_request
+
+
+def write_shipments(path: str, rows: int):
+    rnd = random.Random(24)
+    cities = [CITY_INDEX.title(i) for i in range(len(CITY_INDEX))]
+    boxes = list(BOX_DIMENSIONS)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("order_id,from_city,to_city,weight,box_size\n")
+        for i in range(rows):
+            box = rnd.choice(boxes)
+            weight = rnd.randint(1, int(BOX_DIMENSIONS[box]["max_weight"] * 10)) / 10
+            to_city = rnd.choice(cities) if rnd.random() > 0.01 else "Нигде"
+            f.write(f"{i},{rnd.choice(cities)},{to_city},{weight},{box}\n")
+
+
+def line_by_line(path: str, out_path: str):
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()[1:]
+    results = []
+    for line in lines:
+        _, from_city, to_city, weight, box = line.split(",")
+        try:
+            q = best_quote(make_request(from_city, to_city, weight, box))
+            results.append(f"{line},ok,{q.offer.company},{q.offer.price}")
+        except QuoteError as e:
+            results.append(f"{line},error,,{e}")
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(results))
+    return len(lines)
+
+
+def streamed(path: str, out_path: str, workers: int, save: bool = False):
+    persist = None
+    if save:
+        os.environ["DELIVERIES_DB"] = temp_db_path("bulk.db")
+        from main import db
+        persist = db.save_deliveries
+    with open(path, "rb") as source, open(out_path, "w", encoding="utf-8", newline="") as out, \
+            bulk_quote.make_executor(workers) as executor:
+        stats = bulk_quote.run(source, out, bulk_quote.BulkPipeline("csv", progress_interval=60), executor,
+                               persist, max_pending=2 * workers)
+    return stats.rows
+
+
+def main(rows: int = 100_000):
+    path = temp_db_path("shipments.csv")
+    out_path = temp_db_path("quotes.csv")
+    write_shipments(path, rows)
+    print(f"Файл: {rows} строк, {os.path.getsize(path) // 1024} КБ")
+
+    workers = os.cpu_count() or 1
+    variants = [("построчно", lambda: line_by_line(path, out_path)),
+                ("поток, 1 проц.", lambda: streamed(path, out_path, 1))]
+    if workers > 1:
+        variants.append((f"поток, {workers} проц.", lambda: streamed(path, out_path, workers)))
+    variants.append(("поток + БД", lambda: streamed(path, out_path, workers, save=True)))
+
+    print(f"\n{'вариант':<28}{'строк/с':>12}{'пик памяти, МБ':>18}")
+    results = {}
+    for name, run in variants:
+        started = time.perf_counter()
+        done = run()
+        rows_per_sec = round(done / (time.perf_counter() - started))
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        results[name] = {"rows_per_sec": rows_per_sec, "peak_mb": round(peak, 1)}
+        print(f"{name:<28}{rows_per_sec:>12}{results[name]['peak_mb']:>18}")
+        sys.stdout.flush()
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
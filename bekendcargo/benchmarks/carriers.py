@@ -0,0 +1,97 @@
+"""Опрос перевозчиков (carriers.py) против локальных заглушек (carrier_stub.py).
+
+Заглушки поднимаются в этом же процессе на свободных портах, в отдельных
+потоках со своими циклами событий. Сценарии:
+
+  последовательно     — шесть запросов по очереди: время равно сумме задержек;
+  параллельно         — CarrierGateway.quote: время самого медленного;
+  один завис          — Boxberry отвечает за 2 с, бюджет 0,3 с: ответ за бюджет,
+                        для Boxberry — оценка;
+  хвост без/с хеджем  — 3% ответов задерживаются на 0,4 с; повтор через
+                        hedge_ms возвращает такие запросы за ~0,15 с (растёт
+                        ops/sec; p99 остаётся, когда медленными оказались оба).
+
+Запуск: python -m benchmarks.carriers [итераций]
+"""
+import asyncio
+import sys
+import threading
+from typing import Dict, List
+
+import uvicorn
+
+from benchmarks.common import print_table
+from benchmarks.scaling import _free_port
+from benchmarks.suite import _measure_async
+from carrier_stub import StubProfile, make_app
+from carriers import CarrierAdapter, CarrierConfig, CarrierGateway
+from pricing import TARIFF_COMPANIES, generate_tariffs_for_city
+
+
+def start_stub(profiles: Dict[str, StubProfile]) -> str:
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(make_app(profiles), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        threading.Event().wait(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def gateway(base_url: str, budget: float = 0.8, hedge_after: float = 0.0) -> CarrierGateway:
+    return CarrierGateway([
+        CarrierAdapter(CarrierConfig(company, f"{base_url}/{company}/quote", timeout=budget, hedge_after=hedge_after))
+        for company in TARIFF_COMPANIES
+    ], budget=budget)
+
+
+async def _bench(iterations: int, urls: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+    estimates = generate_tariffs_for_city("Казань", 3.0)
+    results = {}
+    restored: Dict[str, List[int]] = {}
+
+    sequential = gateway(urls["ровно"])
+
+    async def one_by_one():
+        for row in estimates:
+            await sequential.quote("Казань", 3.0, [row])
+
+    results["последовательно"] = await _measure_async(one_by_one, max(1, iterations // 5))
+    await sequential.close()
+
+    for name, url, budget, hedge in (
+        ("параллельно", urls["ровно"], 0.8, 0.0),
+        ("один завис (бюджет 0,3 с)", urls["завис"], 0.3, 0.0),
+        ("хвост без хеджа", urls["хвост"], 0.8, 0.0),
+        ("хвост с хеджем 0,1 с", urls["хвост"], 0.8, 0.1),
+    ):
+        gw = gateway(url, budget, hedge)
+        fallbacks = []
+
+        async def fan_out():
+            rows = await gw.quote("Казань", 3.0, estimates)
+            fallbacks.append(sum(row.is_price_restored for row in rows))
+
+        results[name] = await _measure_async(fan_out, iterations)
+        restored[name] = fallbacks
+        await gw.close()
+
+    print("\nоценок вместо ответа перевозчика, в среднем на запрос:")
+    for name, fallbacks in restored.items():
+        print(f"  {name:<38}{sum(fallbacks) / len(fallbacks):>8.2f}")
+    return results
+
+
+def main(iterations: int = 100):
+    base = StubProfile(latency=0.04, jitter=0.02)
+    urls = {
+        "ровно": start_stub({company: base for company in TARIFF_COMPANIES}),
+        "завис": start_stub({**{company: base for company in TARIFF_COMPANIES}, "Boxberry": base._replace(latency=2.0)}),
+        "хвост": start_stub({company: base._replace(slow_rate=0.03, slow=0.4) for company in TARIFF_COMPANIES}),
+    }
+    results = asyncio.run(_bench(iterations, urls))
+    print_table("Опрос шести перевозчиков", results)
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+# Бенчмарки запускаются из каталога bekendcargo: python -m benchmarks.<имя>
+_WORKDIR = tempfile.mkdtemp(prefix="cargo-bench-")
+os.environ.setdefault("DELIVERIES_DB", os.path.join(_WORKDIR, "app.db"))
+# Бенчмарки шлют тысячи запросов с одного адреса.
+os.environ.setdefault("RATE_LIMIT_RPS", "0")
+
+
+def temp_db_path(name: str) -> str:
+    path = os.path.join(_WORKDIR, name)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return path
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn: Callable[[], object], iterations: int) -> Dict[str, float]:
+    """Вызвать fn iterations раз, вернуть ops/sec и перцентили задержки в мс."""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed)
+
+
+def summarize(latencies_ms: List[float], elapsed_s: float) -> Dict[str, float]:
+    return {
+        "ops": len(latencies_ms),
+        "ops_per_sec": round(len(latencies_ms) / elapsed_s, 1) if elapsed_s else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 50), 4),
+        "p99_ms": round(percentile(latencies_ms, 99), 4),
+    }
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, float]]):
+    print(f"\n{title}")
+    print(f"{'вариант':<40}{'ops/sec':>12}{'p50, мс':>12}{'p99, мс':>12}")
+    for name, r in rows.items():
+        print(f"{name:<40}{r['ops_per_sec']:>12}{r['p50_ms']:>12}{r['p99_ms']:>12}")
+    sys.stdout.flush()
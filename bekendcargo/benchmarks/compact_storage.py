@@ -0,0 +1,127 @@
+"""Хранение доставок: строковые столбцы против справочников (schema.py).
+
+Одни и те же строки записываются в базу прежней схемы, после чего её копия
+переводится на справочники через migrate_compact. Сравниваются размер файла
+и отдельных таблиц/индексов (после VACUUM) и время типовых запросов.
+
+Запуск: python -m benchmarks.compact_storage [строк]
+"""
+import random
+import shutil
+import sqlite3
+import sys
+import time
+from typing import Dict
+
+from benchmarks.common import measure, print_table, temp_db_path
+from benchmarks.statistics import CITIES, COMPANIES
+from main import SELECT_DELIVERIES_PAGE_SQL, STATS_BY_CITY_SQL, STATS_BY_COMPANY_SQL
+from migrate_compact import LEGACY_SCHEMA, CompactMigration
+from pricing import BOX_DIMENSIONS
+from schema import Dictionary
+from tariff_engine import current as current_tariffs
+
+LEGACY_QUERIES = {
+    "GROUP BY перевозчик": """
+        SELECT company, COUNT(*), SUM(price) FROM deliveries
+        GROUP BY company ORDER BY COUNT(*) DESC, company
+    """,
+    "GROUP BY город": """
+        SELECT town_to, COUNT(*) FROM deliveries
+        GROUP BY town_to ORDER BY COUNT(*) DESC, town_to
+    """,
+    "страница перевозчика": """
+        SELECT * FROM deliveries WHERE company = 'СДЭК' ORDER BY created_at DESC, id DESC LIMIT 101
+    """,
+    "выгрузка целиком": "SELECT * FROM deliveries ORDER BY created_at DESC, id DESC",
+}
+
+COMPACT_QUERIES = {
+    "GROUP BY перевозчик": STATS_BY_COMPANY_SQL["group_by"],
+    "GROUP BY город": STATS_BY_CITY_SQL["group_by"],
+    "страница перевозчика": SELECT_DELIVERIES_PAGE_SQL + """
+        WHERE company_id = (SELECT id FROM carriers WHERE name = 'СДЭК') ORDER BY created_at DESC, id DESC LIMIT 101
+    """,
+    "выгрузка целиком": SELECT_DELIVERIES_PAGE_SQL + " ORDER BY created_at DESC, id DESC",
+}
+
+
+def fill_legacy(path: str, rows: int, chunk: int = 50000):
+    rnd = random.Random(18)
+    tariffs = sorted({r.tariff_name for r in current_tariffs().records})
+    sizes = list(BOX_DIMENSIONS)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for sql in LEGACY_SCHEMA:
+        conn.execute(sql)
+    for start in range(0, rows, chunk):
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO deliveries (company, delivery_type, weight, size, town_from, town_to, price, "
+            "delivery_time, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', ?))",
+            [(rnd.choice(COMPANIES), rnd.choice(tariffs), round(rnd.uniform(0.1, 30), 1), rnd.choice(sizes),
+              f"г. {rnd.choice(CITIES)}", f"г. {rnd.choice(CITIES)}", rnd.randint(300, 5000),
+              rnd.randint(1, 10), f"-{rnd.randint(0, 365 * 24 * 3600)} seconds")
+             for _ in range(min(chunk, rows - start))])
+        conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def object_sizes(path: str) -> Dict[str, int]:
+    conn = sqlite3.connect(path)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        sizes = {"файл": conn.execute("PRAGMA page_count").fetchone()[0] * page_size}
+        try:
+            sizes.update(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+        except sqlite3.OperationalError:
+            pass  # SQLite собран без dbstat: только размер файла
+        return sizes
+    finally:
+        conn.close()
+
+
+def print_sizes(legacy: Dict[str, int], compact: Dict[str, int]):
+    print(f"\n{'объект':<40}{'КБ':>12}")
+    for title, sizes in (("строковые столбцы", legacy), ("справочники", compact)):
+        print(title)
+        for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+            if size >= 64 * 1024 or name == "файл":
+                print(f"  {name:<38}{size // 1024:>12}")
+    print(f"Размер файла: {compact['файл'] / legacy['файл']:.0%} от прежнего")
+
+
+def main(rows: int = 1_000_000):
+    legacy_path = temp_db_path("legacy-text.db")
+    compact_path = temp_db_path("compact.db")
+    fill_legacy(legacy_path, rows)
+    shutil.copy(legacy_path, compact_path)
+
+    started = time.perf_counter()
+    CompactMigration(compact_path, batch_size=50000).run(vacuum=True)
+    print(f"Миграция {rows} строк: {time.perf_counter() - started:.1f}с")
+    print_sizes(object_sizes(legacy_path), object_sizes(compact_path))
+
+    legacy, compact = sqlite3.connect(legacy_path), sqlite3.connect(compact_path)
+    dictionary = Dictionary()
+    results = {}
+    for name, legacy_sql in LEGACY_QUERIES.items():
+        iterations = 3 if name == "выгрузка целиком" else 20
+        compact_sql = COMPACT_QUERIES[name]
+        results[f"{name}: строки"] = measure(lambda: legacy.execute(legacy_sql).fetchall(), iterations)
+        if name.startswith("GROUP BY"):
+            results[f"{name}: справочники"] = measure(lambda: compact.execute(compact_sql).fetchall(), iterations)
+        else:
+            # Как в приложении: ID заменяются на имена из кэша справочников.
+            results[f"{name}: справочники"] = measure(
+                lambda: dictionary.decode_rows(compact, compact.execute(compact_sql).fetchall()), iterations)
+    legacy.close()
+    compact.close()
+    print_table(f"Запросы по {rows} строкам", results)
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
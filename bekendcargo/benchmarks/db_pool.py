@@ -0,0 +1,43 @@
+"""Вставки в deliveries: соединение на вызов против пула долгоживущих соединений.
+
+Запуск: python -m benchmarks.db_pool [количество_вставок]
+"""
+import sqlite3
+import sys
+
+from benchmarks.common import measure, print_table, temp_db_path
+from main import DeliveryDB, INSERT_DELIVERY_SQL
+from schema import Dictionary
+
+ROW = ("СДЭК", "экспресс лайт", 2.5, "M", "г. Москва", "г. Казань", 1250, 3)
+
+
+def connect_per_call_insert(db_path: str, row: list):
+    # Прежняя реализация save_delivery: connect → INSERT → commit → close.
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(INSERT_DELIVERY_SQL, row)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main(iterations: int = 2000):
+    legacy_db = DeliveryDB(temp_db_path("legacy.db"))
+    legacy_db.close()
+    conn = sqlite3.connect(legacy_db.db_path, isolation_level=None)
+    row = Dictionary().encode_row(conn, *ROW)
+    conn.close()
+    pooled_db = DeliveryDB(temp_db_path("pooled.db"))
+
+    results = {
+        "connect-per-call": measure(lambda: connect_per_call_insert(legacy_db.db_path, row), iterations),
+        "pooled (WAL)": measure(lambda: pooled_db.save_delivery(*ROW[:4], "Москва", "Казань", *ROW[6:]), iterations),
+    }
+    pooled_db.close()
+    print_table(f"INSERT в deliveries, {iterations} операций", results)
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
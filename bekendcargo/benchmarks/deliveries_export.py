@@ -0,0 +1,40 @@
+"""Пиковая память выгрузки /api/deliveries: поток NDJSON против полной выборки.
+
+ru_maxrss — максимум за жизнь процесса, поэтому потоковая выгрузка
+замеряется первой, а прежний путь — после неё.
+
+Запуск: python -m benchmarks.deliveries_export [строк]
+"""
+import resource
+import sys
+import time
+
+from benchmarks.common import temp_db_path
+from benchmarks.statistics import fill
+from main import DeliveryDB, DeliveryFilters, _ndjson_chunk
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(rows: int = 500_000):
+    db = DeliveryDB(temp_db_path("export.db"))
+    fill(db, rows)
+    baseline = peak_rss_mb()
+
+    t0 = time.perf_counter()
+    size = sum(len(_ndjson_chunk(chunk)) for chunk in db.iter_deliveries(DeliveryFilters()))
+    streamed = peak_rss_mb()
+    print(f"NDJSON поток: {size / 1e6:.1f} МБ за {time.perf_counter() - t0:.1f}с, "
+          f"пик RSS +{streamed - baseline:.1f} МБ")
+
+    t0 = time.perf_counter()
+    deliveries = db.get_all_deliveries()
+    print(f"get_all_deliveries: {len(deliveries)} строк за {time.perf_counter() - t0:.1f}с, "
+          f"пик RSS +{peak_rss_mb() - baseline:.1f} МБ")
+    db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000)
@@ -0,0 +1,86 @@
+"""Задержка цикла событий и пропускная способность API под смешанной нагрузкой.
+
+Приложение запускается в том же процессе через httpx.ASGITransport.
+Параллельно с запросами тикер каждую миллисекунду замеряет, насколько
+позже положенного он просыпается — это и есть задержка цикла событий.
+
+Запуск: python -m benchmarks.event_loop_lag [запросов] [параллельность] [--blocking]
+  --blocking  вызывать DeliveryDB прямо в обработчиках, как было раньше
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import percentile, summarize
+
+import main
+
+READ_PATHS = ["/api/statistics", "/api/deliveries", "/api/health"]
+WRITE_PARAMS = {"from_city": "Москва", "to_city": "Казань", "weight": 2.5, "box_size": "M"}
+
+
+async def _blocking_run(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+async def _ticker(lags, stop: asyncio.Event, interval: float = 0.001):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - t0 - interval) * 1000)
+
+
+async def run(requests: int, concurrency: int):
+    transport = httpx.ASGITransport(app=main.app)
+    latencies, lags = [], []
+    stop = asyncio.Event()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            async with semaphore:
+                t0 = time.perf_counter()
+                if i % 4 == 0:
+                    r = await client.get("/api/calculate", params=WRITE_PARAMS)
+                else:
+                    r = await client.get(READ_PATHS[i % len(READ_PATHS)])
+                r.raise_for_status()
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+        # Наполняем таблицу, чтобы чтения были не бесплатными.
+        main.db.save_deliveries([main.DeliveryRecord("СДЭК", "экспресс лайт", 1.0, "M",
+                                                     "Москва", "Казань", 900, 2)] * 2000)
+        ticker = asyncio.create_task(_ticker(lags, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await ticker
+    await main.writer.stop()
+
+    result = summarize(latencies, elapsed)
+    result["loop_lag_p50_ms"] = round(percentile(lags, 50), 3)
+    result["loop_lag_p99_ms"] = round(percentile(lags, 99), 3)
+    result["loop_lag_max_ms"] = round(max(lags, default=0.0), 3)
+    return result
+
+
+def main_cli(argv):
+    blocking = "--blocking" in argv
+    args = [a for a in argv if not a.startswith("--")]
+    requests = int(args[0]) if args else 400
+    concurrency = int(args[1]) if len(args) > 1 else 32
+    if blocking:
+        main.adb.run = _blocking_run
+    result = asyncio.run(run(requests, concurrency))
+    mode = "blocking" if blocking else "thread pool"
+    print(f"\nРежим: {mode}, запросов {requests}, параллельность {concurrency}")
+    for key, value in result.items():
+        print(f"  {key:<18}{value}")
+    return result
+
+
+if __name__ == "__main__":
+    main_cli(sys.argv[1:])
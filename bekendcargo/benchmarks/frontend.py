@@ -0,0 +1,80 @@
+"""Фронтенд (frontedcargo): запросов в секунду для страниц и статики.
+
+Приложение фронтенда грузится из ../frontedcargo/main.py под отдельным
+именем модуля, чтобы не пересекаться с main бэкенда, и вызывается через
+httpx.ASGITransport без сети. Города и расчёт фронтенд берёт у бэкенда —
+его клиент подменяется таким же клиентом к приложению бэкенда в процессе.
+
+  GET /                 — главная страница;
+  GET / + If-None-Match — повторный заход браузера с ETag (304);
+  POST /calc            — форма расчёта с выбранными городами и коробкой;
+  GET /static/style.css — стили с Accept-Encoding: gzip, br.
+
+Запуск: python -m benchmarks.frontend [итераций]
+"""
+import asyncio
+import importlib.util
+import os
+import sys
+from typing import Dict
+
+import httpx
+
+from benchmarks.common import print_table
+from benchmarks.suite import _measure_async
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "frontedcargo")
+
+
+def load_frontend():
+    import main as backend
+
+    spec = importlib.util.spec_from_file_location("frontedcargo_main", os.path.join(FRONTEND_DIR, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    if FRONTEND_DIR not in sys.path:
+        sys.path.append(FRONTEND_DIR)  # соседние модули фронтенда (assets)
+    spec.loader.exec_module(module)
+    module.backend = httpx.AsyncClient(transport=httpx.ASGITransport(app=backend.app), base_url="http://backend")
+    return module
+
+
+async def _bench(app, iterations: int) -> Dict[str, Dict[str, float]]:
+    form = {"from_city": "Москва", "to_city": "Казань", "weight": "3", "box_size": "M"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        home = await client.get("/")
+        home.raise_for_status()
+        etag = home.headers.get("etag")
+        style = home.text.split('href="', 1)[1].split('"', 1)[0]
+
+        async def get_home():
+            (await client.get("/")).raise_for_status()
+
+        async def revalidate_home():
+            response = await client.get("/", headers={"if-none-match": etag} if etag else {})
+            if response.status_code not in (200, 304):
+                response.raise_for_status()
+
+        async def post_calc():
+            (await client.post("/calc", data=form)).raise_for_status()
+
+        async def get_style():
+            (await client.get(style, headers={"accept-encoding": "gzip, br"})).raise_for_status()
+
+        return {
+            "GET /": await _measure_async(get_home, iterations),
+            "GET / (If-None-Match)": await _measure_async(revalidate_home, iterations),
+            "POST /calc": await _measure_async(post_calc, iterations),
+            "GET /static/style.css": await _measure_async(get_style, iterations),
+        }
+
+
+def main(iterations: int = 2000):
+    frontend = load_frontend()
+    results = asyncio.run(_bench(frontend.app, iterations))
+    print_table("Фронтенд через ASGI", results)
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
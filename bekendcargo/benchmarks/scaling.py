@@ -0,0 +1,123 @@
+"""Масштабирование пропускной способности по числу воркеров serve.py.
+
+Для каждого значения --workers поднимается настоящий сервер (python serve.py)
+на отдельной временной базе, после чего несколько процессов-клиентов в течение
+--duration секунд шлют смешанную нагрузку: расчёты (с записью в БД), тарифы
+и статистику. Клиенты работают в отдельных процессах, чтобы генератор
+нагрузки сам не упирался в одно ядро.
+
+Запуск из каталога bekendcargo:
+  python -m benchmarks.scaling --workers 1,2,4 --clients 4 --duration 10
+
+Рост ops/sec ограничен числом ядер машины (и генератор нагрузки делит
+их с сервером), поэтому сравнивать имеет смысл значения не выше nproc.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.common import print_table, summarize, temp_db_path
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CITIES = ["Москва", "Казань", "Новосибирск", "Екатеринбург", "Сочи", "Омск", "Тула", "Пермь"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Сервер {base_url} не поднялся за {timeout}с")
+
+
+async def _client(base_url: str, duration: float, concurrency: int, seed: int) -> List[float]:
+    rnd = random.Random(seed)
+    latencies: List[float] = []
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        async def loop():
+            while time.perf_counter() < deadline:
+                kind = rnd.random()
+                t0 = time.perf_counter()
+                if kind < 0.6:
+                    c1, c2 = rnd.sample(CITIES, 2)
+                    r = await client.get("/api/calculate", params={
+                        "from_city": c1, "to_city": c2, "weight": rnd.choice((0.5, 1, 2.5, 4)), "box_size": "M"})
+                elif kind < 0.9:
+                    r = await client.post("/api/tariffs", json={"city": rnd.choice(CITIES), "weight": 3})
+                else:
+                    r = await client.get("/api/statistics")
+                r.raise_for_status()
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies
+
+
+def _client_process(args) -> List[float]:
+    return asyncio.run(_client(*args))
+
+
+def run(workers: int, clients: int, concurrency: int, duration: float) -> Dict[str, float]:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DELIVERIES_DB=temp_db_path(f"scaling-{workers}.db"), LOG_LEVEL="WARNING")
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port),
+         "--host", "127.0.0.1", "--log-level", "warning", "--no-access-log"],
+        cwd=APP_DIR, env=env,
+    )
+    try:
+        _wait_ready(base_url)
+        started = time.perf_counter()
+        with multiprocessing.Pool(clients) as pool:
+            parts = pool.map(_client_process, [
+                (base_url, duration, concurrency, seed) for seed in range(clients)])
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return summarize([latency for part in parts for latency in part], elapsed)
+
+
+def main_cli(argv):
+    parser = argparse.ArgumentParser(description="Масштабирование по числу воркеров")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--clients", type=int, default=4, help="процессов-генераторов нагрузки")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных запросов на клиента")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for workers in map(int, args.workers.split(",")):
+        results[f"workers={workers}"] = run(workers, args.clients, args.concurrency, args.duration)
+    print_table(f"Смешанная нагрузка, ядер: {os.cpu_count()}", results)
+
+    base = next(iter(results.values()))["ops_per_sec"]
+    for name, r in results.items():
+        print(f"  {name:<16} x{r['ops_per_sec'] / base:.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    main_cli(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""Тело ответа /api/calculate и /api/tariffs: pydantic-модели против dataclass + orjson.
+
+Сравниваются два значения RESPONSE_SERIALIZER (см. serialization.py):
+  pydantic — валидация каждого предложения в модель и model_dump_json,
+             как было до dataclass-представлений;
+  fast     — dataclass со __slots__ сразу в orjson.
+
+Уровни:
+  сборка — расчёт предложений и тело ответа без HTTP (как при промахе кэша),
+           плюс пик памяти на один ответ по tracemalloc;
+  ASGI   — запросов в секунду через httpx.ASGITransport с выключенным кэшем
+           расчётов, чтобы каждый запрос строил ответ заново.
+
+Запуск: python -m benchmarks.serialization [итераций]
+"""
+import asyncio
+import os
+import random
+import sys
+import tracemalloc
+from typing import Callable, Dict
+
+os.environ.setdefault("QUOTE_CACHE_SIZE", "0")
+os.environ.setdefault("COALESCE_WINDOW_MS", "0")
+
+import httpx
+
+from benchmarks.common import measure, percentile, print_table
+from benchmarks.suite import _measure_async
+from models import SearchResponse, SearchResult, TariffsResponse, TariffsResult
+from pricing import generate_tariffs_for_city, get_offers
+import serialization
+
+import main
+
+MODES = ("pydantic", "fast")
+
+
+def build_search() -> bytes:
+    offers = get_offers(2.5, "M", 3, random.Random(1))
+    result = SearchResult("Москва", "Санкт-Петербург", 2.5, "M — M (средняя)", offers)
+    return serialization.render(result, SearchResponse)
+
+
+def build_tariffs() -> bytes:
+    tariffs = generate_tariffs_for_city("Казань", 3.0, random.Random(1))
+    result = TariffsResult("Казань", 3.0, 1000.0, 5.0, tariffs)
+    return serialization.render(result, TariffsResponse)
+
+
+def peak_kb(fn: Callable[[], object], iterations: int = 500) -> float:
+    """Медиана пика выделенной памяти за один вызов, КБ."""
+    fn()
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    return round(percentile(peaks, 50) / 1024, 1)
+
+
+async def _bench_asgi(iterations: int) -> Dict[str, Dict[str, float]]:
+    transport = httpx.ASGITransport(app=main.app)
+    calc_params = {"from_city": "Москва", "to_city": "Санкт-Петербург", "weight": 2.5, "box_size": "M"}
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def calculate():
+            (await client.get("/api/calculate", params=calc_params)).raise_for_status()
+
+        async def tariffs():
+            (await client.post("/api/tariffs", json={"city": "Казань", "weight": 3})).raise_for_status()
+
+        for mode in MODES:
+            serialization.RESPONSE_SERIALIZER = mode
+            results[f"asgi.calculate: {mode}"] = await _measure_async(calculate, iterations)
+            results[f"asgi.tariffs: {mode}"] = await _measure_async(tariffs, iterations)
+    await main.writer.stop()
+    return results
+
+
+def main_cli(iterations: int = 2000):
+    results, memory = {}, {}
+    for mode in MODES:
+        serialization.RESPONSE_SERIALIZER = mode
+        for name, fn in (("calculate", build_search), ("tariffs", build_tariffs)):
+            results[f"сборка.{name}: {mode}"] = measure(fn, iterations * 5)
+            memory[f"{name}: {mode}"] = peak_kb(fn)
+    results.update(asyncio.run(_bench_asgi(iterations)))
+    serialization.RESPONSE_SERIALIZER = "fast"
+
+    print_table(f"Сериализация ответов (orjson: {'да' if serialization.orjson else 'нет'})", results)
+    print(f"\n{'пик памяти на ответ':<40}{'КБ':>12}")
+    for name, kb in memory.items():
+        print(f"{name:<40}{kb:>12}")
+    return results
+
+
+if __name__ == "__main__":
+    main_cli(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
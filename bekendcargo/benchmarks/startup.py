@@ -0,0 +1,54 @@
+"""Время открытия базы при старте в зависимости от её размера.
+
+Для каждого размера база заполняется, после чего замеряется конструктор
+DeliveryDB (проверка заголовка, чтение схемы, CREATE IF NOT EXISTS) и,
+для сравнения, прежний синхронный PRAGMA integrity_check.
+
+Запуск: python -m benchmarks.startup [строк,...] [--budget-ms 200]
+Код возврата 1, если старт на каком-либо размере превысил бюджет.
+"""
+import argparse
+import sqlite3
+import sys
+
+from benchmarks.common import measure, print_table, temp_db_path
+from benchmarks.statistics import fill
+from main import DeliveryDB
+
+
+def full_integrity_check(path: str):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA integrity_check").fetchone()
+    finally:
+        conn.close()
+
+
+def main_cli(argv) -> int:
+    parser = argparse.ArgumentParser(description="Время старта DeliveryDB")
+    parser.add_argument("sizes", nargs="?", default="10000,100000,1000000")
+    parser.add_argument("--budget-ms", type=float, default=200.0)
+    args = parser.parse_args(argv)
+
+    results, over_budget = {}, []
+    for rows in map(int, args.sizes.split(",")):
+        path = temp_db_path(f"startup-{rows}.db")
+        db = DeliveryDB(path)
+        fill(db, rows)
+        db.close()
+
+        startup = measure(lambda: DeliveryDB(path).close(), 10)
+        results[f"{rows} строк: DeliveryDB()"] = startup
+        results[f"{rows} строк: integrity_check"] = measure(lambda: full_integrity_check(path), 1)
+        if startup["p99_ms"] > args.budget_ms:
+            over_budget.append(rows)
+
+    print_table(f"Старт базы (бюджет {args.budget_ms:.0f} мс)", results)
+    if over_budget:
+        print(f"\nБюджет превышен на размерах: {over_budget}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
@@ -0,0 +1,59 @@
+"""/api/statistics: сводные таблицы против GROUP BY и прежнего обхода в Python.
+
+Запуск: python -m benchmarks.statistics [строк] [--legacy]
+  --legacy  также замерить прежний путь через get_all_deliveries (много памяти)
+"""
+import random
+import sys
+import time
+
+from benchmarks.common import measure, print_table, temp_db_path
+from main import DeliveryDB, DeliveryRecord
+
+COMPANIES = ["СДЭК", "Boxberry", "Почта России", "Деловые Линии", "ПЭК", "КИТ"]
+CITIES = ["Москва", "Казань", "Самара", "Омск", "Тула", "Сочи", "Уфа", "Пермь"]
+
+
+def fill(db: DeliveryDB, rows: int, chunk: int = 50000):
+    rnd = random.Random(42)
+    t0 = time.perf_counter()
+    for start in range(0, rows, chunk):
+        db.save_deliveries([
+            DeliveryRecord(rnd.choice(COMPANIES), "экспресс лайт", 1.0, "M", "Москва",
+                           rnd.choice(CITIES), rnd.randint(300, 5000), 3)
+            for _ in range(min(chunk, rows - start))
+        ])
+    print(f"Заполнено {rows} строк за {time.perf_counter() - t0:.1f}с")
+
+
+def legacy_statistics(db: DeliveryDB):
+    deliveries = db.get_all_deliveries()
+    companies, cities = {}, {}
+    for d in deliveries:
+        data = companies.setdefault(d['company'], {'count': 0, 'total_price': 0})
+        data['count'] += 1
+        data['total_price'] += d['price']
+    for d in deliveries:
+        cities.setdefault(d['town_to'], {'count': 0})['count'] += 1
+    return companies, cities
+
+
+def main(rows: int = 1_000_000, legacy: bool = False):
+    db = DeliveryDB(temp_db_path("statistics.db"))
+    fill(db, rows)
+    assert db.get_statistics("summary") == db.get_statistics("group_by")
+
+    results = {
+        "summary tables": measure(lambda: db.get_statistics("summary"), 200),
+        "GROUP BY": measure(lambda: db.get_statistics("group_by"), 3),
+    }
+    if legacy:
+        results["get_all_deliveries + Python"] = measure(lambda: legacy_statistics(db), 1)
+    db.close()
+    print_table(f"Статистика по {rows} строкам", results)
+    return results
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    main(int(args[0]) if args else 1_000_000, "--legacy" in sys.argv)
@@ -0,0 +1,164 @@
+"""Набор бенчмарков горячих путей с сохранением и сравнением baseline.
+
+Уровни:
+  micro — функции расчёта цен без БД и HTTP;
+  db    — вставка, полный проход, агрегаты и страницы на 10k/100k/1M строк;
+  asgi  — /api/calculate, /api/tariffs, /api/statistics через httpx.ASGITransport.
+
+Запуск из каталога bekendcargo:
+  python -m benchmarks.suite                         # все уровни, таблица на 10k строк
+  python -m benchmarks.suite --only micro,asgi
+  python -m benchmarks.suite --sizes 10000,100000,1000000
+  python -m benchmarks.suite --save benchmarks/baselines/main.json
+  python -m benchmarks.suite --compare benchmarks/baselines/main.json --tolerance 0.25
+
+При --compare процесс завершается с кодом 1, если какой-либо бенчмарк
+стал медленнее baseline больше чем на tolerance по ops/sec.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict
+
+import httpx
+
+from benchmarks.batch_quote import shipments
+from benchmarks.common import measure, print_table, summarize, temp_db_path
+from benchmarks.statistics import fill
+from batch_quote import quote_batch
+from pricing import CITY_INDEX, calculate_price, generate_tariffs_for_city, get_offers, quote_rng
+from tariff_engine import current as current_tariffs
+
+import main
+
+Results = Dict[str, Dict[str, float]]
+
+
+def bench_micro() -> Results:
+    rng = quote_rng("bench")
+    columns = [list(col) for col in zip(*shipments(10000))]
+    economy = current_tariffs().find("СДЭК", "Посылочка Эконом")
+    return {
+        "micro.calculate_price": measure(
+            lambda: calculate_price(economy, 2.5, 4.8, 3, "M", rng), 50000),
+        "micro.get_offers": measure(lambda: get_offers(2.5, "M", 3, rng), 10000),
+        "micro.generate_tariffs_for_city": measure(
+            lambda: generate_tariffs_for_city("Казань", 3.0, rng), 10000),
+        "micro.city_resolve_zone_diff": measure(
+            lambda: CITY_INDEX.zone_diff(CITY_INDEX.resolve("Москва"), CITY_INDEX.resolve("казань")), 100000),
+        "micro.quote_batch_10k": measure(lambda: quote_batch(*columns), 20),
+    }
+
+
+def bench_db(rows: int) -> Results:
+    db = main.DeliveryDB(temp_db_path(f"suite-{rows}.db"))
+    t0 = time.perf_counter()
+    fill(db, rows)
+    elapsed = time.perf_counter() - t0
+    # Вставка пачками по 50k: задержка отдельной строки здесь не имеет смысла.
+    results = {f"db.{rows}.insert_batched": {"ops": rows, "ops_per_sec": round(rows / elapsed, 1),
+                                             "p50_ms": 0.0, "p99_ms": 0.0}}
+
+    record = main.DeliveryRecord("СДЭК", "экспресс лайт", 1.0, "M", "Москва", "Казань", 900, 2)
+    results[f"db.{rows}.insert_single"] = measure(lambda: db.save_delivery(*record), 500)
+    results[f"db.{rows}.scan"] = measure(
+        lambda: sum(len(chunk) for chunk in db.iter_deliveries(main.DeliveryFilters())), 1 if rows > 100000 else 3)
+    results[f"db.{rows}.aggregate_group_by"] = measure(lambda: db.get_statistics("group_by"), 3)
+    results[f"db.{rows}.aggregate_summary"] = measure(lambda: db.get_statistics(), 500)
+    results[f"db.{rows}.count"] = measure(db.get_deliveries_count, 1000)
+    results[f"db.{rows}.page"] = measure(lambda: db.get_deliveries_page(main.DeliveryFilters(), 100), 200)
+    db.close()
+    return results
+
+
+async def _measure_async(fn: Callable, iterations: int) -> Dict[str, float]:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        await fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def _bench_asgi(iterations: int) -> Results:
+    transport = httpx.ASGITransport(app=main.app)
+    calc_params = {"from_city": "Москва", "to_city": "Санкт-Петербург", "weight": 2.5, "box_size": "M"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def calculate():
+            (await client.get("/api/calculate", params=calc_params)).raise_for_status()
+
+        async def tariffs():
+            (await client.post("/api/tariffs", json={"city": "Казань", "weight": 3})).raise_for_status()
+
+        async def statistics():
+            (await client.get("/api/statistics")).raise_for_status()
+
+        results = {
+            "asgi.calculate": await _measure_async(calculate, iterations),
+            "asgi.tariffs": await _measure_async(tariffs, iterations),
+            "asgi.statistics": await _measure_async(statistics, iterations),
+        }
+    await main.writer.stop()
+    return results
+
+
+def bench_asgi(iterations: int = 500) -> Results:
+    return asyncio.run(_bench_asgi(iterations))
+
+
+def compare(results: Results, baseline: Results, tolerance: float) -> int:
+    regressions = 0
+    print(f"\nСравнение с baseline (допуск {tolerance:.0%} по ops/sec)")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("ops_per_sec"):
+            print(f"  {name:<40} нет в baseline")
+            continue
+        change = current["ops_per_sec"] / base["ops_per_sec"] - 1
+        regressed = change < -tolerance
+        regressions += regressed
+        print(f"  {name:<40}{change:>+8.1%}{'  РЕГРЕССИЯ' if regressed else ''}")
+    return regressions
+
+
+def main_cli(argv) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки bekendcargo")
+    parser.add_argument("--only", default="micro,db,asgi")
+    parser.add_argument("--sizes", default="10000")
+    parser.add_argument("--save")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+    levels = set(args.only.split(","))
+
+    results: Results = {}
+    if "micro" in levels:
+        results.update(bench_micro())
+    if "db" in levels:
+        for rows in map(int, args.sizes.split(",")):
+            results.update(bench_db(rows))
+    if "asgi" in levels:
+        results.update(bench_asgi())
+    print_table("Результаты", results)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline сохранён: {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        return 1 if compare(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
@@ -0,0 +1,45 @@
+"""Задержка записи трёх предложений: синхронный save_delivery против очереди.
+
+Запуск: python -m benchmarks.write_behind [количество_запросов]
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks.common import measure, print_table, summarize, temp_db_path
+from async_db import AsyncDeliveryDB
+from main import DeliveryDB
+from write_behind import DeliveryRecord, WriteBehindQueue
+
+RECORD = DeliveryRecord("СДЭК", "экспресс лайт", 2.5, "M", "Москва", "Казань", 1250, 3)
+
+
+async def queued(db: DeliveryDB, iterations: int):
+    writer = WriteBehindQueue(AsyncDeliveryDB(db).save_deliveries)
+    writer.start()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        for _ in range(3):
+            await writer.enqueue(RECORD)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    await writer.stop()
+    return summarize(latencies, elapsed)
+
+
+def main(iterations: int = 1000):
+    sync_db = DeliveryDB(temp_db_path("sync.db"))
+    queued_db = DeliveryDB(temp_db_path("queued.db"))
+    results = {
+        "save_delivery x3": measure(lambda: [sync_db.save_delivery(*RECORD) for _ in range(3)], iterations),
+        "write-behind x3": asyncio.run(queued(queued_db, iterations)),
+    }
+    assert queued_db.get_deliveries_count() == 3 * iterations
+    print_table(f"Запись трёх предложений, {iterations} запросов", results)
+    return results
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
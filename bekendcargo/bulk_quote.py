@@ -0,0 +1,364 @@
+"""Потоковый расчёт отправлений из CSV или NDJSON.
+
+    python bulk_quote.py shipments.csv -o quotes.csv
+    python bulk_quote.py shipments.ndjson --workers 4 --save
+    cat shipments.csv | python bulk_quote.py - > quotes.csv
+
+То же доступно через POST /api/calculate/bulk (тело запроса — файл).
+
+Вход читается по мере поступления и режется на пачки по chunk_size строк.
+Пачки считаются в пуле процессов той же функцией best_quote, что и
+текстовый расчёт, поэтому цены совпадают с /api/calculate за этот день.
+Одновременно в работе не больше max_pending пачек: память не зависит от
+размера файла. Результаты пишутся в исходном порядке, как только готова
+очередная пачка. Выбранные предложения (лучшая цена) сохраняются в БД одной
+транзакцией на пачку.
+
+CSV — заголовок с колонками from_city, to_city, weight и необязательной
+box_size (по умолчанию M), разделитель «,» или «;». Остальные колонки
+переносятся в результат как есть. Переводы строк внутри кавычек не
+поддерживаются. NDJSON — по объекту с теми же ключами на строку.
+К каждой строке добавляются status (ok/error), company, tariff_name,
+delivery_type, price, days_min, days_max и error.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, Deque, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import tariff_engine
+from pricing import CITY_INDEX
+from text_quote import QuoteError, best_quote, make_request
+from write_behind import DeliveryRecord
+
+logger = logging.getLogger(__name__)
+
+INPUT_FIELDS = ("from_city", "to_city", "weight", "box_size")
+RESULT_FIELDS = ("status", "company", "tariff_name", "delivery_type", "price", "days_min", "days_max", "error")
+READ_SIZE = 1 << 20
+
+# Поля отправления или текст ошибки разбора строки.
+Request = Union[Tuple[str, str, str, str], str]
+Result = Tuple
+
+
+class BulkError(ValueError):
+    pass
+
+
+class Row(NamedTuple):
+    source: object  # исходные значения строки: список для CSV, объект для NDJSON
+    request: Request
+
+
+def quote_chunk(requests: List[Request], tariffs_version: str) -> List[Result]:
+    """Выполняется в процессе пула: лучший тариф или ошибка для каждой строки."""
+    if tariff_engine.current().version != tariffs_version:
+        tariff_engine.reload()  # таблицу перечитали в основном процессе
+    results = []
+    for request in requests:
+        try:
+            if isinstance(request, str):
+                raise QuoteError(request)
+            q = best_quote(make_request(*request))
+            results.append(("ok", q.offer.company, q.offer.tariff_name, q.delivery_type,
+                            q.offer.price, q.days_min, q.days_max, ""))
+        except QuoteError as e:
+            results.append(("error", "", "", "", "", "", "", str(e)))
+    return results
+
+
+class LineSplitter:
+    """Строки из кусков байтов произвольной длины."""
+
+    def __init__(self):
+        self._tail = b""
+        self._first = True
+
+    def feed(self, data: bytes) -> List[str]:
+        data = self._tail + data
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._tail = data
+            return []
+        self._tail = data[end + 1:]
+        return self._decode(data[:end].split(b"\n"))
+
+    def close(self) -> List[str]:
+        tail, self._tail = self._tail, b""
+        return self._decode([tail]) if tail.strip() else []
+
+    def _decode(self, lines: List[bytes]) -> List[str]:
+        if self._first and lines:
+            lines[0] = lines[0].removeprefix(b"\xef\xbb\xbf")
+            self._first = False
+        return [line.decode("utf-8", errors="replace").rstrip("\r") for line in lines if line.strip()]
+
+
+class CsvFormat:
+    media_type = "text/csv; charset=utf-8"
+
+    def __init__(self):
+        self.header: Optional[List[str]] = None
+        self.delimiter = ","
+        self._columns: Tuple[int, ...] = ()
+
+    def parse(self, lines: List[str]) -> List[Row]:
+        if self.header is None and lines:
+            first = lines.pop(0)
+            if ";" in first and "," not in first:
+                self.delimiter = ";"
+            self.header = next(csv.reader([first], delimiter=self.delimiter))
+            names = [name.strip().lower() for name in self.header]
+            missing = [f for f in INPUT_FIELDS[:3] if f not in names]
+            if missing:
+                raise BulkError(f"В заголовке CSV нет колонок: {', '.join(missing)}")
+            self._columns = tuple(names.index(f) if f in names else -1 for f in INPUT_FIELDS)
+
+        rows = []
+        width = len(self.header)
+        for values in csv.reader(lines, delimiter=self.delimiter):
+            if len(values) < width:
+                values += [""] * (width - len(values))  # пустые колонки в конце строки
+            from_city, to_city, weight, box_size = (values[i].strip() if i >= 0 else "" for i in self._columns)
+            rows.append(Row(values, (from_city, to_city, weight, box_size or "M")))
+        return rows
+
+    def format(self, rows: List[Row], results: List[Result], first: bool) -> str:
+        out = io.StringIO()
+        writer = csv.writer(out, delimiter=self.delimiter, lineterminator="\n")
+        if first:
+            writer.writerow(list(self.header or INPUT_FIELDS) + list(RESULT_FIELDS))
+        for row, result in zip(rows, results):
+            writer.writerow(list(row.source) + list(result))
+        return out.getvalue()
+
+
+class NdjsonFormat:
+    media_type = "application/x-ndjson"
+
+    def parse(self, lines: List[str]) -> List[Row]:
+        rows = []
+        for line in lines:
+            try:
+                obj = json.loads(line)
+                if not isinstance(obj, dict):
+                    raise ValueError
+            except ValueError:
+                rows.append(Row({"line": line[:200]}, "Строка не является JSON-объектом"))
+                continue
+            from_city, to_city, weight, box_size = (str(obj.get(f) or "").strip() for f in INPUT_FIELDS)
+            rows.append(Row(obj, (from_city, to_city, weight, box_size or "M")))
+        return rows
+
+    def format(self, rows: List[Row], results: List[Result], first: bool) -> str:
+        return "".join(
+            json.dumps({**row.source, **dict(zip(RESULT_FIELDS, result))}, ensure_ascii=False) + "\n"
+            for row, result in zip(rows, results)
+        )
+
+
+FORMATS = {"csv": CsvFormat, "ndjson": NdjsonFormat}
+
+
+def detect_format(name: Optional[str]) -> str:
+    """csv или ndjson по имени файла, расширению или Content-Type."""
+    name = (name or "").lower()
+    return "ndjson" if "ndjson" in name or "jsonl" in name or name.endswith("json") else "csv"
+
+
+class BulkStats:
+    def __init__(self, progress_interval: float = 5.0):
+        self.rows = 0
+        self.errors = 0
+        self.saved = 0
+        self.started = time.perf_counter()
+        self.progress_interval = progress_interval
+        self._reported = self.started
+
+    @property
+    def rows_per_sec(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+    def add(self, results: List[Result], saved: int):
+        self.rows += len(results)
+        self.errors += sum(1 for r in results if r[0] != "ok")
+        self.saved += saved
+        now = time.perf_counter()
+        if now - self._reported >= self.progress_interval:
+            self._reported = now
+            logger.info("Пакетный расчёт: %s", self)
+
+    def as_dict(self) -> dict:
+        return {"rows": self.rows, "errors": self.errors, "saved": self.saved,
+                "seconds": round(time.perf_counter() - self.started, 2), "rows_per_sec": round(self.rows_per_sec)}
+
+    def __str__(self) -> str:
+        return (f"строк {self.rows}, ошибок {self.errors}, сохранено {self.saved}, "
+                f"{self.rows_per_sec:.0f} строк/с")
+
+
+class BulkPipeline:
+    """Состояние одного потока: разбор, пачки в пуле, форматирование результата."""
+
+    def __init__(self, fmt: str, chunk_size: int = 2000, progress_interval: float = 5.0):
+        self.format = FORMATS[fmt]()
+        self.chunk_size = chunk_size
+        self.splitter = LineSplitter()
+        self.stats = BulkStats(progress_interval)
+        self.tariffs_version = tariff_engine.current().version
+        self._buffer: List[Row] = []
+        self._first = True
+
+    def feed(self, data: bytes) -> Iterator[List[Row]]:
+        """Готовые пачки строк после очередного куска входа."""
+        self._buffer.extend(self.format.parse(self.splitter.feed(data)))
+        while len(self._buffer) >= self.chunk_size:
+            chunk, self._buffer = self._buffer[:self.chunk_size], self._buffer[self.chunk_size:]
+            yield chunk
+
+    def close(self) -> Iterator[List[Row]]:
+        self._buffer.extend(self.format.parse(self.splitter.close()))
+        if self._buffer:
+            chunk, self._buffer = self._buffer, []
+            yield chunk
+
+    def submit(self, executor: Executor, chunk: List[Row]):
+        return executor.submit(quote_chunk, [row.request for row in chunk], self.tariffs_version)
+
+    @staticmethod
+    def records(chunk: List[Row], results: List[Result]) -> List[DeliveryRecord]:
+        # Города записываются каноническими названиями, как в /api/calculate.
+        return [
+            DeliveryRecord(company, delivery_type, float(row.request[2]), row.request[3],
+                           CITY_INDEX.title(CITY_INDEX.resolve(row.request[0])),
+                           CITY_INDEX.title(CITY_INDEX.resolve(row.request[1])), price, days_min)
+            for row, (status, company, _, delivery_type, price, days_min, _, _) in zip(chunk, results)
+            if status == "ok"
+        ]
+
+    def output(self, chunk: List[Row], results: List[Result], saved: int) -> str:
+        self.stats.add(results, saved)
+        text = self.format.format(chunk, results, self._first)
+        self._first = False
+        return text
+
+
+def run(source: BinaryIO, out, pipeline: BulkPipeline, executor: Executor,
+        persist: Optional[Callable[[List[DeliveryRecord]], int]] = None, max_pending: int = 4) -> BulkStats:
+    """Синхронный расчёт файла: source — бинарный поток, out — текстовый."""
+    pending: Deque = deque()
+
+    def finish():
+        chunk, future = pending.popleft()
+        results = future.result()
+        records = pipeline.records(chunk, results) if persist else []
+        saved = persist(records) if records else 0
+        out.write(pipeline.output(chunk, results, saved))
+
+    def chunks() -> Iterator[List[Row]]:
+        while True:
+            data = source.read(READ_SIZE)
+            if not data:
+                break
+            yield from pipeline.feed(data)
+        yield from pipeline.close()
+
+    try:
+        for chunk in chunks():
+            pending.append((chunk, pipeline.submit(executor, chunk)))
+            if len(pending) >= max_pending:
+                finish()
+        while pending:
+            finish()
+    finally:
+        for _, future in pending:
+            future.cancel()
+    return pipeline.stats
+
+
+async def stream(body: AsyncIterator[bytes], pipeline: BulkPipeline, executor: Executor,
+                 persist: Optional[Callable[[List[DeliveryRecord]], Awaitable[int]]] = None,
+                 max_pending: int = 4) -> AsyncIterator[bytes]:
+    """То же для HTTP: тело запроса читается, пока пул считает предыдущие пачки."""
+    pending: Deque = deque()
+
+    async def finish() -> bytes:
+        chunk, future = pending.popleft()
+        results = await asyncio.wrap_future(future)
+        records = pipeline.records(chunk, results) if persist else []
+        saved = await persist(records) if records else 0
+        return pipeline.output(chunk, results, saved).encode()
+
+    try:
+        async for data in body:
+            for chunk in pipeline.feed(data):
+                pending.append((chunk, pipeline.submit(executor, chunk)))
+                if len(pending) >= max_pending:
+                    yield await finish()
+        for chunk in pipeline.close():
+            pending.append((chunk, pipeline.submit(executor, chunk)))
+        while pending:
+            yield await finish()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        logger.info("Пакетный расчёт завершён: %s", pipeline.stats)
+
+
+def make_executor(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    # spawn: процессы пула не наследуют потоки и соединения с БД родителя.
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                               mp_context=multiprocessing.get_context("spawn"))
+
+
+def main_cli(argv) -> int:
+    parser = argparse.ArgumentParser(description="Потоковый расчёт отправлений из CSV или NDJSON")
+    parser.add_argument("input", help="файл CSV/NDJSON или - для stdin")
+    parser.add_argument("-o", "--output", default="-", help="файл результата или - для stdout")
+    parser.add_argument("--format", choices=sorted(FORMATS), help="по умолчанию — по расширению входа")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--max-pending", type=int, default=0, help="пачек в работе; по умолчанию 2 × workers")
+    parser.add_argument("--save", action="store_true", help="сохранить лучшие предложения в БД (DELIVERIES_DB)")
+    parser.add_argument("--progress", type=float, default=5.0, help="интервал отчёта о ходе, с")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    fmt = args.format or detect_format(args.input)
+    persist = None
+    if args.save:
+        from main import db
+        persist = db.save_deliveries
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        with make_executor(args.workers) as executor:
+            pipeline = BulkPipeline(fmt, args.chunk_size, args.progress)
+            stats = run(source, out, pipeline, executor, persist, args.max_pending or 2 * args.workers)
+    except BulkError as e:
+        logger.error("%s", e)
+        return 2
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    logger.info("Готово: %s", stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
@@ -0,0 +1,112 @@
+"""Заглушки перевозчиков для проверки carriers.py без внешней сети.
+
+    python carrier_stub.py --port 9100 --write-config carriers.json
+    python carrier_stub.py --latency-ms 40 --jitter-ms 20 --slow-rate 0.05 --slow-ms 1500 \\
+        --profile "Boxberry=300" --profile "КИТ=50:0.3"
+
+Один процесс отвечает за всех перевозчиков: GET /<перевозчик>/quote?city=&weight=.
+Ответ задерживается на latency ± jitter; с вероятностью slow_rate — на
+slow_ms (хвост задержек, который срезает хеджирование); с вероятностью
+error_rate возвращается 503. --profile "Перевозчик=задержка_мс[:доля_ошибок]"
+задаёт задержку отдельного перевозчика.
+
+--write-config записывает carriers.json с адресами этой заглушки; путь к
+файлу для API задаётся переменной CARRIERS_FILE.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from typing import Dict, List, NamedTuple
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Query
+
+from pricing import CITY_INDEX, TARIFF_COMPANIES
+
+
+class StubProfile(NamedTuple):
+    latency: float
+    jitter: float = 0.0
+    slow_rate: float = 0.0
+    slow: float = 1.5
+    error_rate: float = 0.0
+
+    def delay(self, rng: random.Random) -> float:
+        if self.slow_rate and rng.random() < self.slow_rate:
+            return self.slow
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+
+def make_app(profiles: Dict[str, StubProfile], seed: int = 0) -> FastAPI:
+    app = FastAPI(title="Заглушки перевозчиков")
+    rng = random.Random(seed)
+    app.state.requests = {company: 0 for company in profiles}
+
+    @app.get("/{company}/quote")
+    async def quote(company: str, city: str = Query(...), weight: float = Query(..., gt=0)):
+        profile = profiles.get(company)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Перевозчик не найден")
+        app.state.requests[company] += 1
+
+        await asyncio.sleep(profile.delay(rng))
+        if profile.error_rate and rng.random() < profile.error_rate:
+            raise HTTPException(status_code=503, detail="Сервис перевозчика недоступен")
+
+        city_id = CITY_INDEX.resolve(city)
+        zone = CITY_INDEX.zone(city_id) if city_id is not None else 5
+        return {
+            "price": round((500 + weight * 50 + zone * 100) * rng.uniform(0.9, 1.1), 2),
+            "days": 2 + zone + int(weight / 10),
+        }
+
+    return app
+
+
+def parse_profiles(args) -> Dict[str, StubProfile]:
+    default = StubProfile(args.latency_ms / 1000, args.jitter_ms / 1000, args.slow_rate,
+                          args.slow_ms / 1000, args.error_rate)
+    profiles = {company: default for company in TARIFF_COMPANIES}
+    for spec in args.profile:
+        company, _, value = spec.partition("=")
+        latency, _, error_rate = value.partition(":")
+        profiles[company] = default._replace(
+            latency=float(latency) / 1000,
+            error_rate=float(error_rate) if error_rate else default.error_rate)
+    return profiles
+
+
+def write_config(path: str, base_url: str, companies: List[str], **options):
+    config = {
+        "budget_ms": options.pop("budget_ms", 800),
+        "carriers": [{"company": company, "url": f"{base_url}/{company}/quote", **options} for company in companies],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+
+def main_cli(argv) -> int:
+    parser = argparse.ArgumentParser(description="Заглушки HTTP API перевозчиков")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=1500)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--profile", action="append", default=[])
+    parser.add_argument("--write-config", metavar="PATH")
+    args = parser.parse_args(argv)
+
+    profiles = parse_profiles(args)
+    if args.write_config:
+        write_config(args.write_config, f"http://{args.host}:{args.port}", list(profiles))
+        print(f"Конфигурация перевозчиков записана: {args.write_config}")
+    uvicorn.run(make_app(profiles), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
@@ -0,0 +1,264 @@
+"""Опрос перевозчиков по HTTP для /api/tariffs.
+
+Перевозчики описываются в JSON-файле (путь в CARRIERS_FILE, по умолчанию
+carriers.json рядом с модулем; нет файла — опрос выключен и тарифы, как и
+раньше, только оцениваются):
+
+    {
+      "budget_ms": 800,
+      "max_connections": 100,
+      "max_keepalive": 20,
+      "carriers": [
+        {"company": "СДЭК", "url": "http://127.0.0.1:9100/СДЭК/quote",
+         "timeout_ms": 600, "hedge_ms": 150, "failure_threshold": 5, "reset_s": 30}
+      ]
+    }
+
+Все перевозчики опрашиваются одновременно через общий httpx.AsyncClient с
+пулом keep-alive соединений, поэтому время ответа определяется самым
+медленным перевозчиком, но не больше budget_ms. Для каждого перевозчика:
+
+  timeout_ms         — предел на запрос вместе с повтором;
+  hedge_ms           — если ответа нет за это время (или первый запрос
+                       упал), отправляется второй, берётся первый успешный;
+                       0 — без повторов;
+  failure_threshold  — столько ошибок подряд размыкают автомат: reset_s
+                       секунд перевозчик не опрашивается, затем один
+                       пробный запрос.
+
+Если перевозчик не ответил вовремя, ответил ошибкой или отключён
+автоматом, в выдачу идёт оценка из generate_tariffs_for_city с флагами
+is_price_restored и is_time_restored.
+"""
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import httpx
+
+from metrics import CARRIER_REQUEST_DURATION
+from models import TariffRow
+
+logger = logging.getLogger(__name__)
+
+CARRIERS_FILE = os.environ.get(
+    "CARRIERS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "carriers.json"))
+
+
+class CarrierConfig(NamedTuple):
+    company: str
+    url: str
+    timeout: float = 0.6
+    hedge_after: float = 0.15
+    failure_threshold: int = 5
+    reset_after: float = 30.0
+
+
+class CarrierError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Автомат: closed → open после failure_threshold ошибок подряд → half_open через reset_after."""
+
+    def __init__(self, failure_threshold: int, reset_after: float):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_after:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True  # пропускается один пробный запрос
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class CarrierAdapter:
+    """Запрос тарифа у одного перевозчика.
+
+    Формат — JSON-протокол заглушки carrier_stub.py: GET url?city=&weight=,
+    ответ {"price": ..., "days": ..., "tariff_type": ..., "cargo_type": ...}.
+    Адаптер реального API переопределяет params и parse.
+    """
+
+    def __init__(self, config: CarrierConfig):
+        self.config = config
+        self.breaker = CircuitBreaker(config.failure_threshold, config.reset_after)
+        self.stats = {"requests": 0, "hedged": 0, "ok": 0, "timeouts": 0, "errors": 0, "rejected": 0}
+
+    def params(self, city: str, weight: float) -> Dict[str, str]:
+        return {"city": city, "weight": str(weight)}
+
+    def parse(self, data: dict, estimate: TariffRow) -> TariffRow:
+        try:
+            return dataclasses.replace(
+                estimate,
+                price=round(float(data["price"]), 2),
+                days=int(data["days"]),
+                tariff_type=data.get("tariff_type", estimate.tariff_type),
+                cargo_type=data.get("cargo_type", estimate.cargo_type),
+                is_price_restored=False,
+                is_time_restored=False,
+                source_url=self.config.url,
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise CarrierError(f"неверный ответ: {e!r}") from e
+
+    async def _request(self, client: httpx.AsyncClient, params: Dict[str, str], timeout: float) -> dict:
+        self.stats["requests"] += 1
+        response = await client.get(self.config.url, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def _hedged(self, client: httpx.AsyncClient, params: Dict[str, str], timeout: float) -> dict:
+        """Первый успешный из не более чем двух запросов; второй — по hedge_after или после ошибки первого."""
+        pending = {asyncio.ensure_future(self._request(client, params, timeout))}
+        can_hedge = 0 < self.config.hedge_after < timeout
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=self.config.hedge_after if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if can_hedge and (not done or not pending):
+                    can_hedge = False
+                    self.stats["hedged"] += 1
+                    pending.add(asyncio.ensure_future(self._request(client, params, timeout)))
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def fetch(self, client: httpx.AsyncClient, city: str, weight: float,
+                    estimate: TariffRow, budget: float) -> TariffRow:
+        """Тариф перевозчика или оценка (estimate), если он не ответил в пределах timeout и budget."""
+        if not self.breaker.allow():
+            self.stats["rejected"] += 1
+            return restored(estimate)
+
+        timeout = min(self.config.timeout, budget)
+        started = time.perf_counter()
+        try:
+            data = await asyncio.wait_for(self._hedged(client, self.params(city, weight), timeout), timeout)
+            row = self.parse(data, estimate)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            self.stats["timeouts"] += 1
+        except (httpx.HTTPError, CarrierError, ValueError) as e:
+            outcome = "error"
+            self.stats["errors"] += 1
+            logger.debug("Перевозчик %s: %r", self.config.company, e)
+        else:
+            CARRIER_REQUEST_DURATION.observe(time.perf_counter() - started, (self.config.company, "ok"))
+            self.stats["ok"] += 1
+            self.breaker.record_success()
+            return row
+
+        CARRIER_REQUEST_DURATION.observe(time.perf_counter() - started, (self.config.company, outcome))
+        self.breaker.record_failure()
+        if self.breaker.state == "open":
+            logger.warning("Перевозчик %s отключён на %.0f с после ошибок подряд: %d",
+                           self.config.company, self.config.reset_after, self.breaker.failures)
+        return restored(estimate)
+
+
+def restored(estimate: TariffRow) -> TariffRow:
+    return dataclasses.replace(estimate, is_price_restored=True, is_time_restored=True)
+
+
+class CarrierGateway:
+    """Параллельный опрос всех настроенных перевозчиков через один пул соединений."""
+
+    def __init__(self, adapters: List[CarrierAdapter], budget: float = 0.8,
+                 max_connections: int = 100, max_keepalive: int = 20):
+        self.adapters: Dict[str, CarrierAdapter] = {a.config.company: a for a in adapters}
+        self.budget = budget
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_file(cls, path: str = CARRIERS_FILE) -> "CarrierGateway":
+        if not os.path.exists(path):
+            return cls([])
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+        adapters = [
+            CarrierAdapter(CarrierConfig(
+                company=c["company"],
+                url=c["url"],
+                timeout=c.get("timeout_ms", 600) / 1000,
+                hedge_after=c.get("hedge_ms", 150) / 1000,
+                failure_threshold=c.get("failure_threshold", 5),
+                reset_after=c.get("reset_s", 30.0),
+            ))
+            for c in raw.get("carriers", [])
+        ]
+        logger.info("Перевозчики из %s: %s", path, ", ".join(a.config.company for a in adapters) or "нет")
+        return cls(adapters, budget=raw.get("budget_ms", 800) / 1000,
+                   max_connections=raw.get("max_connections", 100), max_keepalive=raw.get("max_keepalive", 20))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.adapters)
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.budget)
+        return self._client
+
+    async def quote(self, city: str, weight: float, estimates: List[TariffRow]) -> List[TariffRow]:
+        """estimates с ценами и сроками перевозчиков вместо оценок, где ответ получен."""
+        client = self.client()
+
+        async def one(row: TariffRow) -> TariffRow:
+            adapter = self.adapters.get(row.company)
+            if adapter is None:
+                return row
+            return await adapter.fetch(client, city, weight, row, self.budget)
+
+        return list(await asyncio.gather(*(one(row) for row in estimates)))
+
+    def stats(self) -> Dict[tuple, float]:
+        result = {}
+        for company, adapter in self.adapters.items():
+            for stat, value in adapter.stats.items():
+                result[(company, stat)] = value
+            result[(company, "breaker_open")] = int(adapter.breaker.state != "closed")
+        return result
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,154 @@
+"""Журнал изменений доставок для инкрементальной синхронизации клиентов.
+
+Триггеры на delivery_rows пишут в delivery_changes по одной записи на
+доставку: вставка и изменение — «строка есть», удаление — надгробие
+(deleted = 1). REPLACE по delivery_id заменяет прежнюю запись новой с
+большим seq, поэтому журнал не растёт от повторных изменений одной строки, а
+клиент получает каждую доставку не больше одного раза, в её последнем
+состоянии. seq — AUTOINCREMENT: номера не переиспользуются даже после
+очистки, а порядок seq совпадает с порядком фиксации транзакций (запись в
+SQLite идёт по одной).
+
+Клиент хранит seq из последнего ответа и спрашивает изменения после него:
+
+    GET /api/deliveries/changes?since=<seq>&limit=1000
+
+Выборка идёт по первичному ключу журнала (seq > ?) и по PK delivery_rows,
+без просмотра таблицы доставок. Надгробия старше CHANGE_FEED_TOMBSTONE_DAYS
+удаляет фоновое задание retention.py (по частичному индексу, без просмотра
+журнала), а при очистке базы удаляется весь журнал. Граница (pruned_seq)
+хранится в change_feed_state: клиенту с 0 < since < pruned_seq отвечают
+reset — удалить локальную копию и синхронизироваться заново с since=0.
+"""
+import os
+from typing import List, NamedTuple
+
+import sqlite3
+
+from schema import SELECT_ROWS_COLUMNS
+
+TOMBSTONE_DAYS = int(os.environ.get("CHANGE_FEED_TOMBSTONE_DAYS", 30))
+
+CHANGE_FEED_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS delivery_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        delivery_id INTEGER NOT NULL UNIQUE,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS change_feed_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        pruned_seq INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO change_feed_state (id, pruned_seq) VALUES (1, 0)",
+    # Только надгробия: удаление старых не читает записи о живых строках.
+    "CREATE INDEX IF NOT EXISTS idx_changes_tombstones ON delivery_changes (changed_at) WHERE deleted = 1",
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_changes_insert AFTER INSERT ON delivery_rows
+    BEGIN
+        REPLACE INTO delivery_changes (delivery_id, deleted) VALUES (NEW.id, 0);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_changes_update AFTER UPDATE ON delivery_rows
+    BEGIN
+        REPLACE INTO delivery_changes (delivery_id, deleted) VALUES (NEW.id, 0);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_changes_delete AFTER DELETE ON delivery_rows
+    BEGIN
+        REPLACE INTO delivery_changes (delivery_id, deleted) VALUES (OLD.id, 1);
+    END
+    """,
+]
+
+# Журнал появился в уже заполненной базе: все строки — изменения с начала.
+BACKFILL_CHANGES_SQL = "INSERT OR IGNORE INTO delivery_changes (delivery_id) SELECT id FROM delivery_rows ORDER BY id"
+
+# ID берётся из журнала, у надгробия остальные столбцы — NULL (строки уже нет).
+SELECT_CHANGES_SQL = f"""
+    SELECT c.seq, c.deleted, c.delivery_id, {', '.join(f'r.{column}' for column in SELECT_ROWS_COLUMNS[1:])}
+    FROM delivery_changes c
+    LEFT JOIN delivery_rows r ON r.id = c.delivery_id
+    WHERE c.seq > ?
+    ORDER BY c.seq
+    LIMIT ?
+"""
+
+SELECT_CHANGES_STATE_SQL = """
+    SELECT pruned_seq, (SELECT seq FROM sqlite_sequence WHERE name = 'delivery_changes')
+    FROM change_feed_state
+"""
+
+# Граница — seq самого нового удаляемого надгробия; seq растёт вместе с changed_at,
+# поэтому это последняя запись индекса до границы (max(seq) шёл бы по PK с конца).
+RAISE_PRUNED_SEQ_SQL = """
+    UPDATE change_feed_state SET pruned_seq = max(pruned_seq, COALESCE((
+        SELECT seq FROM delivery_changes WHERE deleted = 1 AND changed_at < datetime('now', ?)
+        ORDER BY changed_at DESC, seq DESC LIMIT 1), 0))
+"""
+
+PRUNE_TOMBSTONES_SQL = "DELETE FROM delivery_changes WHERE deleted = 1 AND changed_at < datetime('now', ?)"
+
+# После очистки базы все надгробия сразу устаревают: клиенты начинают заново.
+RESET_CHANGES_SQL = [
+    """
+    UPDATE change_feed_state SET pruned_seq = COALESCE(
+        (SELECT seq FROM sqlite_sequence WHERE name = 'delivery_changes'), pruned_seq)
+    """,
+    "DELETE FROM delivery_changes",
+]
+
+
+class ChangeBatch(NamedTuple):
+    seq: int                # передать как since в следующем запросе
+    reset: bool             # since старше границы: локальную копию сбросить, запросить с since=seq (0)
+    has_more: bool          # ответ упёрся в limit, есть ещё изменения
+    rows: List[tuple]       # изменённые строки, столбцы SELECT_ROWS_COLUMNS с ID справочников
+    deleted: List[int]      # ID удалённых доставок
+
+
+def install(cursor: sqlite3.Cursor):
+    """Создать журнал; для существующей базы — заполнить его текущими строками."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'delivery_changes'")
+    missing = cursor.fetchone() is None
+    for sql in CHANGE_FEED_SCHEMA:
+        cursor.execute(sql)
+    if missing:
+        cursor.execute(BACKFILL_CHANGES_SQL)
+
+
+def read_changes(conn: sqlite3.Connection, since: int, limit: int) -> ChangeBatch:
+    rows = conn.execute(SELECT_CHANGES_SQL, (since, limit + 1)).fetchall()
+    # Границу читаем после изменений: если между запросами базу очистили,
+    # клиент получит reset и не пропустит удаления.
+    pruned_seq, last_seq = conn.execute(SELECT_CHANGES_STATE_SQL).fetchone()
+    last_seq = last_seq or 0
+    # since больше выданного — база пересоздана (например, после повреждения).
+    if 0 < since < pruned_seq or since > last_seq:
+        return ChangeBatch(0, True, False, [], [])
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return ChangeBatch(
+        rows[-1][0] if rows else since, False, has_more,
+        [row[2:] for row in rows if not row[1]],
+        [row[2] for row in rows if row[1]],
+    )
+
+
+def prune_tombstones(cursor: sqlite3.Cursor, days: int = TOMBSTONE_DAYS) -> int:
+    """Удалить надгробия старше days дней и поднять границу; вызывать в транзакции записи."""
+    age = f"-{days} days"
+    cursor.execute(RAISE_PRUNED_SEQ_SQL, (age,))
+    return cursor.execute(PRUNE_TOMBSTONES_SQL, (age,)).rowcount
+
+
+def reset(cursor: sqlite3.Cursor):
+    for sql in RESET_CHANGES_SQL:
+        cursor.execute(sql)
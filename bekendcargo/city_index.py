@@ -0,0 +1,73 @@
+from typing import Dict, List, Optional
+
+
+def normalize_city(name: str) -> str:
+    name = name.strip().lower().replace("ё", "е")
+    if name.startswith("г. "):
+        name = name[3:]
+    return " ".join(name.split())
+
+
+# Служебные слова в составных названиях пишутся строчными: «Ростов-на-Дону».
+LOWERCASE_PARTS = {"на"}
+
+
+def display_city(name: str) -> str:
+    """Название для ответов и записи в БД: «санкт-петербург» -> «Санкт-Петербург»."""
+    return " ".join(
+        "-".join(part if part in LOWERCASE_PARTS else part.capitalize() for part in word.split("-"))
+        for word in normalize_city(name).split()
+    )
+
+
+class CityIndex:
+    """Справочник городов с целочисленными ID.
+
+    Строится один раз при старте: все варианты написания (регистр, ё/е,
+    префикс «г. », псевдонимы) сводятся к ID, а разница зон для каждой пары
+    городов считается заранее. В горячем пути остаются только обращения к
+    словарю и к списку по индексу.
+    """
+
+    def __init__(self, zones: Dict[str, int], aliases: Optional[Dict[str, str]] = None):
+        self.names: List[str] = list(zones)
+        self.titles: List[str] = [display_city(name) for name in self.names]
+        self.zones: List[int] = [zones[name] for name in self.names]
+        self.size = len(self.names)
+        self._ids: Dict[str, int] = {}
+
+        for city_id, name in enumerate(self.names):
+            self._add_spellings(name, city_id)
+        for alias, name in (aliases or {}).items():
+            self._add_spellings(alias, self._ids[normalize_city(name)])
+
+        self.zone_diffs: List[int] = [
+            abs(z1 - z2) + 1 for z1 in self.zones for z2 in self.zones
+        ]
+
+    def _add_spellings(self, name: str, city_id: int):
+        normalized = normalize_city(name)
+        variants = (normalized, normalized.title(), normalized.capitalize(), normalized.upper())
+        for variant in variants:
+            self._ids.setdefault(variant, city_id)
+
+    def resolve(self, name: str) -> Optional[int]:
+        city_id = self._ids.get(name)
+        if city_id is None:
+            city_id = self._ids.get(normalize_city(name))
+        return city_id
+
+    def zone(self, city_id: int) -> int:
+        return self.zones[city_id]
+
+    def zone_diff(self, from_id: int, to_id: int) -> int:
+        return self.zone_diffs[from_id * self.size + to_id]
+
+    def title(self, city_id: int) -> str:
+        return self.titles[city_id]
+
+    def __contains__(self, name: str) -> bool:
+        return self.resolve(name) is not None
+
+    def __len__(self) -> int:
+        return self.size
@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Значения подобраны под нагрузку агрегатора: много коротких INSERT и редкие чтения.
+DEFAULT_PRAGMAS: Dict[str, Union[str, int]] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,       # ~16 МБ страничного кэша на соединение
+    "mmap_size": 64 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+}
+
+STATEMENT_CACHE_SIZE = 128
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True) -> Iterator[bool]:
+    """Межпроцессная блокировка на файле рядом с БД.
+
+    При blocking=False не ждёт: возвращает False, если блокировку держит
+    другой процесс (удобно для фоновых заданий, которые достаточно выполнить
+    в одном воркере).
+    """
+    with open(path, "a+b") as f:
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if blocking:
+                raise
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ConnectionPool:
+    """Долгоживущие соединения SQLite: одно на поток, с общими PRAGMA.
+
+    sqlite3 кэширует подготовленные выражения внутри соединения, поэтому
+    повторное использование соединения и одинаковых SQL-строк даёт
+    переиспользование prepared statements без дополнительного кода.
+    """
+
+    def __init__(self, db_path: str, pragmas: Dict[str, Union[str, int]] = None):
+        self.db_path = db_path
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._version_conn = None
+        # Транзакций, зафиксированных через transaction() в этом процессе.
+        self.commits = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение используется только своим потоком, но закрывать все
+        # соединения при остановке нужно из одного места.
+        conn = sqlite3.connect(
+            self.db_path,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+            with self._lock:
+                self.commits += 1
+
+    @contextmanager
+    def dedicated(self) -> Iterator[sqlite3.Connection]:
+        """Отдельное соединение для долгих потоковых чтений."""
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def data_version(self) -> int:
+        """Меняется после каждого коммита в файл — из этого процесса или из любого другого.
+
+        PRAGMA data_version не видит коммитов собственного соединения, поэтому
+        для неё держится отдельное соединение, которое ничего не пишет.
+        """
+        with self._lock:
+            if self._version_conn is None:
+                self._version_conn = self._connect()
+                self._connections.append(self._version_conn)
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._version_conn = None
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+        logger.info("Соединения с БД закрыты: %s", len(connections))
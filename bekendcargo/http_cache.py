@@ -0,0 +1,127 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class CachePolicy(NamedTuple):
+    cache_control: str
+    # Сколько секунд держать готовый ответ на сервере; 0 — всегда вызывать
+    # обработчик (например, если у него есть побочные эффекты).
+    ttl: float = 0.0
+    # Сбрасывать серверный кэш при изменении данных в БД.
+    vary_on_data: bool = False
+
+
+class _Entry(NamedTuple):
+    expires_at: float
+    status: int
+    headers: Headers
+    body: bytes
+    etag: bytes
+
+
+def make_etag(body: bytes) -> bytes:
+    return b'"' + hashlib.blake2b(body, digest_size=16).hexdigest().encode() + b'"'
+
+
+def etag_matches(if_none_match: Optional[bytes], etag: bytes) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(b","):
+        candidate = candidate.strip()
+        if candidate.startswith(b"W/"):
+            candidate = candidate[2:]
+        if candidate == b"*" or candidate == etag:
+            return True
+    return False
+
+
+class ResponseCacheMiddleware:
+    """ETag, 304 Not Modified и Cache-Control для выбранных маршрутов.
+
+    Для GET/HEAD ответ хешируется в ETag; если клиент прислал тот же ETag в
+    If-None-Match, тело не отправляется. Маршруты с ttl > 0 дополнительно
+    отдаются из серверного кэша без вызова обработчика, пока не истёк ttl
+    и не изменилась версия данных (data_version).
+    """
+
+    def __init__(self, app, policies: Dict[str, CachePolicy],
+                 data_version: Callable[[], Hashable] = lambda: 0, max_entries: int = 512):
+        self.app = app
+        self.policies = policies
+        self.data_version = data_version
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        policy = self.policies.get(scope.get("path")) if scope["type"] == "http" else None
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        cache_control = (b"cache-control", policy.cache_control.encode())
+        if scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, self._with_headers(send, [cache_control]))
+            return
+
+        if_none_match = dict(scope["headers"]).get(b"if-none-match")
+        key = (scope["path"], scope["query_string"], self.data_version() if policy.vary_on_data else None)
+
+        entry = self._entries.get(key) if policy.ttl > 0 else None
+        if entry is not None and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(key)
+            await self._send_entry(send, entry, if_none_match, scope["method"])
+            return
+
+        status, headers, chunks = await self._capture(scope, receive)
+        body = b"".join(chunks)
+        headers = [(k, v) for k, v in headers if k.lower() not in (b"etag", b"cache-control")]
+        etag = make_etag(body)
+        headers += [(b"etag", etag), cache_control]
+        entry = _Entry(time.monotonic() + policy.ttl, status, headers, body, etag)
+
+        if status == 200 and policy.ttl > 0:
+            self._store(key, entry)
+        await self._send_entry(send, entry, if_none_match if status == 200 else None, scope["method"])
+
+    async def _capture(self, scope, receive) -> Tuple[int, Headers, List[bytes]]:
+        start = {}
+        chunks: List[bytes] = []
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture_send)
+        return start["status"], list(start.get("headers", [])), chunks
+
+    async def _send_entry(self, send, entry: _Entry, if_none_match: Optional[bytes], method: str):
+        if etag_matches(if_none_match, entry.etag):
+            headers = [(k, v) for k, v in entry.headers if k in (b"etag", b"cache-control", b"vary")]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": entry.status, "headers": entry.headers})
+        await send({"type": "http.response.body", "body": b"" if method == "HEAD" else entry.body})
+
+    def _store(self, key: tuple, entry: _Entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _with_headers(send, extra: Headers):
+        names = {k for k, _ in extra}
+
+        async def wrapped(message):
+            if message["type"] == "http.response.start":
+                headers = [(k, v) for k, v in message.get("headers", []) if k.lower() not in names]
+                message = {**message, "headers": headers + extra}
+            await send(message)
+        return wrapped
@@ -0,0 +1,184 @@
+"""Проверка целостности базы без задержки старта.
+
+При запуске проверяется только заголовок файла и читается схема — это
+не зависит от размера базы. Полный PRAGMA integrity_check выполняется в
+фоновом потоке на отдельном соединении только для чтения и повторяется
+каждые INTEGRITY_CHECK_INTERVAL_H часов, пока работает процесс. Результат
+пишется рядом с базой (<db>.integrity.json), поэтому его видят все воркеры:
+проверку выполняет один из них, остальные отдают её результат в /api/health
+и метрике integrity_check. При остановке идущая проверка прерывается.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from db_pool import file_lock
+
+logger = logging.getLogger(__name__)
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+MAX_REPORTED_ERRORS = 10
+# Пауза перед повтором, если проверку сейчас выполняет другой воркер.
+RETRY_SECONDS = 60.0
+
+
+def check_header(path: str) -> Optional[str]:
+    """Описание проблемы с заголовком файла SQLite или None, если он корректен."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return None  # пустой файл SQLite считает пустой базой
+    if size < 100:
+        return f"файл слишком мал для базы SQLite ({size} байт)"
+
+    with open(path, "rb") as f:
+        header = f.read(100)
+    if header[:16] != SQLITE_MAGIC:
+        return "нет сигнатуры SQLite"
+
+    page_size = int.from_bytes(header[16:18], "big")
+    page_size = 65536 if page_size == 1 else page_size
+    if page_size < 512 or page_size & (page_size - 1):
+        return f"некорректный размер страницы {page_size}"
+    if header[18] not in (1, 2) or header[19] not in (1, 2):
+        return "неизвестная версия формата"
+    if header[21:24] != b"\x40\x20\x20":
+        return "некорректные параметры заполнения страниц"
+    if size % page_size:
+        return f"размер файла {size} не кратен размеру страницы {page_size}"
+    return None
+
+
+def backup_corrupt(path: str) -> str:
+    """Переименовать повреждённую базу вместе с -wal/-shm, вернуть новое имя."""
+    backup = f"{path}.corrupt-{datetime.now():%Y%m%d-%H%M%S}"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.replace(path + suffix, backup + suffix)
+    return backup
+
+
+class IntegrityMonitor:
+    def __init__(self, db_path: str, interval_hours: float = 24.0, retry_seconds: float = RETRY_SECONDS):
+        self.db_path = db_path
+        self.interval = interval_hours * 3600
+        self.retry_seconds = retry_seconds
+        self.report_path = f"{db_path}.integrity.json"
+        self._state: Dict = {"state": "pending"}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="integrity-check", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить проверки; идущая прерывается, её результат не сохраняется."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        conn = self._conn
+        if conn is not None:
+            try:
+                conn.interrupt()
+            except sqlite3.ProgrammingError:
+                pass  # проверка уже закончилась и закрыла соединение
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            report = self.run()
+            # Следующая проверка — через interval после последней, чьей бы она ни была.
+            finished_ts = report.get("finished_ts")
+            wait = finished_ts + self.interval - time.time() if finished_ts else 0
+            self._stop.wait(max(wait, self.retry_seconds))
+
+    def _last_report(self) -> Optional[Dict]:
+        try:
+            with open(self.report_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_report(self, report: Dict):
+        tmp = f"{self.report_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False)
+        os.replace(tmp, self.report_path)
+
+    def run(self) -> Dict:
+        last = self._last_report()
+        if last and time.time() - last.get("finished_ts", 0) < self.interval:
+            return last
+
+        with file_lock(f"{self.db_path}.check.lock", blocking=False) as acquired:
+            if not acquired:
+                return self.status()  # проверку уже выполняет другой воркер
+            return self._check()
+
+    def _check(self) -> Dict:
+        previous = self._state
+        self._state = {"state": "running", "started_at": datetime.now().isoformat()}
+        started = time.perf_counter()
+        try:
+            conn = self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            try:
+                rows = conn.execute(f"PRAGMA integrity_check({MAX_REPORTED_ERRORS})").fetchall()
+            finally:
+                self._conn = None
+                conn.close()
+            errors = [row[0] for row in rows if row[0] != "ok"]
+            state = "ok" if not errors else "failed"
+        except sqlite3.Error as e:
+            if self._stop.is_set():
+                self._state = previous
+                logger.info("Проверка целостности БД прервана остановкой")
+                return previous
+            errors, state = [str(e)], "error"
+
+        report = {
+            "state": state,
+            "started_at": self._state["started_at"],
+            "finished_at": datetime.now().isoformat(),
+            "finished_ts": time.time(),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "errors": errors,
+        }
+        self._state = report
+        try:
+            self._save_report(report)
+        except OSError as e:
+            logger.warning("Не удалось сохранить результат проверки целостности: %s", e)
+
+        if state == "ok":
+            logger.info("Проверка целостности БД завершена за %s мс", report["duration_ms"])
+        else:
+            logger.error("Проверка целостности БД: %s %s", state, errors)
+        return report
+
+    def status(self) -> Dict:
+        state = self._state
+        if state["state"] == "running":
+            return state
+        # Проверку мог выполнить другой воркер: отдаём самый свежий результат.
+        last = self._last_report()
+        if last is not None and last.get("finished_ts", 0) > state.get("finished_ts", 0):
+            return last
+        return state
+
+    def metrics(self) -> Dict[Tuple[str], float]:
+        report = self.status()
+        return {
+            ("ok",): int(report["state"] == "ok"),
+            ("errors",): len(report.get("errors", ())),
+            ("duration_ms",): report.get("duration_ms", 0),
+            ("last_check_ts",): report.get("finished_ts", 0),
+        }
@@ -1,171 +1,524 @@
-from fastapi import FastAPI, HTTPException, Query
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Literal, Dict
-import random
+from typing import AsyncIterator, Callable, Iterator, List, NamedTuple, Optional, Literal, Dict, Tuple
+import asyncio
+import base64
+import gzip
+import hmac
+import dataclasses
+import csv
+import io
+import json
+import math
 import sqlite3
 import logging
 import os
-from datetime import datetime
+import time
+from datetime import date, datetime, timedelta
+
+from async_db import AsyncDeliveryDB
+from city_index import normalize_city
+from db_pool import ConnectionPool, file_lock
+from http_cache import CachePolicy, ResponseCacheMiddleware
+from integrity import IntegrityMonitor, backup_corrupt, check_header
+from metrics import OFFERS_COMPUTED, REGISTRY, WRITES_COALESCED, GaugeFunc, MetricsMiddleware, timed_db
+from batch_quote import quote_batch, to_columns
+import bulk_quote
+from carriers import CarrierGateway
+import change_feed
+from models import (
+    BatchQuoteRequest, BatchQuoteResponse, SearchResponse, SearchResult, TariffsRequest, TariffsResponse,
+    TariffsResult,
+)
+from pricing import (
+    BOX_DIMENSIONS, CITY_INDEX, PRICE_GRID, BoxSize,
+    generate_tariffs_for_city, get_offers, quote_rng, resolve_route, weight_bucket,
+)
+from quote_cache import CachedQuote, QuoteCache
+from rate_limit import RateLimiter, RateLimitMiddleware
+from migrate_compact import CompactMigration
+from retention import RetentionJob, RetentionPolicy
+from serialization import dumps, render
+from single_flight import SingleFlight
+from schema import DELIVERY_SCHEMA, REBUILD_STATS_SQL, SELECT_ROWS_COLUMNS, STATS_SCHEMA, Dictionary
+import tariff_engine
+from text_quote import QuoteError, format_quote, quote_text
+from write_behind import DeliveryRecord, WriteBehindQueue
 
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+INSERT_DELIVERY_SQL = """
+    INSERT INTO delivery_rows
+    (company_id, tariff_id, weight, size_id, town_from_id, town_to_id, price, delivery_time, is_completed)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+"""
+
+INSERT_DELIVERY_RETURNING_SQL = INSERT_DELIVERY_SQL + " RETURNING id"
+
+SELECT_ALL_DELIVERIES_SQL = f"""
+    SELECT {', '.join(SELECT_ROWS_COLUMNS)}
+    FROM delivery_rows
+    ORDER BY created_at DESC
+"""
+
+DELIVERY_COLUMNS = [
+    "id", "company", "delivery_type", "weight", "size",
+    "town_from", "town_to", "price", "delivery_time", "is_completed",
+    "created_at",
+]
+
+# Читается delivery_rows, имена подставляет Dictionary.decode_rows.
+SELECT_DELIVERIES_PAGE_SQL = f"SELECT {', '.join(SELECT_ROWS_COLUMNS)} FROM delivery_rows"
+
+# Число строк берётся из сводной таблицы stats_company (см. schema.STATS_SCHEMA),
+# а не полным COUNT(*) по delivery_rows.
+COUNT_DELIVERIES_SQL = "SELECT COALESCE(SUM(count), 0) FROM stats_company"
+
+CONFIRM_DELIVERY_SQL = f"""
+    SELECT EXISTS (SELECT 1 FROM delivery_rows WHERE id = ?), ({COUNT_DELIVERIES_SQL})
+"""
+
+# Группировка идёт по целочисленным ID, имена подставляются к готовым группам.
+STATS_BY_COMPANY_SQL = {
+    "summary": "SELECT company, count, total_price FROM stats_company ORDER BY count DESC, company",
+    "group_by": """
+        SELECT c.name, g.count, g.total_price
+        FROM (SELECT company_id, COUNT(*) AS count, SUM(price) AS total_price
+              FROM delivery_rows GROUP BY company_id) g
+        JOIN carriers c ON c.id = g.company_id
+        ORDER BY g.count DESC, c.name
+    """,
+}
+
+STATS_BY_CITY_SQL = {
+    "summary": "SELECT town_to, count FROM stats_city ORDER BY count DESC, town_to",
+    "group_by": """
+        SELECT c.name, g.count
+        FROM (SELECT town_to_id, COUNT(*) AS count FROM delivery_rows GROUP BY town_to_id) g
+        JOIN cities c ON c.id = g.town_to_id
+        ORDER BY g.count DESC, c.name
+    """,
+}
+
+# Поиск ID значения справочника по имени: (таблица, имя) -> ID или None.
+Lookup = Callable[[str, str], Optional[int]]
+
+class DeliveryFilters(NamedTuple):
+    company: Optional[str] = None
+    town_from: Optional[str] = None
+    town_to: Optional[str] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    is_completed: Optional[bool] = None
+
+    def where(self, lookup: Lookup) -> Tuple[List[str], List]:
+        clauses, params = [], []
+        # Значения, которых нет в справочнике, ни с одной строкой не совпадут.
+        if self.company:
+            clauses.append("company_id = ?")
+            params.append(lookup("carriers", self.company) or -1)
+        for column in ("town_from", "town_to"):
+            town = getattr(self, column)
+            if town:
+                clauses.append(f"{column}_id = ?")
+                params.append(lookup("cities", town if town.startswith("г. ") else f"г. {town}") or -1)
+        if self.date_from:
+            clauses.append("created_at >= ?")
+            params.append(self.date_from.isoformat())
+        if self.date_to:
+            clauses.append("created_at < ?")
+            params.append((self.date_to + timedelta(days=1)).isoformat())
+        if self.is_completed is not None:
+            clauses.append("is_completed = ?")
+            params.append(int(self.is_completed))
+        return clauses, params
+
+def deliveries_query(filters: DeliveryFilters, lookup: Lookup,
+                     cursor: Optional[str] = None) -> Tuple[str, List]:
+    """SELECT для ленты и выгрузки: фильтры, keyset-курсор, порядок от новых к старым."""
+    clauses, params = filters.where(lookup)
+    if cursor:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    sql = SELECT_DELIVERIES_PAGE_SQL
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return sql + " ORDER BY created_at DESC, id DESC", params
+
+def encode_cursor(created_at: str, delivery_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{delivery_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        created_at, delivery_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return created_at, int(delivery_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+# Как часто HTTP-кэш проверяет записи других процессов (serve.py с несколькими воркерами).
+DATA_VERSION_INTERVAL = float(os.environ.get("DATA_VERSION_INTERVAL_MS", 500)) / 1000
+
 class DeliveryDB:
-    def __init__(self, db_path: str = "deliveries.db"):
+    def __init__(self, db_path: str = "deliveries.db", check_integrity: bool = True):
         self.db_path = db_path
-        self.init_db()
+        self.dictionary = Dictionary()
+        started = time.perf_counter()
+        # Несколько воркеров могут стартовать одновременно: проверка, пересоздание
+        # файла и миграции схемы выполняются строго по очереди.
+        with file_lock(f"{db_path}.lock"):
+            self.init_db(check_integrity)
+        self.pool = ConnectionPool(db_path)
+        self._file_version = (float("-inf"), 0)  # (когда прочитана, PRAGMA data_version)
+        self.startup_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info("База данных готова: %s за %s мс", db_path, self.startup_ms)
+
+    @property
+    def data_version(self) -> Tuple[int, int]:
+        """Версия данных для HTTP-кэша; учитывает записи других процессов.
+
+        Свои коммиты меняют её сразу (pool.commits), чужие — через PRAGMA
+        data_version, которая читается не чаще раза в DATA_VERSION_INTERVAL_MS:
+        цикл событий не обращается к SQLite на каждый кэшируемый запрос.
+        """
+        checked_at, file_version = self._file_version
+        now = time.monotonic()
+        if now - checked_at >= DATA_VERSION_INTERVAL:
+            file_version = self.pool.data_version()
+            self._file_version = (now, file_version)
+        return self.pool.commits, file_version
 
-    def init_db(self):
-        conn = None
-        try:
-            conn = sqlite3.connect(f"file:{self.db_path}?mode=rw", uri=True)
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA integrity_check")
-            result = cursor.fetchone()[0]
+    def lookup(self, table: str, name: str) -> Optional[int]:
+        """ID значения справочника без его создания (для фильтров)."""
+        return self.dictionary.lookup(self.pool.connection(), table, name)
 
-            if result != "ok":
-                logger.warning(f"База повреждена: {result}. Пересоздаём...")
+    def _open_checked(self) -> sqlite3.Connection:
+        """Проверка за постоянное время: заголовок файла и чтение схемы.
+
+        Полный integrity_check выполняет IntegrityMonitor в фоне.
+        """
+        if not os.path.exists(self.db_path):
+            return sqlite3.connect(self.db_path)
+
+        problem = check_header(self.db_path)
+        if problem is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=rw", uri=True)
+            try:
+                conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+                return conn
+            except sqlite3.OperationalError:
+                # Блокировка или ошибка ввода-вывода — не повод считать файл повреждённым.
                 conn.close()
-                if os.path.exists(self.db_path):
-                    os.remove(self.db_path)
-                conn = sqlite3.connect(self.db_path)
-            else:
-                logger.info("База данных цела")
-
-        except Exception as e:
-            logger.warning(f"Ошибка проверки БД: {e}. Пересоздаём...")
-            if conn:
+                raise
+            except sqlite3.DatabaseError as e:
                 conn.close()
-            if os.path.exists(self.db_path):
-                os.remove(self.db_path)
-            conn = sqlite3.connect(self.db_path)
+                problem = str(e)
+
+        backup = backup_corrupt(self.db_path)
+        logger.warning("База повреждена: %s. Файл сохранён как %s, создаём новую", problem, backup)
+        return sqlite3.connect(self.db_path)
 
+    def init_db(self, check_integrity: bool = True):
+        conn = self._open_checked() if check_integrity else sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        cursor.execute("SELECT count(*) FROM sqlite_master")
+        if cursor.fetchone()[0] == 0:
+            # Только для новой базы: страницы, освобождённые при переносе в архив,
+            # возвращаются файлу через incremental_vacuum (см. retention.py).
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'deliveries'")
+        if cursor.fetchone() is not None:
+            # База прежней версии с текстовыми столбцами: переводим на справочники
+            # сразу при старте (воркеры новой версии ждут блокировку). Без
+            # остановки сервиса базу заранее переводит `python migrate_compact.py`.
+            conn.commit()
+            logger.warning("База в прежнем формате, переводим на справочники")
+            CompactMigration(self.db_path).run()
 
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS deliveries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            company TEXT NOT NULL,
-            delivery_type TEXT NOT NULL,
-            weight REAL NOT NULL CHECK (weight > 0),
-            size TEXT NOT NULL,
-            town_from TEXT NOT NULL,
-            town_to TEXT NOT NULL,
-            price REAL NOT NULL CHECK (price >= 0),
-            delivery_time INTEGER NOT NULL CHECK (delivery_time > 0),
-            is_completed INTEGER NOT NULL DEFAULT 0,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
+        for schema_sql in DELIVERY_SCHEMA:
+            cursor.execute(schema_sql)
 
-        indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_delivery_type ON deliveries(delivery_type)",
-            "CREATE INDEX IF NOT EXISTS idx_town_from ON deliveries(town_from)",
-            "CREATE INDEX IF NOT EXISTS idx_town_to ON deliveries(town_to)",
-            "CREATE INDEX IF NOT EXISTS idx_company ON deliveries(company)",
-            "CREATE INDEX IF NOT EXISTS idx_created_at ON deliveries(created_at)",
-        ]
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_company'")
+        stats_missing = cursor.fetchone() is None
+        for stats_sql in STATS_SCHEMA:
+            cursor.execute(stats_sql)
+        if stats_missing:
+            self._rebuild_statistics(cursor)
 
-        for idx_sql in indexes:
-            try:
-                cursor.execute(idx_sql)
-            except sqlite3.Error as e:
-                logger.warning(f"Пропуск индекса: {e}")
+        change_feed.install(cursor)
 
         conn.commit()
         conn.close()
-        logger.info(f"База данных готова: {self.db_path}")
 
+    @timed_db
     def save_delivery(self, company: str, delivery_type: str, weight: float, size: str,
                       town_from: str, town_to: str, price: float, days: int) -> int:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         try:
-            cursor.execute('''
-                INSERT INTO deliveries
-                (company, delivery_type, weight, size, town_from, town_to, price, delivery_time, is_completed)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
-            ''', (company, delivery_type, weight, size, f"г. {town_from}", f"г. {town_to}", price, days))
-
-            delivery_id = cursor.lastrowid
-            conn.commit()
+            # Справочники пополняются до транзакции записи (см. Dictionary.encode).
+            row = self.dictionary.encode_row(self.pool.connection(), company, delivery_type, weight, size,
+                                             f"г. {town_from}", f"г. {town_to}", price, days)
+            with self.pool.transaction() as conn:
+                delivery_id = conn.execute(INSERT_DELIVERY_RETURNING_SQL, row).fetchone()[0]
 
-            logger.info(f"Сохранено ID {delivery_id}: {company} | {price}₽ | {town_from} → {town_to}")
+            logger.info("Сохранено ID %s: %s | %s₽ | %s → %s", delivery_id, company, price, town_from, town_to)
             return delivery_id
 
         except sqlite3.Error as e:
-            logger.error(f"Ошибка сохранения в БД: {e}")
+            logger.error("Ошибка сохранения в БД: %s", e)
             raise
-        finally:
-            conn.close()
-
-    def get_all_deliveries(self) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
 
+    @timed_db
+    def save_deliveries(self, records: List[DeliveryRecord]) -> int:
         try:
-            cursor.execute("""
-                SELECT
-                    id, company, delivery_type, weight, size,
-                    town_from, town_to, price, delivery_time, is_completed,
-                    created_at
-                FROM deliveries
-                ORDER BY created_at DESC
-            """)
+            encode_conn = self.pool.connection()
+            rows = [
+                self.dictionary.encode_row(encode_conn, r.company, r.delivery_type, r.weight, r.size,
+                                           f"г. {r.town_from}", f"г. {r.town_to}", r.price, r.days)
+                for r in records
+            ]
+            with self.pool.transaction() as conn:
+                conn.executemany(INSERT_DELIVERY_SQL, rows)
+
+            logger.info("Сохранено пачкой: %s записей", len(rows))
+            return len(rows)
 
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
+        except sqlite3.Error as e:
+            logger.error("Ошибка пакетного сохранения в БД: %s", e)
+            raise
 
-            return [dict(zip(columns, row)) for row in rows]
+    @timed_db
+    def get_all_deliveries(self) -> List[Dict]:
+        try:
+            conn = self.pool.connection()
+            rows = self.dictionary.decode_rows(conn, conn.execute(SELECT_ALL_DELIVERIES_SQL).fetchall())
+            return [dict(zip(DELIVERY_COLUMNS, row)) for row in rows]
 
         except sqlite3.Error as e:
-            logger.error(f"Ошибка получения данных: {e}")
+            logger.error("Ошибка получения данных: %s", e)
             return []
-        finally:
-            conn.close()
 
+    @timed_db
+    def get_deliveries_page(self, filters: DeliveryFilters, limit: int = 100,
+                            cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Страница доставок от новых к старым с keyset-курсором по (created_at, id)."""
+        sql, params = deliveries_query(filters, self.lookup, cursor)
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+        conn = self.pool.connection()
+        rows = self.dictionary.decode_rows(conn, conn.execute(sql, params).fetchall())
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last[-1], last[0])
+        return [dict(zip(DELIVERY_COLUMNS, row)) for row in rows], next_cursor
+
+    def iter_deliveries(self, filters: DeliveryFilters, chunk_size: int = 1000) -> Iterator[List[tuple]]:
+        """Доставки пачками из серверного курсора, без загрузки всей выборки в память."""
+        sql, params = deliveries_query(filters, self.lookup)
+        with self.pool.dedicated() as conn:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield self.dictionary.decode_rows(conn, rows)
+
+    @timed_db
+    def get_changes(self, since: int, limit: int = 1000) -> change_feed.ChangeBatch:
+        """Изменения после since для синхронизации клиентов (см. change_feed.py)."""
+        conn = self.pool.connection()
+        batch = change_feed.read_changes(conn, since, limit)
+        return batch._replace(rows=self.dictionary.decode_rows(conn, batch.rows))
+
+    @timed_db
     def get_deliveries_count(self) -> int:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         try:
-            cursor.execute("SELECT COUNT(*) FROM deliveries")
-            count = cursor.fetchone()[0]
-            return count
+            return self.pool.connection().execute(COUNT_DELIVERIES_SQL).fetchone()[0]
         except sqlite3.Error as e:
-            logger.error(f"Ошибка подсчёта записей: {e}")
+            logger.error("Ошибка подсчёта записей: %s", e)
             return 0
-        finally:
-            conn.close()
 
-    def clear_deliveries(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    @staticmethod
+    def _rebuild_statistics(cursor: sqlite3.Cursor):
+        for sql in REBUILD_STATS_SQL:
+            cursor.execute(sql)
+        logger.info("Сводная статистика пересчитана")
+
+    @timed_db
+    def rebuild_statistics(self):
+        with self.pool.transaction() as conn:
+            self._rebuild_statistics(conn.cursor())
 
+    @timed_db
+    def get_statistics(self, source: str = "summary") -> Optional[Dict]:
+        """Статистика для /api/statistics.
+
+        source="summary" читает сводные таблицы, "group_by" агрегирует
+        delivery_rows напрямую (для сверки и бенчмарков).
+        """
         try:
-            cursor.execute("DELETE FROM deliveries")
-            conn.commit()
+            conn = self.pool.connection()
+            by_company = conn.execute(STATS_BY_COMPANY_SQL[source]).fetchall()
+            by_city = conn.execute(STATS_BY_CITY_SQL[source]).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Ошибка расчёта статистики: %s", e)
+            return None
+
+        total_count = sum(count for _, count, _ in by_company)
+        if not total_count:
+            return None
+        total_price = sum(price for _, _, price in by_company)
+
+        return {
+            "total_deliveries": total_count,
+            "average_price": round(total_price / total_count, 2),
+            "total_value": round(total_price, 2),
+            "by_company": {
+                company: {
+                    "count": count,
+                    "avg_price": round(price / count, 2)
+                }
+                for company, count, price in by_company
+            },
+            "by_city": {
+                city: {"count": count}
+                for city, count in by_city
+            }
+        }
+
+    @timed_db
+    def confirm_delivery(self, delivery_id: int) -> Tuple[bool, int]:
+        """Проверить, что запись с delivery_id есть в БД, и вернуть общее число записей."""
+        try:
+            exists, count = self.pool.connection().execute(CONFIRM_DELIVERY_SQL, (delivery_id,)).fetchone()
+            return bool(exists), count
+        except sqlite3.Error as e:
+            logger.error("Ошибка проверки записи %s: %s", delivery_id, e)
+            return False, 0
+
+    @timed_db
+    def clear_deliveries(self):
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute("DELETE FROM delivery_rows")
+                # Надгробия всех строк не нужны: клиенты получат reset и начнут с нуля.
+                change_feed.reset(conn.cursor())
             logger.info("База данных очищена")
             return True
         except sqlite3.Error as e:
-            logger.error(f"Ошибка очистки БД: {e}")
+            logger.error("Ошибка очистки БД: %s", e)
             return False
-        finally:
-            conn.close()
 
-db = DeliveryDB("deliveries.db")
+    def close(self):
+        try:
+            # Обновляет статистику планировщика по изменившимся таблицам; обычно мгновенно.
+            self.pool.connection().execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            logger.warning("PRAGMA optimize не выполнен: %s", e)
+        self.pool.close_all()
+
+DB_PATH = os.environ.get("DELIVERIES_DB", "deliveries.db")
+# serve.py проверяет и готовит базу один раз до запуска воркеров.
+db = DeliveryDB(DB_PATH, check_integrity=os.environ.get("DELIVERIES_DB_PREPARED") != "1")
+adb = AsyncDeliveryDB(db, max_workers=int(os.environ.get("DB_THREADS", 4)))
+retention = RetentionJob(db.pool, RetentionPolicy.from_env(DB_PATH))
+integrity = IntegrityMonitor(DB_PATH, interval_hours=float(os.environ.get("INTEGRITY_CHECK_INTERVAL_H", 24)))
+
+writer = WriteBehindQueue(
+    adb.save_deliveries,
+    max_batch=int(os.environ.get("WRITE_BATCH_SIZE", 200)),
+    flush_interval=int(os.environ.get("WRITE_FLUSH_INTERVAL_MS", 50)) / 1000,
+    max_queue=int(os.environ.get("WRITE_QUEUE_SIZE", 10000)),
+)
+
+quote_cache = QuoteCache(
+    maxsize=int(os.environ.get("QUOTE_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("QUOTE_CACHE_TTL", 300)),
+)
+
+# Одинаковые расчёты (ключ кэша — нормализованные параметры) объединяются,
+# пока идёт первый. COALESCE_WINDOW_MS > 0 продлевает объединение на это время
+# после него; повторы в окне не пишут доставки в БД, поэтому окно выключено по умолчанию.
+flights = {
+    route: SingleFlight(window=int(os.environ.get("COALESCE_WINDOW_MS", 0)) / 1000)
+    for route in ("calculate", "tariffs")
+}
+
+# Ограничение частоты для маршрутов, которые пишут в БД; RATE_LIMIT_RPS=0 — без ограничения.
+limiter = RateLimiter(
+    rate=float(os.environ.get("RATE_LIMIT_RPS", 10)),
+    burst=float(os.environ.get("RATE_LIMIT_BURST", 30)),
+)
+
+# Тарифы перевозчиков по HTTP (carriers.json); без файла — только оценки.
+carriers = CarrierGateway.from_file()
+
+# Токен служебных маршрутов (заголовок X-Admin-Token); пустой — маршруты выключены.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Пул процессов пакетного расчёта (/api/calculate/bulk) создаётся при первой загрузке.
+BULK_WORKERS = int(os.environ.get("BULK_WORKERS", 0)) or os.cpu_count() or 1
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 2000))
+bulk_executor = None
+bulk_stats = {"uploads": 0, "rows": 0, "errors": 0, "saved": 0}
+
+# Ответ /api/deliveries/changes сжимается gzip, если клиент его принимает и тело не меньше порога.
+CHANGES_GZIP_MIN_SIZE = int(os.environ.get("CHANGES_GZIP_MIN_SIZE", 1024))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    writer.start()
+    if os.environ.get("INTEGRITY_CHECK", "background") == "background":
+        integrity.start()
+    retention.start(adb.run)
+    yield
+    integrity.stop()
+    await retention.stop()
+    await writer.stop()
+    await carriers.close()
+    if bulk_executor is not None:
+        bulk_executor.shutdown(cancel_futures=True)
+    adb.close()
 
 app = FastAPI(
     title="Delivery Aggregator API",
     description="Агрегатор доставки по 50 крупнейшим городам России с сохранением в БД",
     version="2.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan
+)
+
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=limiter,
+    paths=["/api/calculate", "/api/calculate/bulk", "/api/tariffs", "/api/test-calc"],
+    client_header=os.environ.get("RATE_LIMIT_CLIENT_HEADER"),
+)
+
+app.add_middleware(
+    ResponseCacheMiddleware,
+    policies={
+        "/api/health": CachePolicy("no-cache", ttl=2, vary_on_data=True),
+        "/api/statistics": CachePolicy("no-cache", ttl=60, vary_on_data=True),
+        # Обработчики расчёта пишут предложения в БД, поэтому их не кэшируем
+        # на сервере — только экономим трафик через ETag.
+        "/api/cities": CachePolicy("public, max-age=3600", ttl=3600),
+        "/api/calculate": CachePolicy("private, no-cache"),
+        "/api/tariffs": CachePolicy("private, no-cache"),
+    },
+    data_version=lambda: db.data_version,
 )
 
 app.add_middleware(
@@ -176,256 +529,72 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-BoxSize = Literal["XS", "S", "M", "L", "XL", "XXL", "XXXL", "XXXXL"]
-BOX_DIMENSIONS = {
-    "XS": {"name": "XS (документы)", "dims": (20, 15, 5), "max_weight": 0.5},
-    "S": {"name": "S (маленькая)", "dims": (30, 20, 15), "max_weight": 2},
-    "M": {"name": "M (средняя)", "dims": (40, 30, 25), "max_weight": 5},
-    "L": {"name": "L (стандартная)", "dims": (53, 38, 28), "max_weight": 10},
-    "XL": {"name": "XL (большая)", "dims": (60, 40, 40), "max_weight": 15},
-    "XXL": {"name": "XXL (очень большая)", "dims": (80, 60, 50), "max_weight": 25},
-    "XXXL": {"name": "XXXL (грузовое)", "dims": (120, 80, 80), "max_weight": 40},
-    "XXXXL": {"name": "XXXXL (паллета)", "dims": (120, 80, 150), "max_weight": 500},
-}
-
-CITIES = {
-    "москва": 1, "санкт-петербург": 2, "калининград": 2, "нижний новгород": 3, "казань": 3,
-    "самара": 3, "волгоград": 3, "ростов-на-дону": 4, "краснодар": 4, "воронеж": 4,
-    "сочи": 4, "ставрополь": 4, "екатеринбург": 5, "челябинск": 5, "тюмень": 5,
-    "пермь": 5, "уфа": 5, "новосибирск": 6, "омск": 6, "томск": 6, "барнаул": 6,
-    "кемерово": 6, "красноярск": 7, "иркутск": 7, "хабаровск": 8, "владивосток": 8,
-    "якутск": 9, "благовещенск": 9, "петропавловск-камчатский": 10, "магадан": 10,
-    "южно-сахалинск": 10, "саратов": 3, "тольятти": 3, "ижевск": 5, "ульяновск": 3,
-    "оренбург": 5, "новокузнецк": 6, "рязань": 2, "пенза": 3, "липецк": 2,
-    "тула": 2, "астрахань": 4, "киров": 3, "чебоксары": 3, "калуга": 2,
-    "курск": 2, "тверь": 2, "севастополь": 4, "брянск": 2, "иваново": 2,
-    "магнитогорск": 5, "белгород": 2
-}
+app.add_middleware(MetricsMiddleware)
 
-class DeliveryOffer(BaseModel):
-    company: str
-    tariff_name: str
-    cargo_type: str
-    size: str
-    transit_time: str
-    price: int
-
-class SearchResponse(BaseModel):
-    from_city: str
-    to_city: str
-    weight_kg: float
-    box_size: str
-    offers: List[DeliveryOffer]
-
-class TariffItem(BaseModel):
-    company: str
-    cargo_type: str
-    tariff_type: str
-    price: float
-    days: int
-    is_price_restored: bool = False
-    is_time_restored: bool = False
-    source_url: Optional[str] = None
-
-class TariffsRequest(BaseModel):
-    city: str
-    weight: float
-    strategy: str = "none"
-
-class TariffsResponse(BaseModel):
-    city: str
-    weight: float
-    avg_price: float
-    avg_days: float
-    tariffs: List[TariffItem]
-
-def calculate_volume_weight(l: int, w: int, h: int) -> float:
-    return round((l * w * h) / 5000, 2)
-
-def get_zone_diff(city1: str, city2: str) -> int:
-    c1 = city1.lower().replace("ё", "е")
-    c2 = city2.lower().replace("ё", "е")
-    z1 = CITIES.get(c1)
-    z2 = CITIES.get(c2)
-
-    if z1 is None or z2 is None:
-        raise HTTPException(status_code=404, detail="Город не найден в списке")
-
-    return abs(z1 - z2) + 1
-
-def calculate_price(company: str, tariff: str, weight: float, vol_weight: float, zone_diff: int, box: str) -> int:
-    charge_weight = max(weight, vol_weight)
-    extra = 0
-
-    if box == "XXL":
-        extra = 1800
-    elif box == "XXXL":
-        extra = 4000
-    elif box == "XXXXL":
-        extra = 9000
-
-    if company == "СДЭК":
-        if "эконом" in tariff.lower():
-            base, per_kg = 550, 130 + zone_diff * 38
-        else:
-            base, per_kg = 950, 380 + zone_diff * 55
-    elif company == "Boxberry":
-        base, per_kg = 680, 160 + zone_diff * 42
-    elif company == "Почта России":
-        if tariff == "EMS":
-            base, per_kg = 1400, 500 + zone_diff * 70
-        else:
-            base, per_kg = 450, 110 + zone_diff * 25
-    else:
-        base, per_kg = 700, 200 + zone_diff * 40
-
-    price = base + (charge_weight - 1) * per_kg + extra
-    price = int(price * random.uniform(0.92, 1.08))
-    return max(290, round(price / 10) * 10)
-
-def get_offers(weight: float, box_size: BoxSize, zone_diff: int) -> List[DeliveryOffer]:
-    dims = BOX_DIMENSIONS[box_size]["dims"]
-    vol_weight = calculate_volume_weight(*dims)
-
-    cargo_type = "Документы" if weight <= 0.5 else "Посылка" if weight <= 30 else "Груз"
-    offers = []
-
-    offers.append(DeliveryOffer(
-        company="СДЭК",
-        tariff_name="Экспресс лайт",
-        cargo_type=cargo_type,
-        size=box_size,
-        transit_time=f"{max(1, zone_diff // 2)}-{zone_diff + 1} дн.",
-        price=calculate_price("СДЭК", "экспресс", weight, vol_weight, zone_diff, box_size)
-    ))
-
-    offers.append(DeliveryOffer(
-        company="СДЭК",
-        tariff_name="Посылочка Эконом",
-        cargo_type=cargo_type,
-        size=box_size,
-        transit_time=f"{zone_diff + 1}-{zone_diff + 5} дн.",
-        price=calculate_price("СДЭК", "эконом", weight, vol_weight, zone_diff, box_size)
-    ))
-
-    offers.append(DeliveryOffer(
-        company="Boxberry",
-        tariff_name="Стандарт",
-        cargo_type=cargo_type,
-        size=box_size,
-        transit_time=f"{zone_diff}-{zone_diff + 4} дн.",
-        price=calculate_price("Boxberry", "", weight, vol_weight, zone_diff, box_size)
-    ))
-
-    offers.append(DeliveryOffer(
-        company="Почта России",
-        tariff_name="Обычная посылка",
-        cargo_type=cargo_type,
-        size=box_size,
-        transit_time=f"{zone_diff + 3}-{zone_diff + 9} дн.",
-        price=calculate_price("Почта России", "обычная", weight, vol_weight, zone_diff, box_size)
-    ))
-
-    offers.append(DeliveryOffer(
-        company="Почта России",
-        tariff_name="EMS",
-        cargo_type=cargo_type,
-        size=box_size,
-        transit_time=f"{max(1, zone_diff // 3)}-{zone_diff // 2 + 2} дн.",
-        price=calculate_price("Почта России", "EMS", weight, vol_weight, zone_diff, box_size)
-    ))
-
-    offers.sort(key=lambda x: x.price)
-    return offers
-
-def generate_tariffs_for_city(city: str, weight: float) -> List[TariffItem]:
-    tariffs = []
-    companies = ["СДЭК", "Boxberry", "Почта России", "Деловые Линии", "ПЭК", "КИТ"]
-    cargo_types = ["Экспресс", "Сборный груз", "Терминал-Дверь", "Дверь-Дверь"]
-
-    city_lower = city.lower()
-    base_zone = CITIES.get(city_lower, 5)
-
-    for i, company in enumerate(companies):
-        cargo_type = cargo_types[i % len(cargo_types)]
-
-        base_price = 500 + (weight * 50) + (base_zone * 100)
-        price = base_price * random.uniform(0.8, 1.2)
-
-        base_days = 2 + base_zone + int(weight / 10)
-        days = max(1, base_days + random.randint(-1, 3))
-
-        is_price_restored = random.random() < 0.3
-        is_time_restored = random.random() < 0.2
-
-        tariffs.append(TariffItem(
-            company=company,
-            cargo_type=cargo_type,
-            tariff_type=f"Тариф {i + 1}",
-            price=round(price, 2),
-            days=days,
-            is_price_restored=is_price_restored,
-            is_time_restored=is_time_restored,
-            source_url=f"https://{company.lower().replace(' ', '')}.ru/tariff"
-        ))
-
-    return tariffs
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError):
+    """422 как у FastAPI; NaN и inf из тела запроса в JSON не кодируются, поэтому input — строкой."""
+    errors = [
+        {**error, "input": str(error["input"])}
+        if isinstance(error.get("input"), float) and not math.isfinite(error["input"]) else error
+        for error in exc.errors()
+    ]
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
+
+REGISTRY.register(GaugeFunc(
+    "quote_cache", "Состояние кэша расчётов: hits, misses, size, hit_rate",
+    lambda: {(k,): v for k, v in quote_cache.stats().items()}, ("stat",)))
+REGISTRY.register(GaugeFunc(
+    "write_behind", "Очередь отложенной записи: enqueued, written, batches, failed, waited",
+    lambda: {(k,): v for k, v in writer.stats.items()}, ("stat",)))
+REGISTRY.register(GaugeFunc(
+    "single_flight", "Объединение одинаковых расчётов: leaders, coalesced, failed, in_flight",
+    lambda: {(route, k): v for route, flight in flights.items()
+             for k, v in {**flight.stats, "in_flight": flight.in_flight()}.items()}, ("route", "stat")))
+REGISTRY.register(GaugeFunc(
+    "rate_limit", "Ограничение частоты записи: allowed, limited, clients",
+    lambda: {(k,): v for k, v in limiter.stats().items()}, ("stat",)))
+REGISTRY.register(GaugeFunc(
+    "price_grid", "Сетка цен: hits, misses, opened",
+    lambda: {(k,): v for k, v in PRICE_GRID.stats.items()}, ("stat",)))
+REGISTRY.register(GaugeFunc(
+    "carriers", "Опрос перевозчиков: requests, hedged, ok, timeouts, errors, rejected, breaker_open",
+    carriers.stats, ("carrier", "stat")))
+REGISTRY.register(GaugeFunc(
+    "bulk_quote", "Пакетный расчёт: uploads, rows, errors, saved",
+    lambda: {(k,): v for k, v in bulk_stats.items()}, ("stat",)))
+REGISTRY.register(GaugeFunc(
+    "retention", "Перенос в архив: runs, batches, archived, deleted, vacuumed_pages, tombstones_pruned, failed",
+    lambda: {(k,): v for k, v in retention.stats.items()}, ("stat",)))
+REGISTRY.register(GaugeFunc(
+    "integrity_check", "Полная проверка целостности БД: ok, errors, duration_ms, last_check_ts",
+    integrity.metrics, ("stat",)))
+REGISTRY.register(GaugeFunc(
+    "deliveries_rows", "Число строк в deliveries (по сводной таблице)",
+    lambda: {(): db.get_deliveries_count()}))
 
 def calculate_and_save_delivery(input_string: str) -> str:
     try:
-        parts = input_string.strip().split()
-        if len(parts) != 4:
-            return "Формат: 'Москва Санкт-Петербург 2.5 M'"
-
-        from_city, to_city, weight_str, box_size = parts
-        weight = float(weight_str)
-
-        c1 = from_city.lower().replace("ё", "е")
-        c2 = to_city.lower().replace("ё", "е")
-        if c1 not in CITIES or c2 not in CITIES:
-            return f"Города не найдены: {from_city} → {to_city}"
-
-        if weight <= 0 or weight > 500:
-            return f"Вес {weight}кг некорректен"
-
-        if box_size not in BOX_DIMENSIONS:
-            return f"Размер {box_size} неверный"
-
-        if weight > BOX_DIMENSIONS[box_size]["max_weight"]:
-            return f"Вес {weight}кг > лимит {box_size} ({BOX_DIMENSIONS[box_size]['max_weight']}кг)"
-
-        zone_diff = get_zone_diff(from_city, to_city)
-        offers = get_offers(weight, box_size, zone_diff)
-        best_offer = offers[0]
-
-        delivery_type = "экспресс лайт" if "экспресс" in best_offer.tariff_name.lower() else "посылочка (Эконом)"
-        if "ems" in best_offer.tariff_name.lower():
-            delivery_type = "EMS отправление"
+        quote = quote_text(input_string)
+    except QuoteError as e:
+        return str(e)
 
+    try:
+        r, offer = quote.request, quote.offer
         delivery_id = db.save_delivery(
-            company=best_offer.company,
-            delivery_type=delivery_type,
-            weight=weight,
-            size=box_size,
-            town_from=from_city,
-            town_to=to_city,
-            price=best_offer.price,
-            days=int(best_offer.transit_time.split("-")[0])
+            company=offer.company,
+            delivery_type=quote.delivery_type,
+            weight=r.weight,
+            size=r.box_size,
+            town_from=CITY_INDEX.title(r.from_id),
+            town_to=CITY_INDEX.title(r.to_id),
+            price=offer.price,
+            days=quote.days_min
         )
+        saved_ok, total_count = db.confirm_delivery(delivery_id)
 
-        saved_records = db.get_all_deliveries()
-        total_count = len(saved_records)
-        last_record = saved_records[0] if saved_records else None
-        saved_ok = delivery_id and last_record and last_record['id'] == delivery_id
-
-        days = int(best_offer.transit_time.split("-")[0])
         result = f"""
-ЛУЧШИЙ ТАРИФ:
-{from_city.title()} → {to_city.title()}
-{box_size} | {weight}кг
-{best_offer.company} | {delivery_type}
-{best_offer.price:,}₽
-{days}-{int(best_offer.transit_time.split("-")[1][:-3])} дней
+{format_quote(quote)}
 ID в БД: {delivery_id}
 
 Сохранено: {'ДА' if saved_ok else 'НЕТ'}
@@ -434,69 +603,106 @@ ID в БД: {delivery_id}
         return result.strip()
 
     except Exception as e:
-        logger.error(f"Ошибка в calculate_and_save_delivery: {e}")
+        logger.error("Ошибка в calculate_and_save_delivery: %s", e)
         return f"Ошибка: {str(e)}"
 
 @app.get("/api/health")
 async def health_check():
-    deliveries_count = db.get_deliveries_count()
+    deliveries_count = await adb.get_deliveries_count()
+    integrity_status = integrity.status()
     return {
-        "status": "ok",
+        "status": "degraded" if integrity_status["state"] in ("failed", "error") else "ok",
         "timestamp": datetime.now().isoformat(),
         "database": "connected",
+        "database_startup_ms": db.startup_ms,
+        "integrity": integrity_status,
         "deliveries_count": deliveries_count,
-        "cities_count": len(CITIES),
+        "cities_count": len(CITY_INDEX),
+        "quote_cache": quote_cache.stats(),
+        "tariffs": {"version": tariff_engine.current().version, "count": len(tariff_engine.current())},
         "version": "2.0"
     }
 
+# Названия городов для клиентов (фронтенд, приложение); зоны и цены считает только сервер.
+CITY_NAMES = sorted(CITY_INDEX.title(city_id) for city_id in range(len(CITY_INDEX)))
+
+@app.get("/api/cities")
+async def get_cities():
+    return {"cities": CITY_NAMES, "box_sizes": list(BOX_DIMENSIONS)}
+
 @app.post("/api/tariffs", response_model=TariffsResponse)
 async def get_tariffs(request: TariffsRequest):
-    logger.info(f"Получен запрос на тарифы: город={request.city}, вес={request.weight}")
-
-    tariffs = generate_tariffs_for_city(request.city, request.weight)
-
-    if request.strategy == "cheapest":
-        tariffs.sort(key=lambda x: x.price)
-    elif request.strategy == "fastest":
-        tariffs.sort(key=lambda x: x.days)
-    elif request.strategy == "balanced":
-        max_price = max(t.price for t in tariffs)
-        max_days = max(t.days for t in tariffs)
-        tariffs.sort(key=lambda t: (t.price / max_price * 0.7 + t.days / max_days * 0.3))
-
-    avg_price = sum(t.price for t in tariffs) / len(tariffs)
-    avg_days = sum(t.days for t in tariffs) / len(tariffs)
-
-    if tariffs:
-        best_tariff = tariffs[0]
-        delivery_type = best_tariff.cargo_type
-        if "экспресс" in best_tariff.cargo_type.lower():
-            delivery_type = "Экспресс"
-        elif "сборный" in best_tariff.cargo_type.lower():
-            delivery_type = "Сборный груз"
-
-        try:
-            delivery_id = db.save_delivery(
+    logger.info("Получен запрос на тарифы: город=%s, вес=%s", request.city, request.weight)
+
+    city_id = CITY_INDEX.resolve(request.city)
+    city_key = city_id if city_id is not None else normalize_city(request.city)
+    # Версия таблицы в ключе: воркер, заметивший новый tariffs.json, не отдаёт старые цены из кэша.
+    cache_key = ("tariffs", city_key, request.weight, request.strategy, date.today(), tariff_engine.current().version)
+
+    # Расчёт и запись в БД выполняет первый из одинаковых запросов, одновременные
+    # повторы (и повторы в окне COALESCE_WINDOW_MS) получают его результат без новых строк в БД.
+    async def quote_and_record() -> CachedQuote:
+        cached = quote_cache.get(cache_key)
+
+        if cached is None:
+            rng = quote_rng("tariffs", city_key, weight_bucket(request.weight))
+            # Расчёт в пуле потоков: пока он идёт, повторы успевают присоединиться к первому запросу.
+            tariffs = await asyncio.get_running_loop().run_in_executor(
+                None, generate_tariffs_for_city, request.city, request.weight, rng)
+            if carriers.enabled:
+                tariffs = await carriers.quote(request.city, request.weight, tariffs)
+            OFFERS_COMPUTED.inc(("tariffs",), len(tariffs))
+
+            if request.strategy == "cheapest":
+                tariffs.sort(key=lambda x: x.price)
+            elif request.strategy == "fastest":
+                tariffs.sort(key=lambda x: x.days)
+            elif request.strategy == "balanced":
+                max_price = max(t.price for t in tariffs)
+                max_days = max(t.days for t in tariffs)
+                tariffs.sort(key=lambda t: (t.price / max_price * 0.7 + t.days / max_days * 0.3))
+
+            avg_price = sum(t.price for t in tariffs) / len(tariffs)
+            avg_days = sum(t.days for t in tariffs) / len(tariffs)
+
+            result = TariffsResult(
+                city=request.city,
+                weight=request.weight,
+                avg_price=round(avg_price, 2),
+                avg_days=round(avg_days, 1),
+                tariffs=tariffs
+            )
+            cached = quote_cache.put(cache_key, result, render(result, TariffsResponse))
+
+        tariffs = cached.result.tariffs
+        if tariffs:
+            best_tariff = tariffs[0]
+            delivery_type = best_tariff.cargo_type
+            if "экспресс" in best_tariff.cargo_type.lower():
+                delivery_type = "Экспресс"
+            elif "сборный" in best_tariff.cargo_type.lower():
+                delivery_type = "Сборный груз"
+
+            await writer.enqueue(DeliveryRecord(
                 company=best_tariff.company,
                 delivery_type=delivery_type,
                 weight=request.weight,
                 size="M",
                 town_from="Москва",
-                town_to=request.city,
+                town_to=CITY_INDEX.title(city_id) if city_id is not None else request.city,
                 price=best_tariff.price,
                 days=best_tariff.days
-            )
-            logger.info(f"Сохранено в БД с ID: {delivery_id}")
-        except Exception as e:
-            logger.error(f"Ошибка сохранения в БД: {e}")
-
-    return TariffsResponse(
-        city=request.city,
-        weight=request.weight,
-        avg_price=round(avg_price, 2),
-        avg_days=round(avg_days, 1),
-        tariffs=tariffs
-    )
+            ))
+        return cached
+
+    cached, shared = await flights["tariffs"].run(cache_key, quote_and_record)
+    if shared and cached.result.tariffs:
+        WRITES_COALESCED.inc(("tariffs",))
+
+    body = cached.body
+    if cached.result.city != request.city:
+        body = render(dataclasses.replace(cached.result, city=request.city), TariffsResponse)
+    return Response(content=body, media_type="application/json")
 
 @app.get("/api/calculate")
 async def calculate_delivery(
@@ -505,12 +711,8 @@ async def calculate_delivery(
         weight: float = Query(..., gt=0, le=500, description="Вес в кг"),
         box_size: BoxSize = Query("M", description="Размер коробки")
 ):
-    c1 = from_city.lower().replace("ё", "е")
-    c2 = to_city.lower().replace("ё", "е")
-
-    if c1 not in CITIES or c2 not in CITIES:
-        raise HTTPException(status_code=404, detail="Город не найден в списке")
-    if c1 == c2:
+    from_id, to_id = resolve_route(from_city, to_city)
+    if from_id == to_id:
         raise HTTPException(status_code=400, detail="Города совпадают")
 
     if weight > BOX_DIMENSIONS[box_size]["max_weight"]:
@@ -519,39 +721,128 @@ async def calculate_delivery(
             detail=f"Вес {weight}кг превышает лимит для коробки {box_size} ({BOX_DIMENSIONS[box_size]['max_weight']}кг)"
         )
 
-    zone_diff = get_zone_diff(from_city, to_city)
-    offers = get_offers(weight, box_size, zone_diff)
-
-    for offer in offers[:3]:
-        delivery_type = offer.tariff_name.lower().replace(" ", "_")
-        if "экспресс лайт" in delivery_type:
-            delivery_type = "экспресс лайт"
-        elif "эконом" in delivery_type:
-            delivery_type = "посылочка (Эконом)"
-        elif "ems" in delivery_type:
-            delivery_type = "EMS отправление"
-
-        try:
-            db.save_delivery(
+    zone_diff = CITY_INDEX.zone_diff(from_id, to_id)
+    cache_key = ("calculate", from_id, to_id, weight, box_size, date.today(), tariff_engine.current().version)
+
+    async def quote_and_record() -> CachedQuote:
+        cached = quote_cache.get(cache_key)
+
+        if cached is None:
+            rng = quote_rng("calculate", from_id, to_id, weight_bucket(weight), box_size)
+            offers = await asyncio.get_running_loop().run_in_executor(
+                None, get_offers, weight, box_size, zone_diff, rng)
+            OFFERS_COMPUTED.inc(("calculate",), len(offers))
+            result = SearchResult(
+                from_city=CITY_INDEX.title(from_id),
+                to_city=CITY_INDEX.title(to_id),
+                weight_kg=weight,
+                box_size=f"{box_size} — {BOX_DIMENSIONS[box_size]['name']}",
+                offers=offers
+            )
+            cached = quote_cache.put(cache_key, result, render(result, SearchResponse))
+
+        for offer in cached.result.offers[:3]:
+            delivery_type = offer.tariff_name.lower().replace(" ", "_")
+            if "экспресс лайт" in delivery_type:
+                delivery_type = "экспресс лайт"
+            elif "эконом" in delivery_type:
+                delivery_type = "посылочка (Эконом)"
+            elif "ems" in delivery_type:
+                delivery_type = "EMS отправление"
+
+            await writer.enqueue(DeliveryRecord(
                 company=offer.company,
                 delivery_type=delivery_type,
                 weight=weight,
                 size=box_size,
-                town_from=from_city,
-                town_to=to_city,
+                town_from=CITY_INDEX.title(from_id),
+                town_to=CITY_INDEX.title(to_id),
                 price=offer.price,
                 days=int(offer.transit_time.split("-")[0]) if "-" in offer.transit_time else zone_diff
-            )
-        except Exception as e:
-            logger.error(f"Ошибка сохранения предложения {offer.company}: {e}")
+            ))
+        return cached
+
+    cached, shared = await flights["calculate"].run(cache_key, quote_and_record)
+    if shared:
+        WRITES_COALESCED.inc(("calculate",), len(cached.result.offers[:3]))
+
+    return Response(content=cached.body, media_type="application/json")
 
-    return SearchResponse(
-        from_city=from_city.title(),
-        to_city=to_city.title(),
-        weight_kg=weight,
-        box_size=f"{box_size} — {BOX_DIMENSIONS[box_size]['name']}",
-        offers=offers
-    )
+@app.post("/api/calculate/batch", response_model=BatchQuoteResponse)
+def calculate_batch(request: BatchQuoteRequest):
+    try:
+        result = quote_batch(request.from_city, request.to_city, request.weight, request.box_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    OFFERS_COMPUTED.inc(("batch",), int(result["valid"].sum()) * len(result["tariffs"]))
+
+    # Колонки уже готовы к сериализации, повторная валидация десятков тысяч чисел не нужна.
+    return JSONResponse(to_columns(result))
+
+@app.post("/api/calculate/bulk")
+async def calculate_bulk(request: Request, format: Optional[Literal["csv", "ndjson"]] = None, save: bool = False):
+    """Расчёт файла отправлений (CSV или NDJSON, см. bulk_quote.py) с потоковым ответом."""
+    global bulk_executor
+    if bulk_executor is None:
+        bulk_executor = bulk_quote.make_executor(BULK_WORKERS)
+    pipeline = bulk_quote.BulkPipeline(
+        format or bulk_quote.detect_format(request.headers.get("content-type")), BULK_CHUNK_SIZE)
+    results = bulk_quote.stream(request.stream(), pipeline, bulk_executor,
+                                adb.save_deliveries if save else None, max_pending=2 * BULK_WORKERS)
+
+    # Первая пачка считается до ответа: ошибка в заголовке CSV — это 400, а не оборванный поток.
+    bulk_stats["uploads"] += 1
+    try:
+        first = await results.__anext__()
+    except bulk_quote.BulkError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except StopAsyncIteration:
+        first = b""
+
+    async def body():
+        try:
+            yield first
+            async for data in results:
+                yield data
+        finally:
+            await results.aclose()
+            for key in ("rows", "errors", "saved"):
+                bulk_stats[key] += getattr(pipeline.stats, key)
+            OFFERS_COMPUTED.inc(("bulk",), pipeline.stats.rows - pipeline.stats.errors)
+
+    return StreamingResponse(body(), media_type=pipeline.format.media_type)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Служебные маршруты — только с токеном ADMIN_TOKEN; без переменной они выключены."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Маршрут отключён: задайте ADMIN_TOKEN")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Неверный X-Admin-Token")
+
+@app.post("/api/tariffs/reload", dependencies=[Depends(require_admin)])
+async def reload_tariffs():
+    """Перечитать tariffs.json сразу и построить сетку цен.
+
+    Остальные воркеры замечают новый файл сами (tariff_engine.current, не
+    реже раза в TARIFFS_RECHECK_S) и открывают готовую сетку; до её
+    постройки цены считаются по таблице.
+    """
+    try:
+        table = tariff_engine.reload()
+    except (OSError, ValueError) as e:
+        logger.error("Не удалось перечитать таблицу тарифов: %s", e)
+        raise HTTPException(status_code=500, detail=f"Таблица тарифов не загружена: {e}")
+
+    # Закэшированные цены посчитаны по старой таблице.
+    quote_cache.clear()
+    logger.info("Таблица тарифов перечитана: версия %s, тарифов %d", table.version, len(table))
+
+    # Пока сетка строится, цены считаются без неё: ключ старого файла не совпадёт с новой таблицей.
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, PRICE_GRID.ensure, table)
+    except (OSError, ValueError) as e:
+        logger.error("Не удалось построить сетку цен: %s", e)
+    return {"status": "success", "version": table.version, "count": len(table)}
 
 @app.get("/api/test-calc")
 async def test_calculation():
@@ -563,23 +854,86 @@ async def test_calculation():
 
     results = []
     for inp in test_inputs:
-        result = calculate_and_save_delivery(inp)
+        result = await adb.run(calculate_and_save_delivery, inp)
         results.append({"input": inp, "output": result})
 
     return {"tests": results}
 
+def _ndjson_chunk(rows: List[tuple]) -> str:
+    return "".join(json.dumps(dict(zip(DELIVERY_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+
+def _csv_chunk(rows: List[tuple]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+async def _export(filters: DeliveryFilters, encode: Callable[[List[tuple]], str], header: str = "") -> AsyncIterator[str]:
+    if header:
+        yield header
+    async for chunk in adb.iter_deliveries(filters, encode):
+        yield chunk
+
 @app.get("/api/deliveries")
-async def get_all_deliveries():
-    deliveries = db.get_all_deliveries()
+async def get_all_deliveries(
+        limit: int = Query(100, ge=1, le=1000, description="Размер страницы"),
+        cursor: Optional[str] = Query(None, description="Курсор next_cursor из предыдущей страницы"),
+        company: Optional[str] = Query(None, description="Перевозчик"),
+        town_from: Optional[str] = Query(None, description="Город отправления"),
+        town_to: Optional[str] = Query(None, description="Город назначения"),
+        date_from: Optional[date] = Query(None, description="С даты (включительно)"),
+        date_to: Optional[date] = Query(None, description="По дату (включительно)"),
+        is_completed: Optional[bool] = Query(None, description="Только завершённые / незавершённые"),
+        format: Literal["json", "ndjson", "csv"] = Query("json", description="json — страница, ndjson/csv — выгрузка потоком")
+):
+    filters = DeliveryFilters(company, town_from, town_to, date_from, date_to, is_completed)
+
+    if format == "ndjson":
+        return StreamingResponse(_export(filters, _ndjson_chunk), media_type="application/x-ndjson")
+    if format == "csv":
+        return StreamingResponse(
+            _export(filters, _csv_chunk, _csv_chunk([DELIVERY_COLUMNS])),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": "attachment; filename=deliveries.csv"}
+        )
+
+    deliveries, next_cursor = await adb.get_deliveries_page(filters, limit, cursor)
     return {
         "status": "success",
         "count": len(deliveries),
+        "next_cursor": next_cursor,
         "deliveries": deliveries
     }
 
+@app.get("/api/deliveries/changes")
+async def get_delivery_changes(
+        request: Request,
+        since: int = Query(0, ge=0, description="seq из предыдущего ответа; 0 — с начала"),
+        limit: int = Query(1000, ge=1, le=5000, description="Изменений в ответе"),
+):
+    """Доставки, добавленные, изменённые и удалённые после since.
+
+    Строки — массивы в порядке columns, удалённые — только ID. При has_more
+    клиент сразу запрашивает следующую порцию с since=seq, при reset —
+    удаляет локальную копию и начинает с since=0.
+    """
+    batch = await adb.get_changes(since, limit)
+    body = dumps({
+        "seq": batch.seq,
+        "reset": batch.reset,
+        "has_more": batch.has_more,
+        "columns": DELIVERY_COLUMNS,
+        "rows": batch.rows,
+        "deleted": batch.deleted,
+    })
+    headers = {"Cache-Control": "no-store", "Vary": "Accept-Encoding"}
+    if len(body) >= CHANGES_GZIP_MIN_SIZE and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.delete("/api/deliveries/clear")
 async def clear_deliveries():
-    success = db.clear_deliveries()
+    success = await adb.clear_deliveries()
 
     if success:
         return {
@@ -592,54 +946,26 @@ async def clear_deliveries():
 
 @app.get("/api/statistics")
 async def get_statistics():
-    deliveries = db.get_all_deliveries()
+    statistics = await adb.get_statistics()
 
-    if not deliveries:
+    if not statistics:
         return {"message": "Нет данных"}
 
-    total_price = sum(d['price'] for d in deliveries)
-    avg_price = total_price / len(deliveries)
-
-    companies = {}
-    for d in deliveries:
-        company = d['company']
-        if company not in companies:
-            companies[company] = {'count': 0, 'total_price': 0}
-        companies[company]['count'] += 1
-        companies[company]['total_price'] += d['price']
+    return statistics
 
-    cities = {}
-    for d in deliveries:
-        city = d['town_to']
-        if city not in cities:
-            cities[city] = {'count': 0}
-        cities[city]['count'] += 1
-
-    return {
-        "total_deliveries": len(deliveries),
-        "average_price": round(avg_price, 2),
-        "total_value": round(total_price, 2),
-        "by_company": {
-            company: {
-                "count": data['count'],
-                "avg_price": round(data['total_price'] / data['count'], 2)
-            }
-            for company, data in companies.items()
-        },
-        "by_city": {
-            city: data
-            for city, data in cities.items()
-        }
-    }
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == "__main__":
     import uvicorn
 
     print("Запуск Delivery Aggregator API Server")
-    print(f"База данных: deliveries.db")
+    print(f"База данных: {DB_PATH}")
     print(f"API доступен по адресу: http://localhost:8000")
     print(f"Документация: http://localhost:8000/api/docs")
     print(f"Для Android приложения используйте: http://10.0.2.2:8000")
+    print("Режим разработки; для боевого запуска в несколько процессов: python serve.py --workers N")
 
     uvicorn.run(
         "main:app",
@@ -0,0 +1,166 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Границы в секундах: от долей миллисекунды (кэш, SQLite) до секунд (выгрузки).
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: LabelValues = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: LabelValues = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам..., +Inf, сумма]
+        self._series: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: LabelValues = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class GaugeFunc:
+    """Значения вычисляются при чтении /api/metrics, в горячем пути ничего не делается."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Dict[LabelValues, float]],
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.fn().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route")))
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "Количество HTTP-запросов", ("method", "route", "status")))
+DB_QUERY_DURATION = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Время выполнения методов DeliveryDB", ("method",)))
+OFFERS_COMPUTED = REGISTRY.register(Counter(
+    "offers_computed_total", "Рассчитанные предложения (без попаданий в кэш)", ("source",)))
+WRITES_COALESCED = REGISTRY.register(Counter(
+    "writes_coalesced_total", "Строки доставок, не записанные повторно благодаря объединению запросов", ("source",)))
+CARRIER_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "carrier_request_duration_seconds", "Время опроса перевозчика (с повтором)", ("carrier", "outcome")))
+
+
+def timed_db(method: Callable) -> Callable:
+    labels = (method.__name__,)
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            DB_QUERY_DURATION.observe(time.perf_counter() - started, labels)
+    return wrapper
+
+
+class MetricsMiddleware:
+    """Гистограмма задержек по шаблону маршрута (а не по сырому пути)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                route_path = route.path
+            else:
+                # Ответ из кэша отдан без маршрутизации; путь у таких маршрутов статический.
+                route_path = scope["path"] if status[0] < 400 else "other"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, (scope["method"], route_path))
+            HTTP_REQUESTS.inc((scope["method"], route_path, str(status[0])))
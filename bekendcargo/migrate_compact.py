@@ -0,0 +1,223 @@
+"""Перевод базы со строковыми столбцами на справочники (см. schema.py).
+
+Миграция не останавливает сервис: каждый шаг — короткие транзакции,
+между которыми успевают пройти записи из API.
+
+1. prepare  — создать справочники и delivery_rows; триггеры на прежней
+   таблице deliveries повторяют в delivery_rows каждую вставку, изменение
+   и удаление, пока идёт перенос;
+2. backfill — перенести существующие строки пачками по диапазонам id;
+3. swap     — в одной транзакции сверить число строк, переименовать таблицу
+   в deliveries_legacy и создать на её месте представление deliveries;
+   триггеры статистики переезжают на delivery_rows;
+4. cleanup  — удалить deliveries_legacy и вернуть место файлу.
+
+Приложение прежней версии, запущенное во время миграции, продолжает
+работать: до шага 3 оно пишет в таблицу, после — в представление через
+INSTEAD OF-триггеры (только INSERT ... RETURNING вернёт NULL вместо id).
+Прерванную миграцию можно просто запустить заново.
+
+    python migrate_compact.py                        # DELIVERIES_DB или deliveries.db
+    python migrate_compact.py --db prod.db --vacuum  # с полным VACUUM в конце
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, Optional
+
+from db_pool import ConnectionPool
+from schema import (
+    DELIVERY_INDEXES, DELIVERY_ROWS_SCHEMA, DELIVERY_SCHEMA, ENCODED_COLUMNS, LOOKUP_SCHEMA,
+    REBUILD_STATS_SQL, ROW_COLUMNS, STATS_SCHEMA, encoded_values, insert_row_sql,
+)
+
+logger = logging.getLogger(__name__)
+
+LEGACY_TABLE = "deliveries_legacy"
+
+# Схема до перехода на справочники: по ней создаются базы для бенчмарков.
+LEGACY_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS deliveries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company TEXT NOT NULL,
+        delivery_type TEXT NOT NULL,
+        weight REAL NOT NULL CHECK (weight > 0),
+        size TEXT NOT NULL,
+        town_from TEXT NOT NULL,
+        town_to TEXT NOT NULL,
+        price REAL NOT NULL CHECK (price >= 0),
+        delivery_time INTEGER NOT NULL CHECK (delivery_time > 0),
+        is_completed INTEGER NOT NULL DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_created_at ON deliveries(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_company_created ON deliveries(company, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_town_to_created ON deliveries(town_to, created_at)",
+]
+
+MIRROR_TRIGGERS = {
+    "trg_compact_mirror_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_compact_mirror_insert AFTER INSERT ON deliveries
+        BEGIN
+            {insert_row_sql("NEW", "INSERT OR REPLACE")}
+        END
+    """,
+    "trg_compact_mirror_update": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_compact_mirror_update AFTER UPDATE ON deliveries
+        BEGIN
+            DELETE FROM delivery_rows WHERE id = OLD.id AND OLD.id <> NEW.id;
+            {insert_row_sql("NEW", "INSERT OR REPLACE")}
+        END
+    """,
+    "trg_compact_mirror_delete": """
+        CREATE TRIGGER IF NOT EXISTS trg_compact_mirror_delete AFTER DELETE ON deliveries
+        BEGIN
+            DELETE FROM delivery_rows WHERE id = OLD.id;
+        END
+    """,
+}
+
+# Триггеры статистики прежней схемы висят на таблице deliveries; новые с теми же
+# именами создаются на delivery_rows только при переключении, иначе строки,
+# попавшие в delivery_rows через зеркало, были бы посчитаны дважды.
+LEGACY_STATS_TRIGGERS = ["trg_stats_insert", "trg_stats_delete", "trg_stats_update"]
+
+# OR IGNORE: строки, уже записанные зеркалом, новее копируемых.
+BACKFILL_SQL = f"""
+    INSERT OR IGNORE INTO delivery_rows (id, {', '.join(ROW_COLUMNS)})
+    SELECT d.id, {encoded_values("d")} FROM deliveries d WHERE d.id > ? AND d.id <= ?
+"""
+
+BACKFILL_LOOKUPS_SQL = [
+    f"INSERT INTO {table} (name) SELECT DISTINCT {column} FROM deliveries WHERE id > ? AND id <= ? "
+    f"ON CONFLICT (name) DO NOTHING"
+    for column, (table, _) in ENCODED_COLUMNS.items()
+]
+
+
+class MigrationError(Exception):
+    pass
+
+
+class CompactMigration:
+    def __init__(self, db_path: str, batch_size: int = 20000, pause: float = 0.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.pause = pause
+        self.pool = ConnectionPool(db_path)
+        self._next_id = 0
+        self._last_id = 0
+        self.stats = {"copied": 0, "batches": 0}
+
+    def _object_type(self, name: str) -> Optional[str]:
+        row = self.pool.connection().execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def needed(self) -> bool:
+        return self._object_type("deliveries") == "table"
+
+    def prepare(self):
+        with self.pool.transaction() as conn:
+            # Индексы создаются сразу, пока таблица пуста, чтобы переключение не строило их под блокировкой.
+            for sql in LOOKUP_SCHEMA + [DELIVERY_ROWS_SCHEMA] + DELIVERY_INDEXES + list(MIRROR_TRIGGERS.values()):
+                conn.execute(sql)
+            # До конца переноса строки копируются только до этого id, новые пишет зеркало.
+            self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM deliveries").fetchone()[0]
+        self._next_id = 0
+        logger.info("Миграция на справочники: перенос %s строк (id до %s)", self.rows_total(), self._last_id)
+
+    def rows_total(self) -> int:
+        return self.pool.connection().execute("SELECT count(*) FROM deliveries").fetchone()[0]
+
+    def backfill_step(self) -> bool:
+        """Перенести следующую пачку; False — перенос закончен."""
+        if self._next_id >= self._last_id:
+            return False
+        params = (self._next_id, self._next_id + self.batch_size)
+        with self.pool.transaction() as conn:
+            for sql in BACKFILL_LOOKUPS_SQL:
+                conn.execute(sql, params)
+            copied = conn.execute(BACKFILL_SQL, params).rowcount
+        self._next_id += self.batch_size
+        self.stats["copied"] += copied
+        self.stats["batches"] += 1
+        return True
+
+    def swap(self):
+        with self.pool.transaction() as conn:
+            legacy, compact = conn.execute(
+                "SELECT (SELECT count(*) FROM deliveries), (SELECT count(*) FROM delivery_rows)").fetchone()
+            if legacy != compact:
+                raise MigrationError(f"число строк не совпало: deliveries {legacy}, delivery_rows {compact}")
+
+            # Счётчик AUTOINCREMENT продолжается с прежнего: id удалённых строк не переиспользуются.
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'deliveries'").fetchone()
+            if row is not None:
+                current = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'delivery_rows'").fetchone()
+                conn.execute("DELETE FROM sqlite_sequence WHERE name = 'delivery_rows'")
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('delivery_rows', ?)",
+                             (max(row[0], current[0] if current else 0),))
+
+            stats_missing = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_company'").fetchone() is None
+            for name in list(MIRROR_TRIGGERS) + LEGACY_STATS_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+            conn.execute(f"ALTER TABLE deliveries RENAME TO {LEGACY_TABLE}")
+            for sql in DELIVERY_SCHEMA + STATS_SCHEMA:
+                conn.execute(sql)
+            if stats_missing:
+                for sql in REBUILD_STATS_SQL:
+                    conn.execute(sql)
+        logger.info("Миграция на справочники: deliveries переключена на представление")
+
+    def cleanup(self, vacuum: bool = False):
+        if self._object_type(LEGACY_TABLE) == "table":
+            with self.pool.transaction() as conn:
+                conn.execute(f"DROP TABLE {LEGACY_TABLE}")
+        conn = self.pool.connection()
+        if vacuum:
+            # Полная перезапись файла: на время VACUUM запись в базу блокируется.
+            conn.execute("VACUUM")
+        elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+        conn.execute("PRAGMA optimize")
+
+    def run(self, keep_legacy: bool = False, vacuum: bool = False) -> Dict[str, int]:
+        started = time.perf_counter()
+        try:
+            if self.needed():
+                self.prepare()
+                while self.backfill_step():
+                    if self.pause:
+                        time.sleep(self.pause)
+                self.swap()
+            if not keep_legacy:
+                self.cleanup(vacuum)
+        finally:
+            self.pool.close_all()
+        logger.info("Миграция на справочники завершена за %.1fс: %s",
+                    time.perf_counter() - started, self.stats)
+        return self.stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Перевод deliveries на справочники без остановки сервиса")
+    parser.add_argument("--db", default=os.environ.get("DELIVERIES_DB", "deliveries.db"))
+    parser.add_argument("--batch-size", type=int, default=20000)
+    parser.add_argument("--pause", type=float, default=0.02, help="пауза между пачками, с")
+    parser.add_argument("--keep-legacy", action="store_true", help="оставить таблицу deliveries_legacy")
+    parser.add_argument("--vacuum", action="store_true", help="полный VACUUM после удаления прежней таблицы")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"Нет файла базы: {args.db}")
+    try:
+        CompactMigration(args.db, args.batch_size, args.pause).run(args.keep_legacy, args.vacuum)
+    except (MigrationError, sqlite3.Error) as e:
+        sys.exit(f"Миграция не выполнена: {e}")
@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Optional
+
+class DeliveryOffer(BaseModel):
+    company: str
+    tariff_name: str
+    cargo_type: str
+    size: str
+    transit_time: str
+    price: int
+
+class SearchResponse(BaseModel):
+    from_city: str
+    to_city: str
+    weight_kg: float
+    box_size: str
+    offers: List[DeliveryOffer]
+
+class TariffItem(BaseModel):
+    company: str
+    cargo_type: str
+    tariff_type: str
+    price: float
+    days: int
+    is_price_restored: bool = False
+    is_time_restored: bool = False
+    source_url: Optional[str] = None
+
+# Внутренние представления ответов /api/calculate и /api/tariffs: те же поля
+# в том же порядке, что у SearchResponse и TariffsResponse, но без валидации
+# и с __slots__. Их сериализует serialization.render, а схема в OpenAPI
+# по-прежнему берётся из pydantic-моделей.
+@dataclass
+class OfferRow:
+    __slots__ = ("company", "tariff_name", "cargo_type", "size", "transit_time", "price")
+    company: str
+    tariff_name: str
+    cargo_type: str
+    size: str
+    transit_time: str
+    price: int
+
+@dataclass
+class SearchResult:
+    __slots__ = ("from_city", "to_city", "weight_kg", "box_size", "offers")
+    from_city: str
+    to_city: str
+    weight_kg: float
+    box_size: str
+    offers: List[OfferRow]
+
+@dataclass
+class TariffRow:
+    __slots__ = ("company", "cargo_type", "tariff_type", "price", "days",
+                 "is_price_restored", "is_time_restored", "source_url")
+    company: str
+    cargo_type: str
+    tariff_type: str
+    price: float
+    days: int
+    is_price_restored: bool
+    is_time_restored: bool
+    source_url: Optional[str]
+
+@dataclass
+class TariffsResult:
+    __slots__ = ("city", "weight", "avg_price", "avg_days", "tariffs")
+    city: str
+    weight: float
+    avg_price: float
+    avg_days: float
+    tariffs: List[TariffRow]
+
+class TariffsRequest(BaseModel):
+    city: str
+    weight: float = Field(..., gt=0, allow_inf_nan=False)
+    strategy: str = "none"
+
+class TariffsResponse(BaseModel):
+    city: str
+    weight: float
+    avg_price: float
+    avg_days: float
+    tariffs: List[TariffItem]
+
+class BatchQuoteRequest(BaseModel):
+    from_city: List[str] = Field(..., max_length=100_000)
+    to_city: List[str] = Field(..., max_length=100_000)
+    # NaN, inf и вес <= 0 — ошибка запроса (422 с номером строки), как у одиночного расчёта.
+    weight: List[Annotated[float, Field(gt=0, allow_inf_nan=False)]] = Field(..., max_length=100_000)
+    box_size: List[str] = Field(..., max_length=100_000)
+
+class BatchTariffColumns(BaseModel):
+    company: str
+    tariff_name: str
+    price: List[int]
+    days_min: List[int]
+    days_max: List[int]
+
+class BatchQuoteError(BaseModel):
+    index: int
+    detail: str
+
+class BatchQuoteResponse(BaseModel):
+    count: int
+    errors: List[BatchQuoteError]
+    zone_diff: List[int]
+    cargo_type: List[str]
+    tariffs: List[BatchTariffColumns]
@@ -0,0 +1,235 @@
+"""Заранее посчитанная сетка цен для /api/calculate.
+
+Цена тарифа до разброса зависит не от маршрута, а только от разницы зон
+(1..10), коробки, веса и тарифа (TariffTable.base_price). Поэтому все 52×52
+маршрута сводятся к десяти разницам зон, и сетка для всех допустимых весов
+с шагом 0,1 кг занимает пару мегабайт:
+
+    заголовок  magic, версия формата, размеры, ключ сетки и число весов
+               для каждой коробки, дополненные нулями до кратного 8;
+    данные     float64[вес][разница зон][тариф], коробки подряд.
+
+Данные начинаются с выровненного смещения, поэтому float64 в отображении
+лежат по границе 8 байт (memoryview.cast и чтение на строгих к
+выравниванию платформах). Версия 1 писала данные сразу за заголовком.
+
+Ключ — хеш версии таблицы тарифов (хеш tariffs.json), коробок (объёмный
+и предельный вес) и числа зон. Файл построен по другой таблице — сетка не
+используется, цены считаются как раньше (TariffTable.quote). Так же
+считаются веса не на сетке 0,1 кг.
+
+API открывает файл через mmap только на чтение, поэтому все воркеры читают
+одни и те же страницы из page cache. Сборка пишет во временный файл и
+подменяет его через os.replace; воркер замечает новый файл (по inode) не
+чаще раза в секунду и переоткрывает его, если ключ совпал с его таблицей.
+
+    python price_grid.py            # построить PRICE_GRID_FILE по tariffs.json
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tariff_engine import TariffTable
+
+logger = logging.getLogger(__name__)
+
+PRICE_GRID_FILE = os.environ.get(
+    "PRICE_GRID_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_grid.bin"))
+
+MAGIC = b"CARGOGRD"
+FORMAT_VERSION = 2
+STEPS_PER_KG = 10
+# magic, версия формата, зон, тарифов, коробок, шагов на кг, ключ
+HEADER = struct.Struct("<8sHHHHH16s")
+DATA_ALIGN = 8
+
+# Коробка -> (объёмный вес, предельный вес), в порядке хранения.
+BoxLayout = Dict[str, Tuple[float, float]]
+
+
+def grid_key(table: TariffTable, boxes: BoxLayout, zones: int) -> bytes:
+    layout = f"{table.version}|{zones}|{STEPS_PER_KG}|{sorted(table.box_extra.items())}|{list(boxes.items())}"
+    return hashlib.blake2b(layout.encode(), digest_size=16).digest()
+
+
+def data_offset(box_count: int) -> int:
+    """Начало данных: заголовок и число весов по коробкам, выровненные на DATA_ALIGN."""
+    size = HEADER.size + 4 * box_count
+    return -(-size // DATA_ALIGN) * DATA_ALIGN
+
+
+def build(table: TariffTable, boxes: BoxLayout, zones: int, path: str = PRICE_GRID_FILE) -> int:
+    """Посчитать сетку и атомарно заменить файл; возвращает размер файла."""
+    blocks = []
+    zone_diff = np.arange(1, zones + 1)
+    for box, (vol_weight, max_weight) in boxes.items():
+        # i / 10 — то же число, что и вес 0.1 * i, пришедший в запросе.
+        charge_weight = np.maximum(np.arange(1, round(max_weight * STEPS_PER_KG) + 1) / STEPS_PER_KG, vol_weight)
+        extra = table.box_extra.get(box, 0)
+        block = np.empty((len(charge_weight), zones, len(table.records)))
+        for t, rate in enumerate(table.records):
+            # Порядок операций как в TariffTable.base_price: числа совпадают бит в бит.
+            per_kg = rate.per_kg + zone_diff * rate.per_kg_zone
+            block[:, :, t] = rate.base + (charge_weight[:, None] - 1) * per_kg[None, :] + extra
+        blocks.append(block)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, zones, len(table.records), len(boxes), STEPS_PER_KG,
+                         grid_key(table, boxes, zones))
+    rows = struct.pack(f"<{len(boxes)}I", *(len(block) for block in blocks))
+    padding = bytes(data_offset(len(boxes)) - len(header) - len(rows))
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header + rows + padding)
+            for block in blocks:
+                f.write(block.astype("<f8").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.getsize(path)
+
+
+class _Mapped(NamedTuple):
+    key: bytes
+    inode: Tuple[int, int]
+    zones: int
+    tariffs: int
+    offsets: Dict[str, Tuple[int, int]]  # коробка -> (первая строка, число весов)
+    values: memoryview  # float64, плоский
+
+
+def _open(path: str, boxes: Sequence[str]) -> _Mapped:
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, zones, tariffs, box_count, steps, key = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != FORMAT_VERSION or steps != STEPS_PER_KG:
+        raise ValueError(f"{path}: не файл сетки цен версии {FORMAT_VERSION}")
+    rows = struct.unpack_from(f"<{box_count}I", mm, HEADER.size)
+    data_start = data_offset(box_count)
+    if len(mm) != data_start + 8 * sum(rows) * zones * tariffs:
+        raise ValueError(f"{path}: размер файла не совпадает с заголовком")
+    offsets, first = {}, 0
+    for box, count in zip(boxes, rows):
+        offsets[box] = (first, count)
+        first += count
+    return _Mapped(key, (st.st_dev, st.st_ino), zones, tariffs, offsets, memoryview(mm)[data_start:].cast("d"))
+
+
+class PriceGrid:
+    """Сетка цен из файла, отображённого в память; None из lookup — считать без сетки."""
+
+    def __init__(self, boxes: BoxLayout, zones: int, path: str = PRICE_GRID_FILE, recheck_interval: float = 1.0):
+        self.boxes = dict(boxes)
+        self.zones = zones
+        self.path = path
+        self.recheck_interval = recheck_interval
+        self._mapped: Optional[_Mapped] = None
+        # (версия таблицы тарифов, сетка) — последнее совпадение ключа, проверка в горячем пути.
+        self._hot: Optional[Tuple[str, _Mapped]] = None
+        self._keys: Dict[str, bytes] = {}
+        self._checked_at = 0.0
+        self.stats = {"hits": 0, "misses": 0, "opened": 0}
+
+    def key(self, table: TariffTable) -> bytes:
+        key = self._keys.get(table.version)
+        if key is None:
+            key = self._keys[table.version] = grid_key(table, self.boxes, self.zones)
+        return key
+
+    def _current(self, table: TariffTable) -> Optional[_Mapped]:
+        key = self.key(table)
+        mapped = self._mapped
+        if mapped is not None and mapped.key == key:
+            self._hot = (table.version, mapped)
+            return mapped
+
+        now = time.monotonic()
+        if now - self._checked_at < self.recheck_interval:
+            return None
+        self._checked_at = now
+        try:
+            st = os.stat(self.path)
+            if mapped is not None and mapped.inode == (st.st_dev, st.st_ino):
+                return None  # файл тот же, построен по другой таблице тарифов
+            mapped = _open(self.path, list(self.boxes))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning("Сетка цен %s не открыта: %s", self.path, e)
+            return None
+
+        self._mapped = mapped
+        self.stats["opened"] += 1
+        logger.info("Сетка цен открыта: %s, %d КБ", self.path, len(mapped.values) * 8 // 1024)
+        if mapped.key != key:
+            return None
+        self._hot = (table.version, mapped)
+        return mapped
+
+    def lookup(self, table: TariffTable, weight: float, box: str, zone_diff: int) -> Optional[Sequence[float]]:
+        """Цены до разброса для всех тарифов table в порядке records или None."""
+        hot = self._hot
+        mapped = hot[1] if hot is not None and hot[0] == table.version else self._current(table)
+        step = round(weight * STEPS_PER_KG)
+        if mapped is None or step / STEPS_PER_KG != weight or not 1 <= zone_diff <= mapped.zones:
+            self.stats["misses"] += 1
+            return None
+        first_row, count = mapped.offsets[box]
+        if not 1 <= step <= count:
+            self.stats["misses"] += 1
+            return None
+        start = ((first_row + step - 1) * mapped.zones + zone_diff - 1) * mapped.tariffs
+        self.stats["hits"] += 1
+        return mapped.values[start:start + mapped.tariffs]
+
+    def close(self):
+        """Забыть открытый файл; следующий lookup откроет его заново."""
+        self._mapped = self._hot = None
+        self._checked_at = 0.0
+
+    def ensure(self, table: TariffTable) -> bool:
+        """Построить файл, если его нет или он не для table; True — если строился."""
+        if self._current(table) is not None:
+            return False
+        try:
+            if _open(self.path, list(self.boxes)).key == self.key(table):
+                return False
+        except (OSError, ValueError, struct.error):
+            pass
+        self.rebuild(table)
+        return True
+
+    def rebuild(self, table: TariffTable) -> int:
+        started = time.perf_counter()
+        size = build(table, self.boxes, self.zones, self.path)
+        self._checked_at = 0.0  # открыть новый файл при следующем запросе
+        logger.info("Сетка цен построена за %.0f мс: %s, %d КБ, тарифы %s",
+                    (time.perf_counter() - started) * 1000, self.path, size // 1024, table.version)
+        return size
+
+
+def main_cli(argv) -> int:
+    import tariff_engine
+    from pricing import PRICE_GRID
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if argv:
+        PRICE_GRID.path = argv[0]
+    PRICE_GRID.rebuild(tariff_engine.current())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
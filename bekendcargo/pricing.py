@@ -0,0 +1,147 @@
+from fastapi import HTTPException
+from datetime import date
+from typing import List, Literal, Optional, Tuple
+import hashlib
+import math
+import os
+import random
+
+import tariff_engine
+from city_index import CityIndex
+from price_grid import PriceGrid
+from models import OfferRow, TariffRow
+from tariff_engine import RateRecord
+
+BoxSize = Literal["XS", "S", "M", "L", "XL", "XXL", "XXXL", "XXXXL"]
+BOX_DIMENSIONS = {
+    "XS": {"name": "XS (документы)", "dims": (20, 15, 5), "max_weight": 0.5},
+    "S": {"name": "S (маленькая)", "dims": (30, 20, 15), "max_weight": 2},
+    "M": {"name": "M (средняя)", "dims": (40, 30, 25), "max_weight": 5},
+    "L": {"name": "L (стандартная)", "dims": (53, 38, 28), "max_weight": 10},
+    "XL": {"name": "XL (большая)", "dims": (60, 40, 40), "max_weight": 15},
+    "XXL": {"name": "XXL (очень большая)", "dims": (80, 60, 50), "max_weight": 25},
+    "XXXL": {"name": "XXXL (грузовое)", "dims": (120, 80, 80), "max_weight": 40},
+    "XXXXL": {"name": "XXXXL (паллета)", "dims": (120, 80, 150), "max_weight": 500},
+}
+
+CITIES = {
+    "москва": 1, "санкт-петербург": 2, "калининград": 2, "нижний новгород": 3, "казань": 3,
+    "самара": 3, "волгоград": 3, "ростов-на-дону": 4, "краснодар": 4, "воронеж": 4,
+    "сочи": 4, "ставрополь": 4, "екатеринбург": 5, "челябинск": 5, "тюмень": 5,
+    "пермь": 5, "уфа": 5, "новосибирск": 6, "омск": 6, "томск": 6, "барнаул": 6,
+    "кемерово": 6, "красноярск": 7, "иркутск": 7, "хабаровск": 8, "владивосток": 8,
+    "якутск": 9, "благовещенск": 9, "петропавловск-камчатский": 10, "магадан": 10,
+    "южно-сахалинск": 10, "саратов": 3, "тольятти": 3, "ижевск": 5, "ульяновск": 3,
+    "оренбург": 5, "новокузнецк": 6, "рязань": 2, "пенза": 3, "липецк": 2,
+    "тула": 2, "астрахань": 4, "киров": 3, "чебоксары": 3, "калуга": 2,
+    "курск": 2, "тверь": 2, "севастополь": 4, "брянск": 2, "иваново": 2,
+    "магнитогорск": 5, "белгород": 2
+}
+
+CITY_ALIASES = {
+    "мск": "москва", "спб": "санкт-петербург", "питер": "санкт-петербург",
+    "санкт петербург": "санкт-петербург", "нижний": "нижний новгород", "нн": "нижний новгород",
+    "екб": "екатеринбург", "ростов": "ростов-на-дону", "ростов на дону": "ростов-на-дону",
+    "новосиб": "новосибирск", "петропавловск": "петропавловск-камчатский",
+    "петропавловск камчатский": "петропавловск-камчатский", "южно сахалинск": "южно-сахалинск",
+}
+
+CITY_INDEX = CityIndex(CITIES, CITY_ALIASES)
+
+# Перевозчики /api/tariffs; их цены по HTTP запрашивает carriers.py.
+TARIFF_COMPANIES = ["СДЭК", "Boxberry", "Почта России", "Деловые Линии", "ПЭК", "КИТ"]
+
+# "deterministic" — разброс цены зависит только от маршрута, веса, коробки и даты,
+# поэтому одинаковые запросы в течение дня дают одинаковую цену и кэшируются.
+# "random" — прежнее поведение.
+PRICE_JITTER = os.environ.get("PRICE_JITTER", "deterministic")
+
+def weight_bucket(weight: float) -> float:
+    return math.ceil(weight * 2) / 2
+
+def quote_rng(*key) -> Optional[random.Random]:
+    if PRICE_JITTER == "random":
+        return None
+    seed = "|".join(map(str, key + (date.today().isoformat(),)))
+    return random.Random(int.from_bytes(hashlib.blake2b(seed.encode(), digest_size=8).digest(), "big"))
+
+def calculate_volume_weight(l: int, w: int, h: int) -> float:
+    return round((l * w * h) / 5000, 2)
+
+# Цены до разброса для всех разниц зон, коробок и весов с шагом 0,1 кг (price_grid.py).
+PRICE_GRID = PriceGrid(
+    {box: (calculate_volume_weight(*spec["dims"]), spec["max_weight"]) for box, spec in BOX_DIMENSIONS.items()},
+    zones=max(CITY_INDEX.zone_diffs),
+)
+
+def resolve_route(city1: str, city2: str) -> Tuple[int, int]:
+    from_id = CITY_INDEX.resolve(city1)
+    to_id = CITY_INDEX.resolve(city2)
+
+    if from_id is None or to_id is None:
+        raise HTTPException(status_code=404, detail="Город не найден в списке")
+
+    return from_id, to_id
+
+def get_zone_diff(city1: str, city2: str) -> int:
+    return CITY_INDEX.zone_diff(*resolve_route(city1, city2))
+
+def calculate_price(rate: RateRecord, weight: float, vol_weight: float, zone_diff: int, box: str,
+                    rng: Optional[random.Random] = None) -> int:
+    return tariff_engine.current().price(rate, max(weight, vol_weight), zone_diff, box, rng)
+
+def get_offers(weight: float, box_size: BoxSize, zone_diff: int,
+               rng: Optional[random.Random] = None) -> List[OfferRow]:
+    dims = BOX_DIMENSIONS[box_size]["dims"]
+    charge_weight = max(weight, calculate_volume_weight(*dims))
+
+    table = tariff_engine.current()
+    base_prices = PRICE_GRID.lookup(table, weight, box_size, zone_diff)
+    if base_prices is not None:
+        quotes = table.quote_base(base_prices, zone_diff, rng)
+    else:
+        quotes = table.quote(charge_weight, zone_diff, box_size, rng)
+
+    cargo_type = "Документы" if weight <= 0.5 else "Посылка" if weight <= 30 else "Груз"
+    offers = [
+        OfferRow(q.rate.company, q.rate.tariff_name, cargo_type, box_size,
+                 f"{q.days_min}-{q.days_max} дн.", q.price)
+        for q in quotes
+    ]
+
+    offers.sort(key=lambda x: x.price)
+    return offers
+
+def generate_tariffs_for_city(city: str, weight: float,
+                              rng: Optional[random.Random] = None) -> List[TariffRow]:
+    rng = rng or random
+    tariffs = []
+    cargo_types = ["Экспресс", "Сборный груз", "Терминал-Дверь", "Дверь-Дверь"]
+
+    city_id = CITY_INDEX.resolve(city)
+    base_zone = CITY_INDEX.zone(city_id) if city_id is not None else 5
+
+    for i, company in enumerate(TARIFF_COMPANIES):
+        cargo_type = cargo_types[i % len(cargo_types)]
+
+        base_price = 500 + (weight * 50) + (base_zone * 100)
+        price = base_price * rng.uniform(0.8, 1.2)
+
+        base_days = 2 + base_zone + int(weight / 10)
+        days = max(1, base_days + rng.randint(-1, 3))
+
+        is_price_restored = rng.random() < 0.3
+        is_time_restored = rng.random() < 0.2
+
+        tariffs.append(TariffRow(
+            company=company,
+            cargo_type=cargo_type,
+            tariff_type=f"Тариф {i + 1}",
+            price=round(price, 2),
+            days=days,
+            is_price_restored=is_price_restored,
+            is_time_restored=is_time_restored,
+            source_url=f"https://{company.lower().replace(' ', '')}.ru/tariff"
+        ))
+
+    return tariffs
@@ -0,0 +1,159 @@
+"""Проверка планов запросов: каждый запрос к доставкам идёт по ожидаемому индексу.
+
+Запросы берутся из тех же констант и построителей, что и в приложении,
+поэтому изменение SQL или набора индексов без обновления ожиданий
+ломает проверку. Полный просмотр delivery_rows и delivery_changes (SCAN
+без индекса) не допускается ни в одном запросе. В CI те же ожидания
+проверяет tests/test_query_plans.py; вручную:
+
+    python query_plans.py               # временная база с тестовыми данными и ANALYZE
+    python query_plans.py --db prod.db  # планы на реальной базе (только EXPLAIN)
+
+Код возврата 1, если хоть один план не совпал с ожиданием.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from datetime import date
+from typing import List, NamedTuple, Sequence
+
+# Таблицы, которые растут вместе с числом доставок.
+LARGE_TABLES = ("delivery_rows", "delivery_changes")
+
+
+class PlanExpectation(NamedTuple):
+    name: str
+    sql: str
+    params: Sequence
+    uses: Sequence[str]                     # подстроки, которые должны быть в плане
+    forbids: Sequence[str] = ("USE TEMP B-TREE",)
+
+
+def expectations(db=None) -> List[PlanExpectation]:
+    """Ожидания для запросов приложения; фильтры по справочникам — через db (по умолчанию main.db)."""
+    import change_feed
+    import main
+    import retention
+    from main import DeliveryFilters as F, deliveries_query
+
+    db = db or main.db
+
+    cursor = main.encode_cursor("2026-01-15 12:00:00", 1000)
+    january = {"date_from": date(2026, 1, 1), "date_to": date(2026, 1, 31)}
+
+    def page(name, filters, uses, cursor=None):
+        sql, params = deliveries_query(filters, db.lookup, cursor)
+        return PlanExpectation(name, sql + " LIMIT ?", params + [101], uses)
+
+    return [
+        page("лента", F(), ["SCAN delivery_rows USING INDEX idx_rows_created"]),
+        page("лента, следующая страница", F(), ["USING INDEX idx_rows_created (created_at<?)"], cursor),
+        page("лента за период", F(**january), ["USING INDEX idx_rows_created (created_at>? AND created_at<?)"]),
+        page("перевозчик", F(company="СДЭК"), ["USING INDEX idx_rows_company_created (company_id=?)"]),
+        page("перевозчик, следующая страница", F(company="СДЭК"),
+             ["USING INDEX idx_rows_company_created (company_id=? AND created_at<?)"], cursor),
+        page("перевозчик за период", F(company="СДЭК", **january),
+             ["USING INDEX idx_rows_company_created (company_id=? AND created_at>? AND created_at<?)"]),
+        page("город назначения", F(town_to="Казань"), ["USING INDEX idx_rows_town_to_created (town_to_id=?)"]),
+        page("город назначения, следующая страница", F(town_to="Казань"),
+             ["USING INDEX idx_rows_town_to_created (town_to_id=? AND created_at<?)"], cursor),
+        # Город отправления почти всегда один и тот же: отдельный индекс не окупается.
+        page("город отправления", F(town_from="Москва"), ["SCAN delivery_rows USING INDEX idx_rows_created"]),
+        PlanExpectation("все доставки", main.SELECT_ALL_DELIVERIES_SQL, [],
+                        ["SCAN delivery_rows USING INDEX idx_rows_created"]),
+        PlanExpectation("подтверждение записи", main.CONFIRM_DELIVERY_SQL, [1],
+                        ["USING INTEGER PRIMARY KEY (rowid=?)"]),
+        # Сортировка по COUNT(*) неизбежна, но группы идут по индексу без чтения всей таблицы в память.
+        PlanExpectation("сводка по компаниям (пересчёт)", main.STATS_BY_COMPANY_SQL["group_by"], [],
+                        ["USING INDEX idx_rows_company_created"], ["USE TEMP B-TREE FOR GROUP BY"]),
+        PlanExpectation("сводка по городам (пересчёт)", main.STATS_BY_CITY_SQL["group_by"], [],
+                        ["USING COVERING INDEX idx_rows_town_to_created"], ["USE TEMP B-TREE FOR GROUP BY"]),
+        PlanExpectation("архив: самая старая строка", retention.OLDEST_BEFORE_SQL, ["2026-01-01"],
+                        ["USING COVERING INDEX idx_rows_created (created_at<?)"]),
+        PlanExpectation("архив: пачка", retention.BATCH_IDS_SQL, ["2026-01-01", 5000],
+                        ["USING COVERING INDEX idx_rows_created (created_at<?)"]),
+        # Лента изменений: диапазон по seq и строки по PK, без просмотра delivery_rows.
+        PlanExpectation("изменения после seq", change_feed.SELECT_CHANGES_SQL, [1000, 1001],
+                        ["SEARCH c USING INTEGER PRIMARY KEY (rowid>?)", "SEARCH r USING INTEGER PRIMARY KEY (rowid=?)"]),
+        PlanExpectation("надгробия: граница", change_feed.RAISE_PRUNED_SEQ_SQL, ["-30 days"],
+                        ["USING INDEX idx_changes_tombstones (changed_at<?)"]),
+        PlanExpectation("надгробия: удаление", change_feed.PRUNE_TOMBSTONES_SQL, ["-30 days"],
+                        ["USING INDEX idx_changes_tombstones (changed_at<?)"]),
+    ]
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Sequence) -> List[str]:
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, list(params))]
+
+
+def full_scans(plan: Sequence[str]) -> List[str]:
+    """Шаги плана, читающие большую таблицу целиком, без индекса."""
+    return [step for step in plan
+            if step.startswith("SCAN ") and " USING " not in step
+            and step.split()[1].split(".")[-1] in LARGE_TABLES]
+
+
+def mismatches(conn: sqlite3.Connection, case: PlanExpectation) -> str:
+    """Расхождение плана с ожиданием; пустая строка — план как ожидалось."""
+    steps = explain(conn, case.sql, case.params)
+    plan = " | ".join(steps)
+    missing = [s for s in case.uses if s not in plan]
+    present = [s for s in case.forbids if s in plan] + full_scans(steps)
+    if missing or present:
+        return f"{case.name}: план «{plan}»; нет {missing}, лишнее {present}"
+    return ""
+
+
+def check(conn: sqlite3.Connection, cases: Sequence[PlanExpectation]) -> List[str]:
+    """Список расхождений; пустой — все планы как ожидалось."""
+    return [failure for failure in (mismatches(conn, case) for case in cases) if failure]
+
+
+def fill_sample(db, rows: int = 20000):
+    """Данные с реалистичным распределением, чтобы ANALYZE дал планировщику статистику."""
+    from main import DeliveryRecord
+
+    rnd = random.Random(17)
+    companies = ["СДЭК", "Boxberry", "Почта России"]
+    cities = ["Казань", "Самара", "Омск", "Тула", "Сочи", "Уфа", "Пермь", "Новосибирск"]
+    db.save_deliveries([
+        DeliveryRecord(rnd.choice(companies), "экспресс лайт", 1.0, "M", "Москва",
+                       rnd.choice(cities), rnd.randint(300, 5000), 3)
+        for _ in range(rows)
+    ])
+    conn = db.pool.connection()
+    conn.execute("UPDATE delivery_rows SET created_at = datetime('now', -(id % 400) || ' days')")
+    conn.execute("ANALYZE")
+
+
+def main_cli(argv) -> int:
+    parser = argparse.ArgumentParser(description="Проверка EXPLAIN QUERY PLAN")
+    parser.add_argument("--db", help="проверить планы на существующей базе")
+    args = parser.parse_args(argv)
+
+    os.environ["DELIVERIES_DB"] = args.db or os.path.join(tempfile.mkdtemp(prefix="cargo-plans-"), "plans.db")
+    os.environ.setdefault("INTEGRITY_CHECK", "off")
+    import main
+
+    if not args.db:
+        fill_sample(main.db)
+    cases = expectations(main.db)
+    failures = check(main.db.pool.connection(), cases)
+    for case in cases:
+        print(f"{case.name:<40} {' | '.join(explain(main.db.pool.connection(), case.sql, case.params))}")
+    main.db.close()
+
+    if failures:
+        print("\nПланы не совпали с ожиданиями:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"\nВсе {len(cases)} планов совпали с ожиданиями")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
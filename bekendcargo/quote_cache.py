@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+
+class CachedQuote(NamedTuple):
+    result: Any
+    body: bytes
+
+
+class QuoteCache:
+    """Ограниченный LRU-кэш готовых ответов с временем жизни записей.
+
+    Хранит и результат расчёта (он нужен обработчику для записи в БД), и уже
+    сериализованное тело ответа, чтобы повторный запрос не сериализовался заново.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[CachedQuote]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, result, body: bytes) -> CachedQuote:
+        value = CachedQuote(result, body)
+        if self.maxsize <= 0:
+            return value
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,103 @@
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Token bucket на клиента: rate запросов в секунду с запасом burst.
+
+    Корзины хранятся в LRU ограниченного размера: клиент, давно не
+    приходивший, вытесняется и при возвращении получает полную корзину.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, client: str, cost: float = 1.0) -> float:
+        """0 — запрос разрешён; иначе через сколько секунд появятся токены."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.burst, now)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                self.allowed += 1
+                return 0.0
+            self.limited += 1
+            return (cost - bucket.tokens) / self.rate
+
+    def stats(self) -> Dict[str, float]:
+        return {"allowed": self.allowed, "limited": self.limited, "clients": len(self._buckets)}
+
+
+class RateLimitMiddleware:
+    """429 Too Many Requests для маршрутов, которые пишут в БД.
+
+    Клиент определяется по адресу соединения или, за обратным прокси, по
+    первому значению заголовка client_header (например, X-Forwarded-For).
+    """
+
+    def __init__(self, app, limiter: RateLimiter, paths: Iterable[str], client_header: Optional[str] = None):
+        self.app = app
+        self.limiter = limiter
+        self.paths = frozenset(paths)
+        self.client_header = client_header.lower().encode() if client_header else None
+
+    def _client(self, scope) -> str:
+        if self.client_header:
+            for name, value in scope.get("headers", ()):
+                if name == self.client_header:
+                    return value.split(b",")[0].strip().decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = self.limiter.acquire(self._client(scope))
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": "Слишком много запросов, повторите позже"}, ensure_ascii=False).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(retry_after)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,267 @@
+"""Срок хранения доставок и архив по месяцам.
+
+Строки старше RETENTION_DAYS переносятся из рабочей таблицы в архивные
+базы archive/deliveries-YYYY-MM.db (по месяцу created_at) и удаляются из
+delivery_rows. Архив самодостаточен: строки в нём хранятся с текстовыми
+значениями, как их отдаёт представление deliveries. Перенос идёт пачками по RETENTION_BATCH_SIZE строк, каждая
+в своей короткой транзакции, поэтому запись из API не ждёт дольше одной
+пачки. Освободившиеся страницы возвращаются файлу через incremental_vacuum
+(нужен auto_vacuum=INCREMENTAL: новые базы создаются с ним сразу,
+существующую переводит `python retention.py --convert`).
+
+Сводные таблицы статистики обновляются триггерами удаления, так что
+/api/statistics показывает только данные за срок хранения. Удаления
+попадают в журнал изменений надгробиями; надгробия старше
+CHANGE_FEED_TOMBSTONE_DAYS задание удаляет на каждом проходе, даже если
+срок хранения доставок не задан (см. change_feed.py).
+
+    RETENTION_DAYS=90 python retention.py           # один проход вручную
+    RETENTION_DAYS=90 python retention.py --convert # сначала VACUUM в режим INCREMENTAL
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+import change_feed
+from db_pool import ConnectionPool, file_lock
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = (
+    "id, company, delivery_type, weight, size, town_from, town_to, "
+    "price, delivery_time, is_completed, created_at"
+)
+
+ARCHIVE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS archive.deliveries (
+        id INTEGER PRIMARY KEY,
+        company TEXT NOT NULL,
+        delivery_type TEXT NOT NULL,
+        weight REAL NOT NULL,
+        size TEXT NOT NULL,
+        town_from TEXT NOT NULL,
+        town_to TEXT NOT NULL,
+        price REAL NOT NULL,
+        delivery_time INTEGER NOT NULL,
+        is_completed INTEGER NOT NULL,
+        created_at DATETIME
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS archive.idx_created_at ON deliveries(created_at)",
+]
+
+OLDEST_BEFORE_SQL = "SELECT min(created_at) FROM delivery_rows WHERE created_at < ?"
+
+BATCH_IDS_SQL = "SELECT id FROM main.delivery_rows WHERE created_at < ? ORDER BY created_at LIMIT ?"
+
+
+class RetentionPolicy(NamedTuple):
+    days: int = 0                      # 0 — хранить всё
+    archive_dir: Optional[str] = None  # None — удалять без архива
+    batch_size: int = 5000
+    vacuum_pages: int = 2000
+    interval: float = 3600.0           # секунд между проходами фонового задания
+    pause: float = 0.05                # пауза между пачками внутри прохода
+    tombstone_days: int = change_feed.TOMBSTONE_DAYS  # 0 — не удалять надгробия журнала изменений
+
+    @classmethod
+    def from_env(cls, db_path: str) -> "RetentionPolicy":
+        archive_dir = os.environ.get(
+            "RETENTION_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(db_path)), "archive"))
+        return cls(
+            days=int(os.environ.get("RETENTION_DAYS", 0)),
+            archive_dir=archive_dir if os.environ.get("RETENTION_ARCHIVE", "1") == "1" else None,
+            batch_size=int(os.environ.get("RETENTION_BATCH_SIZE", 5000)),
+            vacuum_pages=int(os.environ.get("RETENTION_VACUUM_PAGES", 2000)),
+            interval=float(os.environ.get("RETENTION_INTERVAL_S", 3600)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.days > 0
+
+    @property
+    def has_work(self) -> bool:
+        return self.enabled or self.tombstone_days > 0
+
+
+def _next_month(month: str) -> str:
+    year, mon = map(int, month.split("-"))
+    year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{year:04d}-{mon:02d}-01 00:00:00"
+
+
+class RetentionJob:
+    def __init__(self, pool: ConnectionPool, policy: RetentionPolicy):
+        self.pool = pool
+        self.policy = policy
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+        self.stats = {"runs": 0, "batches": 0, "archived": 0, "deleted": 0, "vacuumed_pages": 0,
+                      "tombstones_pruned": 0, "failed": 0}
+
+    def cutoff(self) -> str:
+        # created_at заполняется CURRENT_TIMESTAMP, то есть в UTC.
+        return (datetime.now(timezone.utc) - timedelta(days=self.policy.days)).strftime("%Y-%m-%d %H:%M:%S")
+
+    def archive_path(self, month: str) -> str:
+        return os.path.join(self.policy.archive_dir, f"deliveries-{month}.db")
+
+    def step(self, cutoff: Optional[str] = None) -> int:
+        """Перенести одну пачку самых старых строк; вернуть число удалённых (0 — всё готово)."""
+        cutoff = cutoff or self.cutoff()
+        conn = self.pool.connection()
+        oldest = conn.execute(OLDEST_BEFORE_SQL, (cutoff,)).fetchone()[0]
+        if oldest is None:
+            return 0
+
+        # Пачка не пересекает границу месяца: каждая строка попадает в архив своего месяца.
+        month = oldest[:7]
+        until = min(cutoff, _next_month(month))
+        params = (until, self.policy.batch_size)
+
+        archived = False
+        if self.policy.archive_dir:
+            os.makedirs(self.policy.archive_dir, exist_ok=True)
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path(month),))
+            archived = True
+        try:
+            if archived:
+                for sql in ARCHIVE_SCHEMA:
+                    conn.execute(sql)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if archived:
+                    # OR IGNORE: если прошлый проход упал между файлами, строки уже в архиве.
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO archive.deliveries ({ARCHIVE_COLUMNS}) "
+                        f"SELECT {ARCHIVE_COLUMNS} FROM main.deliveries WHERE id IN ({BATCH_IDS_SQL})", params)
+                deleted = conn.execute(
+                    f"DELETE FROM main.delivery_rows WHERE id IN ({BATCH_IDS_SQL})", params).rowcount
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            if archived:
+                conn.execute("DETACH DATABASE archive")
+
+        freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA incremental_vacuum({self.policy.vacuum_pages})").fetchall()
+        freed -= conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        self.stats["batches"] += 1
+        self.stats["deleted"] += deleted
+        self.stats["archived"] += deleted if archived else 0
+        self.stats["vacuumed_pages"] += freed
+        return deleted
+
+    def prune_tombstones(self) -> int:
+        """Удалить устаревшие надгробия журнала изменений одной короткой транзакцией."""
+        if self.policy.tombstone_days <= 0:
+            return 0
+        conn = self.pool.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            pruned = change_feed.prune_tombstones(conn.cursor(), self.policy.tombstone_days)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self.stats["tombstones_pruned"] += pruned
+        return pruned
+
+    def run_once(self) -> int:
+        """Проход целиком (синхронно, для CLI)."""
+        cutoff, total = self.cutoff(), 0
+        while self.policy.enabled:
+            deleted = self.step(cutoff)
+            if not deleted:
+                break
+            total += deleted
+        self.prune_tombstones()
+        self.stats["runs"] += 1
+        return total
+
+    async def _run(self, run: Callable[..., Awaitable[int]]):
+        lock_path = f"{self.pool.db_path}.retention.lock"
+        while not self._stop.is_set():
+            # В нескольких воркерах проход выполняет тот, кто первым взял блокировку.
+            with file_lock(lock_path, blocking=False) as acquired:
+                if acquired:
+                    cutoff, total, started = self.cutoff(), 0, time.perf_counter()
+                    try:
+                        while self.policy.enabled and not self._stop.is_set():
+                            deleted = await run(self.step, cutoff)
+                            if not deleted:
+                                break
+                            total += deleted
+                            await asyncio.sleep(self.policy.pause)
+                        pruned = await run(self.prune_tombstones)
+                        self.stats["runs"] += 1
+                        if total:
+                            logger.info("Срок хранения: перенесено %s строк за %.1fс",
+                                        total, time.perf_counter() - started)
+                        if pruned:
+                            logger.info("Журнал изменений: удалено надгробий %s", pruned)
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        logger.error("Ошибка переноса в архив: %s", e)
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.policy.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, run: Callable[..., Awaitable[int]]):
+        """Запустить фоновое задание; run выполняет функцию в потоке БД (AsyncDeliveryDB.run)."""
+        if not self.policy.has_work or self._task is not None:
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run(run))
+        logger.info("Срок хранения %s дн., архив: %s, надгробия журнала изменений %s дн.",
+                    self.policy.days, self.policy.archive_dir or "нет", self.policy.tombstone_days)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        await self._task
+        self._task = None
+
+
+def convert_to_incremental(db_path: str):
+    """Однократно перевести существующую базу в auto_vacuum=INCREMENTAL (полный VACUUM)."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    db_path = os.environ.get("DELIVERIES_DB", "deliveries.db")
+    parser = argparse.ArgumentParser(description="Перенос старых доставок в архив")
+    parser.add_argument("--days", type=int, default=RetentionPolicy.from_env(db_path).days)
+    parser.add_argument("--convert", action="store_true", help="перевести базу в auto_vacuum=INCREMENTAL")
+    args = parser.parse_args()
+
+    if args.convert:
+        convert_to_incremental(db_path)
+    if args.days <= 0:
+        sys.exit("Укажите срок хранения: --days N или RETENTION_DAYS")
+
+    pool = ConnectionPool(db_path)
+    job = RetentionJob(pool, RetentionPolicy.from_env(db_path)._replace(days=args.days))
+    print(f"Удалено из рабочей таблицы: {job.run_once()}")
+    print(job.stats)
+    pool.close_all()
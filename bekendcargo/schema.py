@@ -0,0 +1,312 @@
+"""Схема хранения доставок со справочниками.
+
+Повторяющиеся строки (перевозчик, тариф, размер коробки, города) хранятся
+один раз в справочниках, а строки доставок — в компактной таблице
+delivery_rows с целочисленными ссылками. Представление deliveries
+возвращает прежние текстовые столбцы, а INSTEAD OF-триггеры позволяют
+по-прежнему писать в него текстом (старые версии приложения, ручные
+запросы, архив). Само приложение читает и пишет delivery_rows напрямую,
+а имена подставляет Dictionary из кэша справочников в памяти: это дешевле
+JOIN с пятью справочниками и не мешает планировщику выбирать индекс.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import sqlite3
+import threading
+
+LOOKUP_TABLES = ["carriers", "tariffs", "box_sizes", "cities"]
+
+# Текстовый столбец deliveries -> (справочник, столбец с ID в delivery_rows).
+ENCODED_COLUMNS = {
+    "company": ("carriers", "company_id"),
+    "delivery_type": ("tariffs", "tariff_id"),
+    "size": ("box_sizes", "size_id"),
+    "town_from": ("cities", "town_from_id"),
+    "town_to": ("cities", "town_to_id"),
+}
+
+ROW_COLUMNS = [
+    "company_id", "tariff_id", "weight", "size_id", "town_from_id", "town_to_id",
+    "price", "delivery_time", "is_completed", "created_at",
+]
+
+# Столбцы delivery_rows в порядке столбцов выдачи (main.DELIVERY_COLUMNS);
+# Dictionary.decode_rows заменяет ID на имена.
+SELECT_ROWS_COLUMNS = [
+    "id", "company_id", "tariff_id", "weight", "size_id",
+    "town_from_id", "town_to_id", "price", "delivery_time", "is_completed",
+    "created_at",
+]
+
+LOOKUP_SCHEMA = [
+    f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)"
+    for table in LOOKUP_TABLES
+]
+
+DELIVERY_ROWS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS delivery_rows (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL REFERENCES carriers (id),
+        tariff_id INTEGER NOT NULL REFERENCES tariffs (id),
+        weight REAL NOT NULL CHECK (weight > 0),
+        size_id INTEGER NOT NULL REFERENCES box_sizes (id),
+        town_from_id INTEGER NOT NULL REFERENCES cities (id),
+        town_to_id INTEGER NOT NULL REFERENCES cities (id),
+        price REAL NOT NULL CHECK (price >= 0),
+        delivery_time INTEGER NOT NULL CHECK (delivery_time > 0),
+        is_completed INTEGER NOT NULL DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# Индексы под реальные запросы (планы проверяет query_plans.py). В индексе
+# SQLite неявно хранится rowid, поэтому (created_at) упорядочен и по
+# (created_at, id) — этого достаточно для keyset-пагинации без сортировки.
+DELIVERY_INDEXES = [
+    # Лента и выгрузка без фильтров, диапазоны дат, перенос в архив.
+    "CREATE INDEX IF NOT EXISTS idx_rows_created ON delivery_rows (created_at)",
+    # Лента по перевозчику и диапазон дат внутри него. price в индекс не входит:
+    # порядок (company_id, created_at, id) избавляет от сортировки, а сводка по
+    # компаниям и так читается из stats_company.
+    "CREATE INDEX IF NOT EXISTS idx_rows_company_created ON delivery_rows (company_id, created_at)",
+    # Лента по городу назначения и покрывающий GROUP BY town_to_id.
+    "CREATE INDEX IF NOT EXISTS idx_rows_town_to_created ON delivery_rows (town_to_id, created_at)",
+]
+
+# LEFT JOIN не даёт планировщику начинать со справочника: внешний цикл
+# всегда идёт по delivery_rows и её индексам, справочники читаются по PK.
+DELIVERIES_VIEW = """
+    CREATE VIEW IF NOT EXISTS deliveries AS
+    SELECT
+        r.id, c.name AS company, t.name AS delivery_type, r.weight, s.name AS size,
+        f.name AS town_from, d.name AS town_to, r.price, r.delivery_time, r.is_completed,
+        r.created_at, r.company_id, r.town_from_id, r.town_to_id
+    FROM delivery_rows r
+    LEFT JOIN carriers c ON c.id = r.company_id
+    LEFT JOIN tariffs t ON t.id = r.tariff_id
+    LEFT JOIN box_sizes s ON s.id = r.size_id
+    LEFT JOIN cities f ON f.id = r.town_from_id
+    LEFT JOIN cities d ON d.id = r.town_to_id
+"""
+
+
+def lookup_inserts(ref: str) -> str:
+    """Добавить в справочники текстовые значения строки ref (NEW, d, ...)."""
+    return "\n".join(
+        f"INSERT INTO {table} (name) VALUES ({ref}.{column}) ON CONFLICT (name) DO NOTHING;"
+        for column, (table, _) in ENCODED_COLUMNS.items()
+    )
+
+
+def encoded_values(ref: str) -> str:
+    """Выражения для ROW_COLUMNS по текстовой строке ref; справочники уже пополнены."""
+    values = {
+        id_column: f"(SELECT id FROM {table} WHERE name = {ref}.{column})"
+        for column, (table, id_column) in ENCODED_COLUMNS.items()
+    }
+    values.update({
+        "weight": f"{ref}.weight",
+        "price": f"{ref}.price",
+        "delivery_time": f"{ref}.delivery_time",
+        "is_completed": f"COALESCE({ref}.is_completed, 0)",
+        "created_at": f"COALESCE({ref}.created_at, CURRENT_TIMESTAMP)",
+    })
+    return ", ".join(values[column] for column in ROW_COLUMNS)
+
+
+def insert_row_sql(ref: str, insert: str = "INSERT") -> str:
+    """Тело триггера: закодировать текстовую строку ref и записать её в delivery_rows."""
+    return f"""
+        {lookup_inserts(ref)}
+        {insert} INTO delivery_rows (id, {', '.join(ROW_COLUMNS)})
+        VALUES ({ref}.id, {encoded_values(ref)});
+    """
+
+
+DELIVERIES_VIEW_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_deliveries_insert INSTEAD OF INSERT ON deliveries
+    BEGIN
+        {insert_row_sql("NEW")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_deliveries_update INSTEAD OF UPDATE ON deliveries
+    BEGIN
+        {lookup_inserts("NEW")}
+        UPDATE delivery_rows SET ({', '.join(ROW_COLUMNS)}) = ({encoded_values("NEW")})
+            WHERE id = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_deliveries_delete INSTEAD OF DELETE ON deliveries
+    BEGIN
+        DELETE FROM delivery_rows WHERE id = OLD.id;
+    END
+    """,
+]
+
+# Сводные таблицы для /api/statistics. Их поддерживают триггеры, поэтому
+# статистика читается за время, не зависящее от размера deliveries. Ключи —
+# имена, как и раньше: таблицы крошечные, а формат не зависит от хранения.
+STATS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS stats_company (
+        company TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        total_price REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_city (
+        town_to TEXT PRIMARY KEY,
+        count INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_insert AFTER INSERT ON delivery_rows
+    BEGIN
+        INSERT INTO stats_company (company, count, total_price)
+            VALUES ((SELECT name FROM carriers WHERE id = NEW.company_id), 1, NEW.price)
+            ON CONFLICT (company) DO UPDATE SET count = count + 1, total_price = total_price + NEW.price;
+        INSERT INTO stats_city (town_to, count)
+            VALUES ((SELECT name FROM cities WHERE id = NEW.town_to_id), 1)
+            ON CONFLICT (town_to) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_delete AFTER DELETE ON delivery_rows
+    BEGIN
+        UPDATE stats_company SET count = count - 1, total_price = total_price - OLD.price
+            WHERE company = (SELECT name FROM carriers WHERE id = OLD.company_id);
+        DELETE FROM stats_company WHERE count <= 0;
+        UPDATE stats_city SET count = count - 1
+            WHERE town_to = (SELECT name FROM cities WHERE id = OLD.town_to_id);
+        DELETE FROM stats_city WHERE count <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_stats_update AFTER UPDATE OF company_id, price, town_to_id ON delivery_rows
+    BEGIN
+        UPDATE stats_company SET count = count - 1, total_price = total_price - OLD.price
+            WHERE company = (SELECT name FROM carriers WHERE id = OLD.company_id);
+        DELETE FROM stats_company WHERE count <= 0;
+        UPDATE stats_city SET count = count - 1
+            WHERE town_to = (SELECT name FROM cities WHERE id = OLD.town_to_id);
+        DELETE FROM stats_city WHERE count <= 0;
+        INSERT INTO stats_company (company, count, total_price)
+            VALUES ((SELECT name FROM carriers WHERE id = NEW.company_id), 1, NEW.price)
+            ON CONFLICT (company) DO UPDATE SET count = count + 1, total_price = total_price + NEW.price;
+        INSERT INTO stats_city (town_to, count)
+            VALUES ((SELECT name FROM cities WHERE id = NEW.town_to_id), 1)
+            ON CONFLICT (town_to) DO UPDATE SET count = count + 1;
+    END
+    """,
+]
+
+REBUILD_STATS_SQL = [
+    "DELETE FROM stats_company",
+    "DELETE FROM stats_city",
+    """
+    INSERT INTO stats_company (company, count, total_price)
+    SELECT c.name, COUNT(*), SUM(r.price) FROM delivery_rows r
+    JOIN carriers c ON c.id = r.company_id GROUP BY r.company_id
+    """,
+    """
+    INSERT INTO stats_city (town_to, count)
+    SELECT c.name, COUNT(*) FROM delivery_rows r
+    JOIN cities c ON c.id = r.town_to_id GROUP BY r.town_to_id
+    """,
+]
+
+DELIVERY_SCHEMA = LOOKUP_SCHEMA + [DELIVERY_ROWS_SCHEMA] + DELIVERY_INDEXES + [DELIVERIES_VIEW] + DELIVERIES_VIEW_TRIGGERS
+
+
+class Dictionary:
+    """Кэш справочников в обе стороны: name -> id и id -> name.
+
+    Значения справочников только добавляются и никогда не меняют ID, поэтому
+    кэш в памяти процесса не устаревает, даже если новые значения добавил
+    другой воркер: промах просто читает или создаёт запись в БД.
+
+    Кэшем пользуются потоки пула и поток отложенной записи: попадание идёт
+    без блокировки, промах (чтение и вставка) — под _lock. Имя кладётся в
+    _names раньше, чем ID в _ids, поэтому найденный ID всегда декодируется.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, Dict[str, int]] = {table: {} for table in LOOKUP_TABLES}
+        self._names: Dict[str, Dict[int, str]] = {table: {} for table in LOOKUP_TABLES}
+        self._lock = threading.Lock()
+
+    def _read(self, conn: sqlite3.Connection, table: str, name: str) -> Optional[int]:
+        """Промах кэша; вызывать под _lock."""
+        value_id = self._ids[table].get(name)
+        if value_id is None:
+            row = conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()
+            if row is not None:
+                self._names[table][row[0]] = name
+                value_id = self._ids[table][name] = row[0]
+        return value_id
+
+    def lookup(self, conn: sqlite3.Connection, table: str, name: str) -> Optional[int]:
+        value_id = self._ids[table].get(name)
+        if value_id is None:
+            with self._lock:
+                value_id = self._read(conn, table, name)
+        return value_id
+
+    def encode(self, conn: sqlite3.Connection, table: str, name: str) -> int:
+        """ID значения, при необходимости добавив его в справочник.
+
+        Вызывать вне транзакции записи: значение фиксируется сразу, иначе откат
+        транзакции оставил бы в кэше ID несуществующей записи.
+        """
+        value_id = self._ids[table].get(name)
+        if value_id is None:
+            with self._lock:
+                value_id = self._read(conn, table, name)
+                if value_id is None:
+                    conn.execute(f"INSERT INTO {table} (name) VALUES (?) ON CONFLICT (name) DO NOTHING", (name,))
+                    value_id = self._read(conn, table, name)
+        return value_id
+
+    def encode_row(self, conn: sqlite3.Connection, company: str, delivery_type: str, weight: float,
+                   size: str, town_from: str, town_to: str, price: float, days: int) -> List:
+        """Значения для вставки в delivery_rows (без is_completed и created_at)."""
+        return [
+            self.encode(conn, "carriers", company), self.encode(conn, "tariffs", delivery_type), weight,
+            self.encode(conn, "box_sizes", size), self.encode(conn, "cities", town_from),
+            self.encode(conn, "cities", town_to), price, days,
+        ]
+
+    def refresh(self, conn: sqlite3.Connection):
+        """Перечитать справочники целиком: в каждом десятки строк."""
+        for table in LOOKUP_TABLES:
+            rows = conn.execute(f"SELECT id, name FROM {table}").fetchall()
+            # Словари заменяются целиком, а не меняются на месте: читатели без блокировки
+            # видят либо старый, либо новый.
+            self._names[table] = dict(rows)
+            self._ids[table] = {name: value_id for value_id, name in rows}
+
+    def _decode(self, rows: Sequence[tuple]) -> List[tuple]:
+        carriers, tariffs, sizes, cities = (self._names[t] for t in ("carriers", "tariffs", "box_sizes", "cities"))
+        return [
+            (i, carriers[company], tariffs[tariff], weight, sizes[size], cities[town_from], cities[town_to],
+             price, days, completed, created_at)
+            for i, company, tariff, weight, size, town_from, town_to, price, days, completed, created_at in rows
+        ]
+
+    def decode_rows(self, conn: sqlite3.Connection, rows: Sequence[tuple]) -> List[tuple]:
+        """Строки SELECT_ROWS_COLUMNS -> строки с именами вместо ID."""
+        try:
+            return self._decode(rows)
+        except KeyError:
+            # Значение добавил другой процесс или кэш ещё пуст.
+            self.refresh(conn)
+            return self._decode(rows)
+
+    def clear(self):
+        for table in LOOKUP_TABLES:
+            self._ids[table] = {}
+            self._names[table] = {}
@@ -0,0 +1,43 @@
+"""Сериализация ответов с предложениями без pydantic на горячем пути.
+
+Результаты расчёта (models.SearchResult, models.TariffsResult) — dataclass
+со __slots__: orjson кодирует их напрямую, без построения и повторной
+валидации pydantic-моделей. Поля совпадают с SearchResponse/TariffsResponse,
+поэтому тело ответа то же, что и раньше.
+
+RESPONSE_SERIALIZER=pydantic возвращает прежний путь через модели
+(для сравнения в benchmarks.serialization и на случай расхождений).
+"""
+import dataclasses
+import json
+import os
+from typing import Any, Type
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # без orjson — стандартный json, тот же формат
+    orjson = None
+
+RESPONSE_SERIALIZER = os.environ.get("RESPONSE_SERIALIZER", "fast")
+
+
+def _as_dict(obj: Any) -> dict:
+    if dataclasses.is_dataclass(obj):
+        return {field.name: getattr(obj, field.name) for field in dataclasses.fields(obj)}
+    raise TypeError(f"{type(obj).__name__} не сериализуется в JSON")
+
+
+def dumps(obj: Any) -> bytes:
+    """Компактный JSON в UTF-8, как у pydantic model_dump_json."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_as_dict, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def render(result: Any, model: Type[BaseModel]) -> bytes:
+    """Тело ответа для результата расчёта; model — pydantic-модель ответа из OpenAPI."""
+    if RESPONSE_SERIALIZER == "pydantic":
+        return model.model_validate(result, from_attributes=True).model_dump_json().encode()
+    return dumps(result)
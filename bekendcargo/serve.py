@@ -0,0 +1,78 @@
+"""Боевой запуск API в несколько процессов.
+
+    python serve.py                       # воркеров по числу ядер (или WEB_CONCURRENCY)
+    python serve.py --workers 4 --port 8000
+
+Мастер-процесс один раз, под файловой блокировкой, проверяет целостность
+базы, при необходимости пересоздаёт её и применяет схему. После этого
+uvicorn открывает общий сокет и запускает воркеры. Каждый воркер открывает
+собственные WAL-соединения и проверку целостности пропускает
+(DELIVERIES_DB_PREPARED=1). Записи разных воркеров сериализует SQLite
+(BEGIN IMMEDIATE + busy_timeout). HTTP-кэш сбрасывается по PRAGMA data_version,
+поэтому изменения из соседних процессов тоже видны (не позже чем через
+DATA_VERSION_INTERVAL_MS).
+
+Там же, если нужно, строится сетка цен (price_grid.py): воркеры отображают
+один и тот же файл в память и делят его страницы.
+
+Кэш расчётов и метрики у каждого воркера свои: /api/metrics показывает
+значения того процесса, который принял запрос.
+"""
+import argparse
+import logging
+import os
+import sys
+
+import uvicorn
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger("serve")
+
+
+def prepare_database():
+    """Проверка и миграция базы до старта воркеров."""
+    os.environ.pop("DELIVERIES_DB_PREPARED", None)
+    sys.path.insert(0, APP_DIR)
+    from main import DB_PATH, db
+
+    db.close()
+    os.environ["DELIVERIES_DB_PREPARED"] = "1"
+    logger.info("База подготовлена: %s", DB_PATH)
+
+
+def prepare_price_grid():
+    import tariff_engine
+    from pricing import PRICE_GRID
+
+    if not PRICE_GRID.ensure(tariff_engine.current()):
+        logger.info("Сетка цен актуальна: %s", PRICE_GRID.path)
+
+
+def main_cli(argv) -> int:
+    parser = argparse.ArgumentParser(description="Запуск Delivery Aggregator API в несколько процессов")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info").lower())
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args(argv)
+
+    prepare_database()
+    prepare_price_grid()
+    logger.info("Запуск %d воркеров на %s:%d", args.workers, args.host, args.port)
+    uvicorn.run(
+        "main:app",
+        app_dir=APP_DIR,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        access_log=not args.no_access_log,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
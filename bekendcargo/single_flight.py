@@ -0,0 +1,63 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов (single-flight).
+
+    Первый запрос с ключом выполняет работу, остальные с тем же ключом ждут
+    и получают его результат. С window > 0 результат после завершения ещё
+    window секунд отдаётся и последовательным повторам — для клиентов, которые
+    шлют один расчёт пачкой; их собственные строки в БД при этом не пишутся.
+    Ошибка первого запроса передаётся только тем, кто ждал вместе с ним.
+    """
+
+    def __init__(self, window: float = 0.0):
+        self.window = window
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "failed": 0}
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Результат fn и признак того, что он получен от другого запроса."""
+        future = self._flights.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # отменили этот запрос, а не первый
+                self.stats["coalesced"] -= 1
+                return await self.run(key, fn)
+
+        loop = asyncio.get_running_loop()
+        future = self._flights[key] = loop.create_future()
+        self.stats["leaders"] += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            self._forget(key, future)
+            raise
+        except BaseException as e:
+            self.stats["failed"] += 1
+            future.set_exception(e)
+            future.exception()  # ждущих может не быть: не выводить «exception was never retrieved»
+            self._forget(key, future)
+            raise
+
+        future.set_result(result)
+        if self.window > 0:
+            loop.call_later(self.window, self._forget, key, future)
+        else:
+            self._forget(key, future)
+        return result, False
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._flights.get(key) is future:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
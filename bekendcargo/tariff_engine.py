@@ -0,0 +1,201 @@
+"""Табличный расчёт тарифов перевозчиков.
+
+Перевозчики, тарифы, ставки, надбавки за коробку и формулы сроков описаны
+в tariffs.json (путь можно переопределить переменной TARIFFS_FILE). Файл
+читается один раз и компилируется в кортеж RateRecord; расчёт одного
+предложения — несколько арифметических операций над полями записи, без
+сравнения строк. reload() атомарно подменяет таблицу, поэтому запросы,
+начатые до перезагрузки, досчитываются по старой.
+
+Каждый процесс (воркер serve.py, процесс пула bulk_quote) не чаще раза в
+TARIFFS_RECHECK_S секунд сверяет mtime, размер и inode файла и при
+изменении перечитывает его сам, так что после правки tariffs.json все
+воркеры переходят на новую таблицу без перезапуска. Файл с ошибкой не
+применяется: остаётся прежняя таблица. TARIFFS_RECHECK_S=0 — без проверки.
+
+Модуль не зависит от FastAPI и используется и бэкендом, и фронтендом.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+TARIFFS_FILE = os.environ.get(
+    "TARIFFS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tariffs.json"))
+RECHECK_INTERVAL = float(os.environ.get("TARIFFS_RECHECK_S", 1.0))
+
+
+class DaysFormula(NamedTuple):
+    """Срок в днях: max(floor, zone_diff // div + add)."""
+    div: int = 1
+    add: int = 0
+    floor: int = 1
+
+    def __call__(self, zone_diff: int) -> int:
+        return max(self.floor, zone_diff // self.div + self.add)
+
+
+class RateRecord(NamedTuple):
+    company: str
+    tariff_name: str
+    base: int
+    per_kg: int
+    per_kg_zone: int
+    days_min: DaysFormula
+    days_max: DaysFormula
+
+
+class Quote(NamedTuple):
+    rate: RateRecord
+    price: int
+    days_min: int
+    days_max: int
+
+
+class TariffTable:
+    def __init__(self, records: List[RateRecord], box_extra: Dict[str, int], min_price: int = 290,
+                 round_to: int = 10, jitter: Tuple[float, float] = (0.92, 1.08), version: str = ""):
+        self.records: Tuple[RateRecord, ...] = tuple(records)
+        self.box_extra = dict(box_extra)
+        self.min_price = min_price
+        self.round_to = round_to
+        self.jitter_low, self.jitter_high = jitter
+        self.version = version
+        # Разница зон -> [(days_min, days_max)] по тарифам; сроки не зависят от веса и коробки.
+        self._days: Dict[int, List[Tuple[int, int]]] = {}
+
+    def base_price(self, rate: RateRecord, charge_weight: float, zone_diff: int, box: str) -> float:
+        """Цена до разброса и округления (её хранит price_grid)."""
+        return (rate.base + (charge_weight - 1) * (rate.per_kg + zone_diff * rate.per_kg_zone)
+                + self.box_extra.get(box, 0))
+
+    def finish_price(self, base_price: float, rng: Optional[random.Random] = None) -> int:
+        price = int(base_price * (rng or random).uniform(self.jitter_low, self.jitter_high))
+        return max(self.min_price, round(price / self.round_to) * self.round_to)
+
+    def price(self, rate: RateRecord, charge_weight: float, zone_diff: int, box: str,
+              rng: Optional[random.Random] = None) -> int:
+        return self.finish_price(self.base_price(rate, charge_weight, zone_diff, box), rng)
+
+    def quote(self, charge_weight: float, zone_diff: int, box: str,
+              rng: Optional[random.Random] = None) -> List[Quote]:
+        """Все тарифы в порядке файла (от него зависит последовательность разброса цен)."""
+        return self.quote_base([self.base_price(rate, charge_weight, zone_diff, box) for rate in self.records],
+                               zone_diff, rng)
+
+    def quote_base(self, base_prices: Sequence[float], zone_diff: int,
+                   rng: Optional[random.Random] = None) -> List[Quote]:
+        """То же, что quote, по готовым ценам до разброса — по одной на тариф в порядке records."""
+        days = self._days.get(zone_diff)
+        if days is None:
+            days = self._days[zone_diff] = [(r.days_min(zone_diff), r.days_max(zone_diff)) for r in self.records]
+        uniform = (rng or random).uniform
+        low, high, round_to, min_price = self.jitter_low, self.jitter_high, self.round_to, self.min_price
+        quotes = []
+        for rate, base, (days_min, days_max) in zip(self.records, base_prices, days):
+            # Та же арифметика, что в finish_price, без вызова метода на каждый тариф.
+            price = int(base * uniform(low, high))
+            quotes.append(Quote(rate, max(min_price, round(price / round_to) * round_to), days_min, days_max))
+        return quotes
+
+    def find(self, company: str, tariff_name: str) -> Optional[RateRecord]:
+        for rate in self.records:
+            if rate.company == company and rate.tariff_name == tariff_name:
+                return rate
+        return None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+def _days(spec: Dict) -> DaysFormula:
+    formula = DaysFormula(**spec)
+    if formula.div < 1:
+        raise ValueError(f"div в формуле срока должен быть >= 1: {spec}")
+    return formula
+
+
+def compile_tariffs(data: Dict, version: str = "") -> TariffTable:
+    records = []
+    for carrier in data["carriers"]:
+        company = carrier["company"]
+        for tariff in carrier["tariffs"]:
+            try:
+                records.append(RateRecord(
+                    company, tariff["name"], int(tariff["base"]), int(tariff["per_kg"]),
+                    int(tariff["per_kg_zone"]), _days(tariff["days_min"]), _days(tariff["days_max"]),
+                ))
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Некорректный тариф {company} / {tariff.get('name')}: {e}") from e
+    if not records:
+        raise ValueError("В таблице тарифов нет ни одного тарифа")
+
+    low, high = data.get("jitter", (0.92, 1.08))
+    return TariffTable(records, data.get("box_extra", {}), int(data.get("min_price", 290)),
+                       int(data.get("round_to", 10)), (float(low), float(high)), version)
+
+
+def load_tariffs(path: str = TARIFFS_FILE) -> TariffTable:
+    with open(path, "rb") as f:
+        raw = f.read()
+    return compile_tariffs(json.loads(raw), hashlib.blake2b(raw, digest_size=8).hexdigest())
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+_lock = threading.Lock()
+_stamp = _file_stamp(TARIFFS_FILE)
+_table = load_tariffs()
+_checked_at = time.monotonic()
+
+
+def _recheck():
+    global _table, _stamp, _checked_at
+    if not _lock.acquire(blocking=False):
+        return  # файл уже проверяет другой поток
+    try:
+        _checked_at = time.monotonic()
+        stamp = _file_stamp(TARIFFS_FILE)
+        if stamp is None or stamp == _stamp:
+            return
+        _stamp = stamp  # файл с ошибкой не перечитываем до следующего изменения
+        try:
+            table = load_tariffs(TARIFFS_FILE)
+        except (OSError, ValueError) as e:
+            logger.error("tariffs.json изменён, но не загружен, остаётся версия %s: %s", _table.version, e)
+            return
+        if table.version != _table.version:
+            _table = table
+            logger.info("tariffs.json изменён: версия %s, тарифов %d", table.version, len(table))
+    finally:
+        _lock.release()
+
+
+def current() -> TariffTable:
+    if RECHECK_INTERVAL > 0 and time.monotonic() - _checked_at >= RECHECK_INTERVAL:
+        _recheck()
+    return _table
+
+
+def reload(path: str = TARIFFS_FILE) -> TariffTable:
+    """Перечитать файл; при ошибке остаётся прежняя таблица и выбрасывается ValueError/OSError."""
+    global _table, _stamp
+    stamp = _file_stamp(path)
+    table = load_tariffs(path)
+    with _lock:
+        _table = table
+        if path == TARIFFS_FILE:
+            _stamp = stamp
+    return table
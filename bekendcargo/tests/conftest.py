@@ -0,0 +1,24 @@
+"""Общая настройка тестов: приложение работает с временной базой.
+
+Переменные окружения задаются до импорта main — он открывает базу при импорте.
+"""
+import os
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="cargo-tests-")
+os.environ["DELIVERIES_DB"] = os.path.join(_TMP, "deliveries.db")
+os.environ["PRICE_GRID_FILE"] = os.path.join(_TMP, "price_grid.bin")
+os.environ.setdefault("RATE_LIMIT_RPS", "0")
+os.environ.setdefault("INTEGRITY_CHECK", "off")
+
+
+@pytest.fixture
+def delivery_db(tmp_path):
+    """Отдельная пустая база на тест."""
+    import main
+
+    db = main.DeliveryDB(str(tmp_path / "deliveries.db"), check_integrity=False)
+    yield db
+    db.close()
@@ -0,0 +1,93 @@
+"""Доступ к БД из async-обработчиков: версия данных для HTTP-кэша и потоковая выгрузка."""
+import asyncio
+import csv
+import io
+import json
+import sqlite3
+import threading
+
+import httpx
+import pytest
+
+import main
+from async_db import AsyncDeliveryDB
+from write_behind import DeliveryRecord
+
+
+def records(company: str, count: int):
+    return [DeliveryRecord(company, "экспресс лайт", 1.0, "M", "Москва", "Казань", 100 + i, 3) for i in range(count)]
+
+
+def test_data_version_reads_pragma_at_most_once_per_interval(delivery_db, monkeypatch):
+    calls = []
+    pragma = delivery_db.pool.data_version
+    monkeypatch.setattr(delivery_db.pool, "data_version", lambda: calls.append(1) or pragma())
+    monkeypatch.setattr(main, "DATA_VERSION_INTERVAL", 60)
+
+    first = delivery_db.data_version
+    assert [delivery_db.data_version for _ in range(100)] == [first] * 100
+    assert len(calls) == 1
+
+    # Свой коммит меняет версию сразу, без PRAGMA.
+    delivery_db.save_deliveries(records("СДЭК", 1))
+    assert delivery_db.data_version != first
+    assert len(calls) == 1
+
+
+def test_data_version_sees_other_connections_after_interval(delivery_db, monkeypatch):
+    monkeypatch.setattr(main, "DATA_VERSION_INTERVAL", 0)
+    before = delivery_db.data_version
+    other = main.DeliveryDB(delivery_db.db_path, check_integrity=False)  # как соседний воркер
+    other.save_deliveries(records("СДЭК", 1))
+    other.close()
+    assert delivery_db.data_version[1] != before[1]
+
+
+def test_export_reads_chunks_in_db_pool_and_closes_connection(delivery_db, monkeypatch):
+    delivery_db.save_deliveries(records("СДЭК", 25))
+    adb = AsyncDeliveryDB(delivery_db, max_workers=1)
+    threads, opened = set(), []
+    connect = delivery_db.pool._connect
+    monkeypatch.setattr(delivery_db.pool, "_connect", lambda: opened.append(connect()) or opened[-1])
+
+    def encode(rows):
+        threads.add(threading.current_thread().name)
+        return len(rows)
+
+    async def scenario():
+        sizes = [size async for size in adb.iter_deliveries(main.DeliveryFilters(), encode, chunk_size=10)]
+        # Клиент оборвал выгрузку после первой пачки.
+        stream = adb.iter_deliveries(main.DeliveryFilters(), encode, chunk_size=10)
+        await stream.__anext__()
+        await stream.aclose()
+        return sizes
+
+    assert asyncio.run(scenario()) == [10, 10, 5]
+    assert all(name.startswith("delivery-db") for name in threads)
+    adb.executor.shutdown()
+    # Оба выделенных соединения выгрузки закрыты, в том числе после обрыва.
+    assert len(opened) == 2
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+
+def test_export_endpoint_streams_ndjson_and_csv():
+    main.db.save_deliveries(records("Экспорт-тест", 3))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            params = {"company": "Экспорт-тест"}
+            ndjson = await client.get("/api/deliveries", params={**params, "format": "ndjson"})
+            table = await client.get("/api/deliveries", params={**params, "format": "csv"})
+            return ndjson, table
+
+    ndjson, table = asyncio.run(scenario())
+    rows = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert [row["price"] for row in rows] == [102, 101, 100]
+    assert rows[0]["company"] == "Экспорт-тест" and rows[0]["town_to"] == "г. Казань"
+
+    lines = list(csv.reader(io.StringIO(table.text)))
+    assert lines[0] == list(main.DELIVERY_COLUMNS)
+    assert [line[7] for line in lines[1:]] == ["102.0", "101.0", "100.0"]
@@ -0,0 +1,76 @@
+"""Пакетный расчёт (batch_quote.py, /api/calculate/batch) и проверка веса в запросах расчёта."""
+import asyncio
+import json
+import math
+import warnings
+
+import httpx
+import pytest
+
+import main
+from batch_quote import quote_batch, to_columns
+from pricing import CITY_INDEX, get_offers, quote_rng, weight_bucket
+
+
+def post_batch(payload) -> httpx.Response:
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            # json.dumps пишет NaN и Infinity, как их шлют клиенты на JavaScript и Python.
+            return await client.post("/api/calculate/batch", content=json.dumps(payload),
+                                     headers={"content-type": "application/json"})
+    return asyncio.run(scenario())
+
+
+def test_prices_match_single_quotes():
+    rows = [("Москва", "Казань", 2.0, "M"), ("Сочи", "Омск", 0.3, "XS"), ("Тула", "Магадан", 37.5, "XXXL"),
+            ("Москва", "Казань", 2.4, "M")]
+    result = quote_batch(*map(list, zip(*rows)))
+    for i, (from_city, to_city, weight, box) in enumerate(rows):
+        from_id, to_id = CITY_INDEX.resolve(from_city), CITY_INDEX.resolve(to_city)
+        rng = quote_rng("calculate", from_id, to_id, weight_bucket(weight), box)
+        single = {(o.company, o.tariff_name): o.price
+                  for o in get_offers(weight, box, CITY_INDEX.zone_diff(from_id, to_id), rng)}
+        assert {(t["company"], t["tariff_name"]): int(t["price"][i]) for t in result["tariffs"]} == single
+
+
+@pytest.mark.parametrize("weight", [math.nan, math.inf, -math.inf, 0.0, -1.0, 501.0])
+def test_bad_weight_is_a_row_error_without_nan_prices(weight):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # приведение NaN к int64 — RuntimeWarning
+        result = quote_batch(["Москва", "Москва"], ["Казань", "Казань"], [weight, 2.0], ["XXXXL", "M"])
+    assert result["errors"] == [{"index": 0, "detail": "Вес должен быть больше 0 и не больше 500 кг"}]
+    assert list(result["valid"]) == [False, True]
+    for tariff in result["tariffs"]:
+        assert tariff["price"][0] == 0 and tariff["price"][1] > 0
+    to_columns(result)
+
+
+def test_endpoint_rejects_non_finite_and_non_positive_weights():
+    response = post_batch({
+        "from_city": ["Москва"] * 5, "to_city": ["Казань"] * 5,
+        "weight": [2.0, math.nan, math.inf, 0, -3], "box_size": ["M"] * 5,
+    })
+    assert response.status_code == 422
+    assert sorted(error["loc"] for error in response.json()["detail"]) == [["body", "weight", i] for i in (1, 2, 3, 4)]
+
+
+def test_endpoint_reports_row_errors_in_body():
+    response = post_batch({
+        "from_city": ["Москва", "Москва", "Нигде"], "to_city": ["Казань", "Москва", "Казань"],
+        "weight": [2.0, 2.0, 2.0], "box_size": ["M", "M", "M"],
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert [e["index"] for e in body["errors"]] == [1, 2]
+    assert all(t["price"][0] > 0 and t["price"][1:] == [0, 0] for t in body["tariffs"])
+
+
+@pytest.mark.parametrize("weight", ["NaN", "Infinity", "0", "-1"])
+def test_tariffs_reject_bad_weight(weight):
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return await client.post("/api/tariffs", content=f'{{"city": "Казань", "weight": {weight}}}',
+                                     headers={"content-type": "application/json"})
+    response = asyncio.run(scenario())
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "weight"]
@@ -0,0 +1,126 @@
+"""Журнал изменений доставок (change_feed.py): порядок seq, надгробия, граница pruned_seq."""
+import sqlite3
+
+import change_feed
+from retention import RetentionJob, RetentionPolicy
+from write_behind import DeliveryRecord
+
+
+def add(db, count: int):
+    db.save_deliveries([
+        DeliveryRecord("СДЭК", "экспресс лайт", 1.0, "M", "Москва", "Казань", 100 + i, 3) for i in range(count)
+    ])
+
+
+def execute(db, sql: str, params=()):
+    with db.pool.transaction() as conn:
+        conn.execute(sql, params)
+
+
+def age_tombstones(db, changed_at: str = "2000-01-01 00:00:00"):
+    execute(db, "UPDATE delivery_changes SET changed_at = ? WHERE deleted = 1", (changed_at,))
+
+
+def test_inserts_come_in_seq_order_with_paging(delivery_db):
+    add(delivery_db, 5)
+    first = delivery_db.get_changes(0, limit=3)
+    assert not first.reset and first.has_more
+    assert [row[0] for row in first.rows] == [1, 2, 3]
+    assert first.rows[0][6] == "г. Казань"  # строки раскодированы из справочников
+
+    rest = delivery_db.get_changes(first.seq, limit=3)
+    assert [row[0] for row in rest.rows] == [4, 5] and not rest.has_more
+    assert delivery_db.get_changes(rest.seq).rows == []
+
+
+def test_update_moves_row_to_the_end_once(delivery_db):
+    add(delivery_db, 3)
+    seq = delivery_db.get_changes(0).seq
+    execute(delivery_db, "UPDATE delivery_rows SET is_completed = 1 WHERE id = 1")
+    execute(delivery_db, "UPDATE delivery_rows SET price = 999 WHERE id = 1")
+
+    batch = delivery_db.get_changes(seq)
+    assert [row[0] for row in batch.rows] == [1] and batch.rows[0][7] == 999
+    # В журнале по одной записи на доставку.
+    assert [row[0] for row in delivery_db.get_changes(0).rows] == [2, 3, 1]
+
+
+def test_delete_becomes_tombstone(delivery_db):
+    add(delivery_db, 3)
+    seq = delivery_db.get_changes(0).seq
+    execute(delivery_db, "DELETE FROM delivery_rows WHERE id = 2")
+
+    batch = delivery_db.get_changes(seq)
+    assert batch.rows == [] and batch.deleted == [2]
+    full = delivery_db.get_changes(0)
+    assert [row[0] for row in full.rows] == [1, 3] and full.deleted == [2]
+
+
+def test_pruned_tombstones_reset_clients_behind_the_boundary(delivery_db):
+    add(delivery_db, 4)
+    behind = delivery_db.get_changes(0, limit=1).seq
+    execute(delivery_db, "DELETE FROM delivery_rows WHERE id IN (2, 3)")
+    synced = delivery_db.get_changes(0).seq
+    age_tombstones(delivery_db)
+
+    with delivery_db.pool.transaction() as conn:
+        assert change_feed.prune_tombstones(conn.cursor(), days=30) == 2
+    pruned_seq = delivery_db.pool.connection().execute("SELECT pruned_seq FROM change_feed_state").fetchone()[0]
+    assert pruned_seq == synced
+
+    # Клиент, не видевший удалений, начинает заново; догнавший — продолжает.
+    assert delivery_db.get_changes(behind).reset
+    assert not delivery_db.get_changes(synced).reset
+    assert delivery_db.get_changes(0).deleted == []
+
+
+def test_fresh_tombstones_are_kept(delivery_db):
+    add(delivery_db, 2)
+    execute(delivery_db, "DELETE FROM delivery_rows WHERE id = 1")
+    with delivery_db.pool.transaction() as conn:
+        assert change_feed.prune_tombstones(conn.cursor(), days=30) == 0
+    assert delivery_db.get_changes(0).deleted == [1]
+
+
+def test_retention_job_prunes_tombstones_without_retention_days(delivery_db):
+    add(delivery_db, 3)
+    execute(delivery_db, "DELETE FROM delivery_rows WHERE id = 1")
+    age_tombstones(delivery_db)
+
+    job = RetentionJob(delivery_db.pool, RetentionPolicy(days=0, tombstone_days=30))
+    assert job.policy.has_work
+    assert job.run_once() == 0
+    assert job.stats["tombstones_pruned"] == 1 and job.stats["runs"] == 1
+    assert RetentionJob(delivery_db.pool, RetentionPolicy(tombstone_days=0)).prune_tombstones() == 0
+
+
+def test_clear_resets_every_client(delivery_db):
+    add(delivery_db, 3)
+    seq = delivery_db.get_changes(0).seq
+    assert delivery_db.clear_deliveries()
+
+    assert delivery_db.get_changes(seq).reset
+    fresh = delivery_db.get_changes(0)
+    assert not fresh.reset and fresh.rows == [] and fresh.deleted == []
+    add(delivery_db, 1)
+    after = delivery_db.get_changes(0)
+    assert [row[0] for row in after.rows] == [4] and after.seq > seq
+
+
+def test_since_beyond_last_seq_resets(delivery_db):
+    add(delivery_db, 2)
+    batch = delivery_db.get_changes(10_000)
+    assert batch.reset and batch.seq == 0
+
+
+def test_install_backfills_existing_rows(tmp_path):
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute("CREATE TABLE delivery_rows (id INTEGER PRIMARY KEY, price REAL)")
+    conn.executemany("INSERT INTO delivery_rows (price) VALUES (?)", [(100,), (200,)])
+    change_feed.install(conn.cursor())
+    assert conn.execute("SELECT seq, delivery_id, deleted FROM delivery_changes").fetchall() == [(1, 1, 0), (2, 2, 0)]
+
+    # Повторная установка ничего не добавляет.
+    change_feed.install(conn.cursor())
+    assert conn.execute("SELECT count(*) FROM delivery_changes").fetchone()[0] == 2
+    conn.close()
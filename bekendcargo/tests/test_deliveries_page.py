@@ -0,0 +1,83 @@
+"""Лента доставок с keyset-курсором по (created_at, id) и потоковая выгрузка."""
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+from main import DeliveryFilters, decode_cursor, encode_cursor
+from write_behind import DeliveryRecord
+
+
+def fill(db, companies):
+    db.save_deliveries([
+        DeliveryRecord(company, "экспресс лайт", 1.0, "M", "Москва", "Казань", 100 + i, 3)
+        for i, company in enumerate(companies)
+    ])
+
+
+def set_created_at(db, created_at: str, where: str = "1 = 1"):
+    with db.pool.transaction() as conn:
+        conn.execute(f"UPDATE delivery_rows SET created_at = ? WHERE {where}", (created_at,))
+
+
+def all_pages(db, filters=DeliveryFilters(), limit=10):
+    ids, cursor = [], None
+    while True:
+        page, cursor = db.get_deliveries_page(filters, limit, cursor)
+        ids.extend(row["id"] for row in page)
+        if cursor is None:
+            return ids
+
+
+def test_cursor_walks_rows_with_equal_created_at(delivery_db):
+    fill(delivery_db, ["СДЭК"] * 25)
+    set_created_at(delivery_db, "2026-01-15 12:00:00")
+
+    # Одинаковое время: порядок и граница страницы держатся на id.
+    assert all_pages(delivery_db, limit=10) == list(range(25, 0, -1))
+    assert all_pages(delivery_db, limit=25) == list(range(25, 0, -1))
+
+
+def test_cursor_orders_by_created_at_then_id(delivery_db):
+    fill(delivery_db, ["СДЭК"] * 12)
+    set_created_at(delivery_db, "2026-01-10 09:00:00", "id % 3 = 0")
+    set_created_at(delivery_db, "2026-01-20 09:00:00", "id % 3 = 1")
+    set_created_at(delivery_db, "2026-01-20 09:00:00", "id % 3 = 2")
+
+    newer = [i for i in range(12, 0, -1) if i % 3 != 0]
+    older = [i for i in range(12, 0, -1) if i % 3 == 0]
+    assert all_pages(delivery_db, limit=5) == newer + older
+
+
+def test_cursor_respects_filters_and_date_range(delivery_db):
+    fill(delivery_db, ["СДЭК", "Boxberry"] * 10)
+    set_created_at(delivery_db, "2026-01-05 10:00:00", "id <= 8")
+    set_created_at(delivery_db, "2026-02-05 10:00:00", "id > 8")
+
+    sdek = DeliveryFilters(company="СДЭК")
+    assert all_pages(delivery_db, sdek, limit=3) == list(range(19, 0, -2))
+    january = DeliveryFilters(company="СДЭК", date_from=date(2026, 1, 1), date_to=date(2026, 1, 31))
+    assert all_pages(delivery_db, january, limit=3) == [7, 5, 3, 1]
+    assert all_pages(delivery_db, DeliveryFilters(company="DHL")) == []
+
+
+def test_page_without_more_rows_has_no_cursor(delivery_db):
+    fill(delivery_db, ["СДЭК"] * 3)
+    page, cursor = delivery_db.get_deliveries_page(DeliveryFilters(), limit=3)
+    assert len(page) == 3 and cursor is None
+
+
+def test_cursor_round_trip_and_garbage():
+    assert decode_cursor(encode_cursor("2026-01-15 12:00:00", 42)) == ("2026-01-15 12:00:00", 42)
+    with pytest.raises(HTTPException) as e:
+        decode_cursor("не курсор")
+    assert e.value.status_code == 400
+
+
+def test_export_streams_rows_in_page_order(delivery_db):
+    fill(delivery_db, ["СДЭК", "Boxberry"] * 10)
+    set_created_at(delivery_db, "2026-01-15 12:00:00")
+
+    chunks = list(delivery_db.iter_deliveries(DeliveryFilters(), chunk_size=6))
+    assert [len(chunk) for chunk in chunks] == [6, 6, 6, 2]
+    assert [row[0] for chunk in chunks for row in chunk] == all_pages(delivery_db, limit=7)
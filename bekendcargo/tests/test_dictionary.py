@@ -0,0 +1,31 @@
+"""Кэш справочников под одновременными промахами из нескольких потоков."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_concurrent_encode_returns_one_id_per_name(delivery_db):
+    dictionary = delivery_db.dictionary
+    names = [f"г. Тест-{i}" for i in range(50)]
+    barrier = threading.Barrier(8)
+
+    def encode_all(shift):
+        conn = delivery_db.pool.connection()
+        barrier.wait()
+        return {name: dictionary.encode(conn, "cities", name) for name in names[shift:] + names[:shift]}
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(encode_all, range(0, 50, 7)))
+
+    assert all(result == results[0] for result in results)
+    conn = delivery_db.pool.connection()
+    stored = dict(conn.execute("SELECT name, id FROM cities WHERE name LIKE 'г. Тест-%'").fetchall())
+    assert stored == results[0]
+    assert len(set(stored.values())) == len(names)
+    for name, value_id in stored.items():
+        assert dictionary._names["cities"][value_id] == name
+
+
+def test_lookup_does_not_insert(delivery_db):
+    conn = delivery_db.pool.connection()
+    assert delivery_db.dictionary.lookup(conn, "cities", "г. Нигде") is None
+    assert conn.execute("SELECT COUNT(*) FROM cities WHERE name = 'г. Нигде'").fetchone()[0] == 0
@@ -0,0 +1,53 @@
+"""Фронтенд (frontedcargo) берёт города и цены у API бэкенда."""
+import asyncio
+import re
+
+import httpx
+import pytest
+
+import main
+from benchmarks.frontend import load_frontend
+
+FORM = {"from_city": "Москва", "to_city": "Казань", "weight": "3", "box_size": "M"}
+
+
+@pytest.fixture
+def frontend():
+    return load_frontend()
+
+
+def send(app, method: str, url: str, **kwargs) -> httpx.Response:
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://front") as client:
+            return await client.request(method, url, **kwargs)
+    return asyncio.run(scenario())
+
+
+def test_home_lists_backend_cities(frontend):
+    page = send(frontend.app, "GET", "/").text
+    for city in main.CITY_NAMES:
+        assert f'<option value="{city}">' in page
+
+
+def test_calc_shows_backend_offers(frontend):
+    page = send(frontend.app, "POST", "/calc", data=FORM).text
+    api = send(main.app, "GET", "/api/calculate", params={**FORM, "weight": 3}).json()
+    for offer in api["offers"]:
+        assert offer["company"] in page and offer["transit_time"] in page
+    assert 'class="error"' not in page
+
+
+@pytest.mark.parametrize("form, error", [
+    ({**FORM, "weight": "9"}, "превышает лимит"),
+    ({**FORM, "to_city": "Нигде"}, "Город не найден"),
+    ({**FORM, "to_city": "москва"}, "не могут совпадать"),
+])
+def test_calc_shows_backend_errors(frontend, form, error):
+    page = send(frontend.app, "POST", "/calc", data=form).text
+    assert error in "".join(re.findall(r'class="error">([^<]*)', page))
+
+
+def test_unavailable_backend(frontend):
+    frontend.backend = httpx.AsyncClient(base_url="http://127.0.0.1:9", timeout=1)
+    assert send(frontend.app, "GET", "/").status_code == 503
+    assert send(frontend.app, "POST", "/calc", data=FORM).status_code == 503
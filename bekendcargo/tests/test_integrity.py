@@ -0,0 +1,87 @@
+"""Периодическая проверка целостности: повтор, остановка, отчёт для health и метрик."""
+import os
+import sqlite3
+import time
+
+from integrity import IntegrityMonitor
+
+
+def make_db(path) -> str:
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(100)])
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def wait_for(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "не дождались"
+        time.sleep(0.01)
+
+
+def test_recheck_repeats_until_stopped(tmp_path):
+    monitor = IntegrityMonitor(make_db(tmp_path / "a.db"), interval_hours=0.1 / 3600, retry_seconds=0.01)
+    checks = []
+    check = monitor._check
+    monitor._check = lambda: checks.append(1) or check()
+
+    monitor.start()
+    wait_for(lambda: len(checks) >= 3)
+    thread = monitor._thread
+    monitor.stop()
+    assert not thread.is_alive()
+    done = len(checks)
+    time.sleep(0.3)
+    assert len(checks) == done
+    assert monitor.status()["state"] == "ok"
+
+
+def test_stop_does_not_wait_for_the_interval(tmp_path):
+    monitor = IntegrityMonitor(make_db(tmp_path / "a.db"), interval_hours=24)
+    monitor.start()
+    wait_for(lambda: monitor.status()["state"] == "ok")
+    thread = monitor._thread
+    started = time.monotonic()
+    monitor.stop()
+    assert time.monotonic() - started < 1
+    assert not thread.is_alive()
+
+
+def test_other_worker_sees_the_latest_report(tmp_path):
+    path = make_db(tmp_path / "a.db")
+    checker, other = IntegrityMonitor(path), IntegrityMonitor(path)
+    assert other.status() == {"state": "pending"}
+
+    report = checker.run()
+    assert report["state"] == "ok"
+    assert other.run() == report  # отчёт свежий — повторно не проверяет
+    assert other.status() == report
+    metrics = other.metrics()
+    assert metrics[("ok",)] == 1
+    assert metrics[("errors",)] == 0
+    assert metrics[("last_check_ts",)] == report["finished_ts"]
+
+
+def test_broken_database_is_reported(tmp_path):
+    path = tmp_path / "broken.db"
+    path.write_bytes(b"not a database" * 100)
+    monitor = IntegrityMonitor(str(path))
+
+    report = monitor.run()
+    assert report["state"] == "error"
+    assert monitor.metrics()[("ok",)] == 0
+    assert monitor.metrics()[("errors",)] == 1
+    assert os.path.exists(monitor.report_path)
+
+
+def test_interrupted_check_is_not_saved(tmp_path):
+    path = tmp_path / "broken.db"
+    path.write_bytes(b"not a database" * 100)
+    monitor = IntegrityMonitor(str(path))
+    monitor._stop.set()  # ошибка SQLite во время остановки — это прерывание
+
+    assert monitor.run() == {"state": "pending"}
+    assert not os.path.exists(monitor.report_path)
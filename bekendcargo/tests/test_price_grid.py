@@ -0,0 +1,60 @@
+"""Файл сетки цен: выравнивание данных и совпадение с TariffTable."""
+import struct
+
+import pytest
+
+import tariff_engine
+from price_grid import DATA_ALIGN, FORMAT_VERSION, HEADER, PriceGrid, _open, build, data_offset
+from pricing import PRICE_GRID
+
+
+@pytest.fixture
+def grid(tmp_path):
+    grid = PriceGrid(PRICE_GRID.boxes, PRICE_GRID.zones, str(tmp_path / "grid.bin"), recheck_interval=0)
+    grid.rebuild(tariff_engine.current())
+    return grid
+
+
+@pytest.mark.parametrize("box_count", range(1, 10))
+def test_data_offset_is_aligned(box_count):
+    offset = data_offset(box_count)
+    assert offset % DATA_ALIGN == 0
+    assert HEADER.size + 4 * box_count <= offset < HEADER.size + 4 * box_count + DATA_ALIGN
+
+
+def test_file_layout(grid):
+    with open(grid.path, "rb") as f:
+        data = f.read()
+    assert HEADER.unpack_from(data, 0)[1] == FORMAT_VERSION
+    start = data_offset(len(grid.boxes))
+    assert data[HEADER.size + 4 * len(grid.boxes):start] == bytes(start - HEADER.size - 4 * len(grid.boxes))
+
+    mapped = _open(grid.path, list(grid.boxes))
+    assert len(data) - len(mapped.values) * 8 == start
+    assert mapped.values[0] == struct.unpack_from("<d", data, start)[0]
+
+
+def test_lookup_matches_table(grid):
+    table = tariff_engine.current()
+    for box, (vol_weight, max_weight) in grid.boxes.items():
+        for weight in (w for w in (0.1, 1.0, 2.5, max_weight) if w <= max_weight):
+            for zone_diff in (1, grid.zones):
+                prices = grid.lookup(table, weight, box, zone_diff)
+                charge_weight = max(weight, vol_weight)
+                assert list(prices) == [table.base_price(rate, charge_weight, zone_diff, box)
+                                        for rate in table.records]
+
+
+def test_old_format_is_rebuilt(grid):
+    table = tariff_engine.current()
+    with open(grid.path, "r+b") as f:
+        header = list(HEADER.unpack_from(f.read(HEADER.size), 0))
+        header[1] = FORMAT_VERSION - 1
+        f.seek(0)
+        f.write(HEADER.pack(*header))
+    with pytest.raises(ValueError):
+        _open(grid.path, list(grid.boxes))
+
+    grid.close()
+    assert grid.ensure(table)
+    assert grid.lookup(table, 0.5, "XS", 1) is not None
@@ -0,0 +1,35 @@
+"""Планы запросов к доставкам: каждый запрос идёт по ожидаемому индексу (query_plans.py)."""
+import pytest
+
+import main
+import query_plans
+
+CASE_NAMES = [case.name for case in query_plans.expectations()]
+
+
+@pytest.fixture(scope="module")
+def sample_db(tmp_path_factory):
+    """Отдельная база с данными и ANALYZE: без статистики планировщик выбирает иначе."""
+    db = main.DeliveryDB(str(tmp_path_factory.mktemp("plans") / "plans.db"), check_integrity=False)
+    query_plans.fill_sample(db)
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope="module")
+def cases(sample_db):
+    return {case.name: case for case in query_plans.expectations(sample_db)}
+
+
+@pytest.mark.parametrize("name", CASE_NAMES)
+def test_query_uses_expected_index(sample_db, cases, name):
+    assert query_plans.mismatches(sample_db.pool.connection(), cases[name]) == ""
+
+
+def test_full_scan_of_deliveries_is_reported(sample_db):
+    conn = sample_db.pool.connection()
+    plan = query_plans.explain(conn, "SELECT id FROM delivery_rows WHERE price > ?", [1000])
+    assert query_plans.full_scans(plan) == ["SCAN delivery_rows"]
+
+    unindexed = query_plans.PlanExpectation("без индекса", "SELECT id FROM delivery_rows WHERE price > ?", [1000], [])
+    assert "SCAN delivery_rows" in query_plans.mismatches(conn, unindexed)
@@ -0,0 +1,118 @@
+"""Срок хранения доставок и перенос в помесячные архивы (retention.py)."""
+import asyncio
+import sqlite3
+
+import pytest
+
+from retention import RetentionJob, RetentionPolicy
+from write_behind import DeliveryRecord
+
+
+@pytest.fixture
+def old_rows(delivery_db):
+    """Три строки за январь 2025, две за февраль и две свежие."""
+    delivery_db.save_deliveries([
+        DeliveryRecord("СДЭК", "экспресс лайт", 1.0, "M", "Москва", "Казань", 100 + i, 3) for i in range(7)
+    ])
+    with delivery_db.pool.transaction() as conn:
+        conn.execute("UPDATE delivery_rows SET created_at = '2025-01-1' || id || ' 10:00:00' WHERE id <= 3")
+        conn.execute("UPDATE delivery_rows SET created_at = '2025-02-0' || id || ' 10:00:00' WHERE id IN (4, 5)")
+    return delivery_db
+
+
+def ids(db) -> list:
+    return [row[0] for row in db.pool.connection().execute("SELECT id FROM delivery_rows ORDER BY id")]
+
+
+def archived(path) -> list:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT id, company, town_to, price FROM deliveries ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def attached(db) -> list:
+    return [row[1] for row in db.pool.connection().execute("PRAGMA database_list")]
+
+
+def test_moves_old_rows_into_monthly_archives(old_rows, tmp_path):
+    job = RetentionJob(old_rows.pool, RetentionPolicy(days=30, archive_dir=str(tmp_path / "archive")))
+    assert job.run_once() == 5
+
+    assert ids(old_rows) == [6, 7]
+    assert old_rows.get_deliveries_count() == 2  # сводные таблицы обновлены триггерами
+    assert archived(job.archive_path("2025-01")) == [(i, "СДЭК", "г. Казань", 99 + i) for i in (1, 2, 3)]
+    assert [row[0] for row in archived(job.archive_path("2025-02"))] == [4, 5]
+    assert job.stats["archived"] == 5 and job.stats["deleted"] == 5 and job.stats["batches"] == 2
+    assert attached(old_rows) == ["main"]
+    assert old_rows.get_changes(0).deleted == [1, 2, 3, 4, 5]
+
+
+def test_batches_stay_within_batch_size(old_rows, tmp_path):
+    job = RetentionJob(old_rows.pool, RetentionPolicy(days=30, archive_dir=str(tmp_path), batch_size=2))
+    assert [job.step() for _ in range(5)] == [2, 1, 2, 0, 0]
+    assert ids(old_rows) == [6, 7]
+
+
+def test_without_archive_rows_are_only_deleted(old_rows, tmp_path):
+    job = RetentionJob(old_rows.pool, RetentionPolicy(days=30, archive_dir=None))
+    assert job.run_once() == 5
+    assert ids(old_rows) == [6, 7]
+    assert job.stats["archived"] == 0 and not list(tmp_path.glob("deliveries-*.db"))
+
+
+def test_rows_already_in_archive_are_not_duplicated(old_rows, tmp_path):
+    job = RetentionJob(old_rows.pool, RetentionPolicy(days=30, archive_dir=str(tmp_path)))
+    # Прошлый проход успел записать архив, но не удалить строки.
+    conn = sqlite3.connect(job.archive_path("2025-01"))
+    conn.execute("CREATE TABLE deliveries (id INTEGER PRIMARY KEY, company TEXT, delivery_type TEXT, weight REAL, "
+                 "size TEXT, town_from TEXT, town_to TEXT, price REAL, delivery_time INTEGER, "
+                 "is_completed INTEGER, created_at DATETIME)")
+    conn.execute("INSERT INTO deliveries (id, company, town_to, price) VALUES (1, 'СДЭК', 'г. Казань', 100)")
+    conn.commit()
+    conn.close()
+
+    assert job.run_once() == 5
+    assert [row[0] for row in archived(job.archive_path("2025-01"))] == [1, 2, 3]
+
+
+def test_failed_batch_rolls_back_and_detaches_archive(old_rows, tmp_path):
+    job = RetentionJob(old_rows.pool, RetentionPolicy(days=30, archive_dir=str(tmp_path)))
+    conn = sqlite3.connect(job.archive_path("2025-01"))
+    conn.execute("CREATE TABLE deliveries (id INTEGER PRIMARY KEY, note TEXT)")  # чужая схема
+    conn.close()
+
+    with pytest.raises(sqlite3.OperationalError):
+        job.step()
+    assert ids(old_rows) == list(range(1, 8))
+    assert attached(old_rows) == ["main"]
+    assert not old_rows.pool.connection().in_transaction
+
+
+def test_disabled_policy_keeps_rows(old_rows):
+    job = RetentionJob(old_rows.pool, RetentionPolicy(days=0, tombstone_days=0))
+    assert not job.policy.has_work
+    assert job.run_once() == 0
+    assert ids(old_rows) == list(range(1, 8))
+
+
+def test_background_job_runs_and_stops(old_rows, tmp_path):
+    job = RetentionJob(old_rows.pool, RetentionPolicy(days=30, archive_dir=str(tmp_path), interval=60, pause=0))
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+
+        async def run(fn, *args):
+            return await loop.run_in_executor(None, fn, *args)
+
+        job.start(run)
+        for _ in range(200):
+            if job.stats["runs"]:
+                break
+            await asyncio.sleep(0.01)
+        await job.stop()
+
+    asyncio.run(scenario())
+    assert job.stats["runs"] == 1 and job.stats["deleted"] == 5 and job.stats["failed"] == 0
+    assert ids(old_rows) == [6, 7]
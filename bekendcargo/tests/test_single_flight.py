@@ -0,0 +1,65 @@
+"""Объединение одинаковых одновременных расчётов /api/calculate и /api/tariffs."""
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import main
+
+REQUESTS = 50
+
+
+async def _burst(monkeypatch, route: str, compute: str, send):
+    """REQUESTS одинаковых запросов; расчёт первого ждёт, пока остальные не присоединятся к нему."""
+    flight = main.flights[route]
+    before = dict(flight.stats)
+    released = threading.Event()
+    original = getattr(main, compute)
+
+    def held(*args):
+        if threading.current_thread() is threading.main_thread():
+            raise RuntimeError("расчёт выполняется в потоке цикла событий")
+        released.wait(10)
+        return original(*args)
+
+    monkeypatch.setattr(main, compute, held)
+    main.quote_cache.clear()
+    main.writer.start()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        tasks = [asyncio.create_task(send(client)) for _ in range(REQUESTS)]
+        try:
+            async def followers_attached():
+                while flight.stats["coalesced"] - before["coalesced"] < REQUESTS - 1:
+                    await asyncio.sleep(0.005)
+            await asyncio.wait_for(followers_attached(), 5)
+        finally:
+            released.set()
+        responses = await asyncio.gather(*tasks)
+    await main.writer.stop()
+
+    assert [r.status_code for r in responses] == [200] * REQUESTS
+    assert len({r.content for r in responses}) == 1
+    assert flight.stats["leaders"] - before["leaders"] == 1
+    assert flight.stats["coalesced"] - before["coalesced"] == REQUESTS - 1
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.parametrize("route, compute, rows, send", [
+    ("calculate", "get_offers", 3, lambda client: client.get(
+        "/api/calculate", params={"from_city": "Москва", "to_city": "Казань", "weight": 2, "box_size": "M"})),
+    ("tariffs", "generate_tariffs_for_city", 1, lambda client: client.post(
+        "/api/tariffs", json={"city": "Казань", "weight": 3})),
+])
+def test_concurrent_duplicates_share_one_computation(monkeypatch, route, compute, rows, send):
+    rows_before = main.db.get_deliveries_count()
+    enqueued = main.writer.stats["enqueued"]
+    coalesced = main.WRITES_COALESCED.value((route,))
+
+    asyncio.run(_burst(monkeypatch, route, compute, send))
+
+    # Строки доставки пишет только первый запрос, остальные учтены в writes_coalesced_total.
+    assert main.writer.stats["enqueued"] - enqueued == rows
+    assert main.db.get_deliveries_count() - rows_before == rows
+    assert main.WRITES_COALESCED.value((route,)) - coalesced == (REQUESTS - 1) * rows
@@ -0,0 +1,145 @@
+"""Отложенная пакетная запись (write_behind.py)."""
+import asyncio
+import sqlite3
+
+from write_behind import DeliveryRecord, WriteBehindQueue
+
+
+def record(price: float = 500) -> DeliveryRecord:
+    return DeliveryRecord("СДЭК", "экспресс лайт", 1.0, "M", "Москва", "Казань", price, 3)
+
+
+class Sink:
+    """flush для очереди: запоминает пачки; цена < 0 нарушает ограничение, как CHECK в БД."""
+
+    def __init__(self, delay: float = 0.0):
+        self.batches = []
+        self.delay = delay
+
+    async def __call__(self, batch):
+        await asyncio.sleep(self.delay)
+        if any(r.price < 0 for r in batch):
+            raise sqlite3.IntegrityError("CHECK constraint failed: price")
+        self.batches.append(list(batch))
+
+
+def test_flushes_by_batch_size():
+    async def scenario():
+        sink = Sink()
+        queue = WriteBehindQueue(sink, max_batch=10, flush_interval=60)
+        queue.start()
+        for i in range(25):
+            await queue.enqueue(record(i))
+        # Две полные пачки уходят сразу, не дожидаясь таймера.
+        for _ in range(100):
+            if len(sink.batches) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert [len(b) for b in sink.batches] == [10, 10]
+        await queue.stop()
+        return sink, queue
+
+    sink, queue = asyncio.run(scenario())
+    assert [len(b) for b in sink.batches] == [10, 10, 5]
+    assert [r.price for b in sink.batches for r in b] == list(range(25))
+    assert queue.stats["written"] == 25 and queue.stats["batches"] == 3
+
+
+def test_flushes_by_interval():
+    async def scenario():
+        sink = Sink()
+        queue = WriteBehindQueue(sink, max_batch=100, flush_interval=0.02)
+        queue.start()
+        for _ in range(3):
+            await queue.enqueue(record())
+        await asyncio.sleep(0.2)
+        flushed = [len(b) for b in sink.batches]
+        await queue.stop()
+        return flushed
+
+    assert asyncio.run(scenario()) == [3]
+
+
+def test_full_queue_applies_backpressure():
+    async def scenario():
+        sink = Sink(delay=0.05)
+        queue = WriteBehindQueue(sink, max_batch=2, flush_interval=0.01, max_queue=2)
+        queue.start()
+        for _ in range(10):
+            await queue.enqueue(record())
+        await queue.stop()
+        return sink, queue
+
+    sink, queue = asyncio.run(scenario())
+    assert queue.stats["waited"] > 0
+    assert queue.stats["written"] == 10 and sum(len(b) for b in sink.batches) == 10
+
+
+def test_stop_drains_pending_records():
+    async def scenario():
+        sink = Sink()
+        queue = WriteBehindQueue(sink, max_batch=4, flush_interval=60)
+        queue.start()
+        for i in range(10):
+            await queue.enqueue(record(i))
+        await queue.stop()
+        return sink, queue
+
+    sink, queue = asyncio.run(scenario())
+    assert not queue.running
+    assert sorted(r.price for b in sink.batches for r in b) == list(range(10))
+    assert all(len(b) <= 4 for b in sink.batches)
+
+
+def test_integrity_error_retries_batch_row_by_row():
+    async def scenario():
+        sink = Sink()
+        queue = WriteBehindQueue(sink, max_batch=10, flush_interval=60)
+        queue.start()
+        for price in (100, 200, -1, 300):
+            await queue.enqueue(record(price))
+        await queue.stop()
+        return sink, queue
+
+    sink, queue = asyncio.run(scenario())
+    assert [[r.price for r in b] for b in sink.batches] == [[100], [200], [300]]
+    assert queue.stats["written"] == 3 and queue.stats["failed"] == 1
+
+
+def test_other_errors_drop_the_batch():
+    async def failing(batch):
+        raise sqlite3.OperationalError("database is locked")
+
+    async def scenario():
+        queue = WriteBehindQueue(failing, max_batch=10, flush_interval=60)
+        queue.start()
+        for _ in range(4):
+            await queue.enqueue(record())
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert queue.stats["failed"] == 4 and queue.stats["written"] == 0
+
+
+def test_writes_batches_into_database(delivery_db):
+    from async_db import AsyncDeliveryDB
+
+    adb = AsyncDeliveryDB(delivery_db, max_workers=1)
+
+    async def scenario():
+        queue = WriteBehindQueue(adb.save_deliveries, max_batch=50, flush_interval=60)
+        queue.start()
+        for price in (100, 200, 300):
+            await queue.enqueue(record(price))
+        # weight > 0 — ограничение схемы: пачка откатывается и пишется по одной.
+        await queue.enqueue(record()._replace(weight=-1))
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+    adb.executor.shutdown()
+    assert queue.stats["written"] == 3 and queue.stats["failed"] == 1
+    rows = delivery_db.get_all_deliveries()
+    assert sorted(r["price"] for r in rows) == [100, 200, 300]
+    assert {r["town_to"] for r in rows} == {"г. Казань"}
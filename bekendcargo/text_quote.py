@@ -0,0 +1,133 @@
+"""Расчёт лучшего тарифа по текстовой строке «Москва Санкт-Петербург 2.5 M».
+
+Модуль не зависит от приложения и БД, поэтому годится и для обработчиков
+API, и для пакетных заданий, и для командной строки:
+
+    python text_quote.py "Москва Санкт-Петербург 2.5 M" "Казань Тула 1 S"
+    python text_quote.py < shipments.txt
+
+Каждый аргумент — отдельное отправление в кавычках.
+"""
+import sys
+from typing import Iterable, Iterator, NamedTuple
+
+from models import OfferRow
+from pricing import BOX_DIMENSIONS, CITY_INDEX, get_offers, quote_rng, weight_bucket
+
+FORMAT_HINT = "Формат: 'Москва Санкт-Петербург 2.5 M'"
+
+
+class QuoteError(ValueError):
+    pass
+
+
+class TextQuoteRequest(NamedTuple):
+    from_city: str
+    to_city: str
+    from_id: int
+    to_id: int
+    weight: float
+    box_size: str
+
+
+class TextQuote(NamedTuple):
+    request: TextQuoteRequest
+    offer: OfferRow
+    delivery_type: str
+    days_min: int
+    days_max: int
+
+
+def parse_quote_request(text: str) -> TextQuoteRequest:
+    parts = text.strip().split()
+    if len(parts) != 4:
+        raise QuoteError(FORMAT_HINT)
+
+    return make_request(*parts)
+
+
+def make_request(from_city: str, to_city: str, weight_str: str, box_size: str) -> TextQuoteRequest:
+    """Проверка полей отправления; для CSV и NDJSON, где город может быть из нескольких слов."""
+    try:
+        weight = float(weight_str)
+    except (TypeError, ValueError):
+        raise QuoteError(f"Вес {weight_str} некорректен")
+
+    from_id = CITY_INDEX.resolve(from_city)
+    to_id = CITY_INDEX.resolve(to_city)
+    if from_id is None or to_id is None:
+        raise QuoteError(f"Города не найдены: {from_city} → {to_city}")
+
+    if weight <= 0 or weight > 500:
+        raise QuoteError(f"Вес {weight}кг некорректен")
+
+    if box_size not in BOX_DIMENSIONS:
+        raise QuoteError(f"Размер {box_size} неверный")
+
+    if weight > BOX_DIMENSIONS[box_size]["max_weight"]:
+        raise QuoteError(f"Вес {weight}кг > лимит {box_size} ({BOX_DIMENSIONS[box_size]['max_weight']}кг)")
+
+    return TextQuoteRequest(from_city, to_city, from_id, to_id, weight, box_size)
+
+
+def delivery_type_for(tariff_name: str) -> str:
+    name = tariff_name.lower()
+    if "ems" in name:
+        return "EMS отправление"
+    return "экспресс лайт" if "экспресс" in name else "посылочка (Эконом)"
+
+
+def best_quote(request: TextQuoteRequest) -> TextQuote:
+    zone_diff = CITY_INDEX.zone_diff(request.from_id, request.to_id)
+    rng = quote_rng("calculate", request.from_id, request.to_id, weight_bucket(request.weight), request.box_size)
+    offer = get_offers(request.weight, request.box_size, zone_diff, rng)[0]
+
+    days_min, days_max = offer.transit_time[:-len(" дн.")].split("-")
+    return TextQuote(request, offer, delivery_type_for(offer.tariff_name), int(days_min), int(days_max))
+
+
+def quote_text(text: str) -> TextQuote:
+    return best_quote(parse_quote_request(text))
+
+
+def format_quote(quote: TextQuote) -> str:
+    r, offer = quote.request, quote.offer
+    return "\n".join([
+        "ЛУЧШИЙ ТАРИФ:",
+        f"{CITY_INDEX.title(r.from_id)} → {CITY_INDEX.title(r.to_id)}",
+        f"{r.box_size} | {r.weight}кг",
+        f"{offer.company} | {quote.delivery_type}",
+        f"{offer.price:,}₽",
+        f"{quote.days_min}-{quote.days_max} дней",
+    ])
+
+
+def quote_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Построчный расчёт для пакетной обработки: TSV с результатом или ошибкой."""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            q = quote_text(line)
+        except QuoteError as e:
+            yield f"{line.strip()}\tERROR\t{e}"
+            continue
+        yield "\t".join(map(str, (
+            line.strip(), q.offer.company, q.offer.tariff_name, q.delivery_type,
+            q.offer.price, q.days_min, q.days_max,
+        )))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        failed = False
+        for arg in sys.argv[1:]:
+            try:
+                print(format_quote(quote_text(arg)))
+            except QuoteError as e:
+                print(f"{arg}: {e}", file=sys.stderr)
+                failed = True
+        sys.exit(1 if failed else 0)
+    else:
+        for out in quote_lines(sys.stdin):
+            print(out)
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryRecord(NamedTuple):
+    company: str
+    delivery_type: str
+    weight: float
+    size: str
+    town_from: str
+    town_to: str
+    price: float
+    days: int
+
+
+class WriteBehindQueue:
+    """Отложенная пакетная запись доставок.
+
+    Обработчики кладут записи в очередь и сразу отвечают клиенту, фоновая
+    задача сбрасывает их в БД пачками: по размеру пачки или по таймеру.
+    Заполненная очередь заставляет enqueue ждать (backpressure), при
+    остановке всё накопленное дописывается.
+    """
+
+    def __init__(self, flush: Callable[[List[DeliveryRecord]], Awaitable[object]],
+                 max_batch: int = 200, flush_interval: float = 0.05, max_queue: int = 10000):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "failed": 0, "waited": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("Фоновая запись запущена: пачка %s, интервал %sс", self.max_batch, self.flush_interval)
+
+    async def enqueue(self, record: DeliveryRecord):
+        if not self.running:
+            self.start()
+        if self._queue.full():
+            self.stats["waited"] += 1
+        await self._queue.put(record)
+        self.stats["enqueued"] += 1
+
+    async def stop(self):
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info("Фоновая запись остановлена, записано %s", self.stats['written'])
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            record = await self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            await self._write(batch)
+
+        # Дописываем то, что успели положить до сигнала остановки.
+        rest = []
+        while not self._queue.empty():
+            record = self._queue.get_nowait()
+            if record is not None:
+                rest.append(record)
+        for i in range(0, len(rest), self.max_batch):
+            await self._write(rest[i:i + self.max_batch])
+
+    async def _write(self, batch: List[DeliveryRecord]):
+        try:
+            await self.flush(batch)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+        except sqlite3.IntegrityError as e:
+            # Одна неверная запись откатывает всю пачку: пишем по одной и теряем только её.
+            logger.warning("Пачка (%s шт.) нарушает ограничения (%s), записываем по одной", len(batch), e)
+            for record in batch:
+                try:
+                    await self.flush([record])
+                    self.stats["written"] += 1
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    logger.error("Запись отброшена %s: %s", record, e)
+            self.stats["batches"] += 1
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logger.error("Ошибка пакетной записи (%s шт.): %s", len(batch), e)
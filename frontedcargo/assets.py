@@ -0,0 +1,127 @@
+"""Статика и готовые страницы фронтенда из памяти.
+
+Файлы из static/ читаются один раз при запуске и сразу сжимаются в gzip и,
+если установлен пакет brotli, в br. На запрос отдаётся вариант по
+Accept-Encoding без повторного сжатия. Ссылки на статику содержат версию
+(/static/style.css?v=<хеш>), поэтому такой ответ кэшируется браузером на год
+как immutable; новая версия файла — новый URL.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, NamedTuple, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # без brotli — только gzip
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Предпочтение при равных q: br сжимает текст лучше gzip.
+ENCODINGS = ("br", "gzip")
+
+
+class Asset(NamedTuple):
+    content_type: str
+    etag: str
+    version: str
+    # Кодировка (identity/gzip/br) -> тело; сжатые варианты есть, только если они меньше.
+    bodies: Dict[str, bytes]
+
+
+def make_asset(body: bytes, content_type: str) -> Asset:
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    bodies = {"identity": body}
+    compressed = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed["br"] = brotli.compress(body, quality=11)
+    for encoding, data in compressed.items():
+        if len(data) < len(body):
+            bodies[encoding] = data
+    return Asset(content_type, f'"{digest}"', digest[:12], bodies)
+
+
+def accepted_encoding(accept_encoding: Optional[str], asset: Asset) -> str:
+    if not accept_encoding or len(asset.bodies) == 1:
+        return "identity"
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue  # q=0 — кодировка запрещена
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    for encoding in ENCODINGS:
+        if encoding in asset.bodies and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def asset_response(asset: Asset, headers, method: str = "GET", cache_control: str = REVALIDATE) -> Response:
+    """Ответ с готовым телом: 304 по If-None-Match, иначе вариант по Accept-Encoding."""
+    response_headers = {"etag": asset.etag, "cache-control": cache_control, "vary": "Accept-Encoding"}
+    if etag_matches(headers.get("if-none-match"), asset.etag):
+        return Response(status_code=304, headers=response_headers)
+
+    encoding = accepted_encoding(headers.get("accept-encoding"), asset)
+    body = asset.bodies[encoding]
+    if encoding != "identity":
+        response_headers["content-encoding"] = encoding
+    if method == "HEAD":
+        response_headers["content-length"] = str(len(body))
+        body = b""
+    return Response(body, headers=response_headers, media_type=asset.content_type)
+
+
+class StaticAssets:
+    """ASGI-приложение для /static: файлы каталога directory из памяти."""
+
+    def __init__(self, directory: str):
+        self.assets: Dict[str, Asset] = {}
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path) or name.startswith("."):
+                continue
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if content_type.startswith("text/") or content_type == "application/javascript":
+                content_type += "; charset=utf-8"
+            with open(path, "rb") as f:
+                self.assets[name] = make_asset(f.read(), content_type)
+
+    def url(self, name: str) -> str:
+        return f"/static/{name}?v={self.assets[name].version}"
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope)
+        asset = self.assets.get(scope["path"].rpartition("/")[2])
+        if scope["method"] not in ("GET", "HEAD"):
+            response = Response(status_code=405, headers={"allow": "GET, HEAD"})
+        elif asset is None:
+            response = Response("Not Found", status_code=404, media_type="text/plain")
+        else:
+            # Неверсионированную ссылку браузер перепроверяет по ETag.
+            immutable = request.query_params.get("v") == asset.version
+            response = asset_response(asset, request.headers, scope["method"], IMMUTABLE if immutable else REVALIDATE)
+        await response(scope, receive, send)
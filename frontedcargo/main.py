@@ -1,106 +1,136 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Form, Request
+from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-from typing import Literal
-import random
+from markupsafe import Markup, escape
+from typing import Literal, Optional
+import httpx
+import os
 
-app = FastAPI(title="Cаrgo — Хакатон ВШЭ 2025")
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+from assets import Asset, StaticAssets, asset_response, make_asset
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Города и цены — у бэкенда (bekendcargo): расчёт идёт по его текущей таблице
+# тарифов, в том числе после перечитывания tariffs.json, и совпадает с API.
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://127.0.0.1:8000")
+backend = httpx.AsyncClient(base_url=BACKEND_URL, timeout=float(os.environ.get("BACKEND_TIMEOUT_S", 5)))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await backend.aclose()
+
+app = FastAPI(title="Cаrgo — Хакатон ВШЭ 2025", lifespan=lifespan)
+static = StaticAssets(os.path.join(BASE_DIR, "static"))
+app.mount("/static", static, name="static")
+templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
 BoxSize = Literal["XS", "S", "M", "L", "XL", "XXL", "XXXL", "XXXXL"]
 
+# Подписи для формы; предельный вес коробки проверяет бэкенд.
 BOX_INFO = {
-    "XS":    {"name": "Документы",           "hint": "до 1 кг",    "max": 1},
-    "S":     {"name": "Маленькая посылка",   "hint": "1–2 кг",       "max": 2},
-    "M":     {"name": "Средняя коробка",     "hint": "3–5 кг",       "max": 5},
-    "L":     {"name": "Стандартная коробка", "hint": "6–10 кг",      "max": 10},
-    "XL":    {"name": "Большая коробка",     "hint": "11–15 кг",     "max": 15},
-    "XXL":   {"name": "Очень большая",       "hint": "16–25 кг",     "max": 25},
-    "XXXL":  {"name": "Грузовое место",      "hint": "26–40 кг",     "max": 40},
-    "XXXXL": {"name": "Паллета",             "hint": "41–500 кг",    "max": 500},
+    "XS":    {"name": "Документы",           "hint": "до 1 кг"},
+    "S":     {"name": "Маленькая посылка",   "hint": "1–2 кг"},
+    "M":     {"name": "Средняя коробка",     "hint": "3–5 кг"},
+    "L":     {"name": "Стандартная коробка", "hint": "6–10 кг"},
+    "XL":    {"name": "Большая коробка",     "hint": "11–15 кг"},
+    "XXL":   {"name": "Очень большая",       "hint": "16–25 кг"},
+    "XXXL":  {"name": "Грузовое место",      "hint": "26–40 кг"},
+    "XXXXL": {"name": "Паллета",             "hint": "41–500 кг"},
 }
 
-CITIES = {
-    "москва":1,"санкт-петербург":2,"калининград":2,"нижний новгород":3,"казань":3,"самара":3,"волгоград":3,
-    "ростов-на-дону":4,"краснодар":4,"воронеж":4,"сочи":4,"ставрополь":4,"екатеринбург":5,"челябинск":5,
-    "тюмень":5,"пермь":5,"уфа":5,"новосибирск":6,"омск":6,"томск":6,"барнаул":6,"кемерово":6,
-    "красноярск":7,"иркутск":7,"хабаровск":8,"владивосток":8,"якутск":9,"благовещенск":9,
-    "петропавловск-камчатский":10,"магадан":10,"южно-сахалинск":10,"саратов":3,"тольятти":3,"ижевск":5,
-    "ульяновск":3,"оренбург":5,"новокузнецк":6,"рязань":2,"пенза":3,"липецк":2,"тула":2,"астрахань":4,
-    "киров":3,"чебоксары":3,"калуга":2,"курск":2,"тверь":2,"севастополь":4,"брянск":2,"иваново":2,
-    "магнитогорск":5,"белгород":2
-}
+BACKEND_UNAVAILABLE = "Сервис расчёта недоступен, попробуйте позже"
+
+# Неизменные части страницы собираются один раз: список городов (с бэкенда,
+# при первом показе) и варианты коробок не зависят от запроса.
+BOX_OPTIONS = "".join(
+    f'<option value="{size}" data-hint="{escape(box["hint"])}">{size} — {escape(box["name"])} ({escape(box["hint"])})</option>'
+    for size, box in BOX_INFO.items()
+)
+PAGE = templates.get_template("index.html")
+city_options: Optional[str] = None
+home_page: Optional[Asset] = None
+
+
+async def load_city_options() -> str:
+    global city_options
+    if city_options is None:
+        response = await backend.get("/api/cities")
+        response.raise_for_status()
+        city_options = "".join(
+            f'<option value="{escape(city)}">{escape(city)}</option>' for city in response.json()["cities"])
+    return city_options
+
+
+def with_selected(options: str, value: Optional[str]) -> Markup:
+    if value:
+        option = f'<option value="{escape(value)}"'
+        options = options.replace(option, option + " selected", 1)
+    return Markup(options)
+
+
+def render_page(cities: str, from_city: Optional[str] = None, to_city: Optional[str] = None,
+                weight: Optional[int] = None, box_size: Optional[str] = None, error: Optional[str] = None,
+                offers=None) -> str:
+    return PAGE.render(
+        from_options=with_selected(cities, from_city),
+        to_options=with_selected(cities, to_city),
+        box_options=with_selected(BOX_OPTIONS, box_size),
+        box_hint=BOX_INFO[box_size or "S"]["hint"],
+        weight=weight,
+        error=error,
+        offers=offers,
+        style_url=static.url("style.css"),
+        script_url=static.url("script.js"),
+    )
 
-def calculate_volume_weight(l, w, h): return round((l * w * h) / 5000, 2)
-
-def get_zone_diff(c1, c2):
-    z1 = CITIES.get(c1.lower().replace("ё", "е"))
-    z2 = CITIES.get(c2.lower().replace("ё", "е"))
-    if not z1 or not z2:
-        raise ValueError("Город не найден")
-    return abs(z1 - z2) + 1
-
-def calculate_price(company, tariff, weight, vol_weight, zone_diff, box):
-    charge = max(weight, vol_weight)
-    extra = {"XXL": 1800, "XXXL": 4000, "XXXXL": 9000}.get(box, 0)
-    if company == "СДЭК":
-        base = 550 if "эконом" in tariff.lower() else 950
-        per_kg = (130 + zone_diff * 38) if "эконом" in tariff.lower() else (380 + zone_diff * 55)
-    elif company == "Boxberry":
-        base, per_kg = 680, 160 + zone_diff * 42
-    elif company == "Почта России":
-        base, per_kg = (1400, 500 + zone_diff * 70) if tariff == "EMS" else (450, 110 + zone_diff * 25)
-    else:
-        base, per_kg = 700, 200 + zone_diff * 40
-    price = base + (charge - 1) * per_kg + extra
-    price = int(price * random.uniform(0.92, 1.08))
-    return max(290, round(price / 10) * 10)
 
 @app.get("/")
 async def home(request: Request):
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "cities": sorted(CITIES.keys()),
-        "boxes": BOX_INFO
-    })
+    # Главная страница не зависит от запроса: готовое тело, сжатые варианты и ETag.
+    global home_page
+    if home_page is None:
+        try:
+            cities = await load_city_options()
+        except httpx.HTTPError:
+            return HTMLResponse(render_page("", error=BACKEND_UNAVAILABLE), status_code=503)
+        home_page = make_asset(render_page(cities).encode(), "text/html; charset=utf-8")
+    return asset_response(home_page, request.headers, request.method)
 
 @app.post("/calc")
 async def calc(request: Request, from_city: str = Form(...), to_city: str = Form(...), weight: int = Form(...), box_size: BoxSize = Form(...)):
+    try:
+        cities = await load_city_options()
+    except httpx.HTTPError:
+        return HTMLResponse(render_page("", from_city, to_city, weight, box_size, BACKEND_UNAVAILABLE), status_code=503)
+
     error = None
     offers = None
 
     if from_city.lower() == to_city.lower():
         error = "Города отправления и назначения не могут совпадать!"
-    elif weight > BOX_INFO[box_size]["max"]:
-        error = f"Вес {weight} кг превышает лимит коробки {box_size}!"
     else:
         try:
-            zone_diff = get_zone_diff(from_city, to_city)
-            vol_weight = calculate_volume_weight(80, 60, 50) if box_size in ["XXL", "XXXL", "XXXXL"] else calculate_volume_weight(60, 40, 40)
-            offers = [
-                ("СДЭК", "Экспресс лайт", calculate_price("СДЭК", "экспресс", weight, vol_weight, zone_diff, box_size), f"{max(1, zone_diff//2)}–{zone_diff+1} дн."),
-                ("СДЭК", "Посылочка Эконом", calculate_price("СДЭК", "эконом", weight, vol_weight, zone_diff, box_size), f"{zone_diff+1}–{zone_diff+5} дн."),
-                ("Boxberry", "Стандарт", calculate_price("Boxberry", "", weight, vol_weight, zone_diff, box_size), f"{zone_diff}–{zone_diff+4} дн."),
-                ("Почта России", "Обычная посылка", calculate_price("Почта России", "обычная", weight, vol_weight, zone_diff, box_size), f"{zone_diff+3}–{zone_diff+9} дн."),
-                ("Почта России", "EMS", calculate_price("Почта России", "EMS", weight, vol_weight, zone_diff, box_size), f"{max(1, zone_diff//3)}–{zone_diff//2+2} дн."),
-            ]
-            offers.sort(key=lambda x: x[2])
-        except Exception as e:
-            error = str(e)
-
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "cities": sorted(CITIES.keys()),
-        "boxes": BOX_INFO,
-        "from_city": from_city,
-        "to_city": to_city,
-        "weight": weight,
-        "box_size": box_size,
-        "error": error,
-        "offers": offers
-    })
+            response = await backend.get("/api/calculate", params={
+                "from_city": from_city, "to_city": to_city, "weight": weight, "box_size": box_size})
+        except httpx.HTTPError:
+            response = None
+        if response is None or response.status_code >= 500:
+            error = BACKEND_UNAVAILABLE
+        elif response.status_code == 422:
+            error = "Вес должен быть от 1 до 500 кг!"
+        elif response.status_code != 200:
+            error = response.json()["detail"]
+        else:
+            offers = [(o["company"], o["tariff_name"], o["price"], o["transit_time"])
+                      for o in response.json()["offers"]]
+
+    return HTMLResponse(render_page(cities, from_city, to_city, weight, box_size, error, offers))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Фронтенд без состояния: в бою WEB_CONCURRENCY=N запускает N процессов без автоперезагрузки.
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=workers == 1, workers=workers)
\ No newline at end of file